@@ -0,0 +1,144 @@
+# answerCache.py
+
+# Semantic cache of finished answers. Paraphrases of the same question ("how do I delete a blueprint" /
+# "delete blueprint API") embed to nearly the same vector, so if a new query is close enough (cosine >= threshold)
+# to one we've already answered, the stored answer gets replayed as a stream instead of running qwen2.5:14b again.
+# Every entry is stamped with the index version it was answered against and is ignored once the index changes.
+
+import re
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# --- Constants ---
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_THRESHOLD = 0.95 # Keep it high, "create a blueprint" and "delete a blueprint" are close too
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+NEAR_MISS_MARGIN = 0.05 # Lookups whose best match is this close under the threshold get counted, to help tune it
+SIMILARITY_HISTORY = 1000 # How many best-match similarities to keep for stats()
+
+
+def replay_stream(answer: str):
+    # Yield word by word (whitespace kept) so the UI renders it the same way as a live answer
+    for piece in re.findall(r"\S+\s*|\s+", answer):
+        yield piece
+
+
+class SemanticAnswerCache:
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl_seconds: float | None = ANSWER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._vectors = None # (max_entries, dim) unit vectors, row i belongs to self._entries[i]
+        self._entries = [None] * max_entries # dicts: query, answer, sources, variant, index_version, created, last_used
+        self.lookups = 0
+        self.hits = 0
+        self.near_misses = 0
+        self.stale_drops = 0
+        self.evictions = 0
+        self.similarities = deque(maxlen=SIMILARITY_HISTORY)
+
+    def __len__(self):
+        return sum(entry is not None for entry in self._entries)
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _drop(self, slot: int):
+        self._entries[slot] = None
+        self._vectors[slot] = 0.0
+
+    def lookup(self, query_vector, index_version, variant=None) -> dict | None:
+        """Best cached answer for the same variant (mode, k, ...) with cosine >= threshold, or None."""
+        with self._lock:
+            self.lookups += 1
+            if self._vectors is None:
+                return None
+            now = time.time()
+            # Drop anything answered against an older index or past its TTL before comparing
+            for slot, entry in enumerate(self._entries):
+                if entry is None:
+                    continue
+                if entry["index_version"] != index_version or (self.ttl_seconds is not None and now - entry["created"] > self.ttl_seconds):
+                    self._drop(slot)
+                    self.stale_drops += 1
+
+            similarities = self._vectors @ self._unit(query_vector)
+            candidates = [slot for slot, entry in enumerate(self._entries) if entry is not None and entry["variant"] == variant]
+            if not candidates:
+                return None
+            best = max(candidates, key=lambda slot: similarities[slot])
+            similarity = float(similarities[best])
+            self.similarities.append(similarity)
+            if similarity < self.threshold:
+                if similarity >= self.threshold - NEAR_MISS_MARGIN:
+                    self.near_misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[best]
+            entry["last_used"] = now
+            return dict(entry, similarity=similarity)
+
+    def add(self, query_vector, query_text: str, answer: str, sources: list, index_version, variant=None):
+        vector = self._unit(query_vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._entries = [None] * self.max_entries
+            free = [slot for slot, entry in enumerate(self._entries) if entry is None]
+            if free:
+                slot = free[0]
+            else:
+                # Least recently used answer makes room
+                slot = min(range(self.max_entries), key=lambda i: self._entries[i]["last_used"])
+                self.evictions += 1
+            now = time.time()
+            self._vectors[slot] = vector
+            self._entries[slot] = {"query": query_text, "answer": answer, "sources": list(sources or []), "variant": variant,
+                                   "index_version": index_version, "created": now, "last_used": now}
+
+    def record_stream(self, stream, query_vector, query_text: str, sources: list, index_version, variant=None):
+        # Passes the LLM stream through and stores the answer once it finished without errors
+        pieces = []
+        for piece in stream:
+            pieces.append(piece)
+            yield piece
+        answer = "".join(pieces)
+        if answer.strip():
+            self.add(query_vector, query_text, answer, sources, index_version, variant)
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._entries = [None] * self.max_entries
+
+    def stats(self) -> dict:
+        with self._lock:
+            similarities = np.asarray(self.similarities, dtype=np.float32)
+            return {
+                "entries": sum(entry is not None for entry in self._entries),
+                "capacity": self.max_entries,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "near_misses": self.near_misses,
+                "stale_drops": self.stale_drops,
+                "evictions": self.evictions,
+                "similarity_p50": float(np.percentile(similarities, 50)) if len(similarities) else None,
+                "similarity_p90": float(np.percentile(similarities, 90)) if len(similarities) else None,
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"ANSWER_CACHE: {stats['hits']} hits / {stats['lookups']} lookups (hit rate {stats['hit_rate']:.1%}) at threshold {stats['threshold']}, "
+              f"{stats['near_misses']} near misses (within {NEAR_MISS_MARGIN}), {stats['entries']}/{stats['capacity']} entries, "
+              f"{stats['evictions']} evictions, {stats['stale_drops']} dropped as stale.")
+        if stats["similarity_p50"] is not None:
+            print(f"ANSWER_CACHE: Best-match cosine p50 {stats['similarity_p50']:.3f}, p90 {stats['similarity_p90']:.3f}")
@@ -0,0 +1,133 @@
+# backgroundStream.py
+
+# Reads an LLM answer stream on a worker thread and hands the UI the answer so far in time-based batches.
+# mainUI.py used to call message_placeholder.markdown() with the whole answer after every token. Each of those
+# re-sends and re-renders everything so far, so a 2000 token answer meant ~2000 renders and O(n^2) characters pushed
+# to the browser, and the token loop (Ollama -> here) waited on every one of them.
+# Now:
+#   - a worker thread pulls tokens from the stream into a queue as fast as Ollama sends them
+#   - the UI re-renders at most once every RENDER_INTERVAL_SECONDS with whatever arrived in between, and once at the end
+#   - stop() (page closed, rerun, error) makes the worker close the stream, so Ollama stops generating for nobody
+# Compare per-token and throttled rendering on a fake stream: python backgroundStream.py --tokens 2000
+
+import argparse
+import queue
+import threading
+import time
+
+# --- Constants ---
+RENDER_INTERVAL_SECONDS = 0.1 # At most ~10 re-renders per second, however fast the tokens come
+STREAM_POLL_SECONDS = 0.05 # How often to wake up while waiting for the first/next token
+_DONE = object()
+
+
+class BackgroundStream:
+
+    def __init__(self, stream, executor=None):
+        self.queue = queue.Queue()
+        self.error = None
+        self.started_at = time.time()
+        self.first_chunk_at = None
+        self.finished_at = None
+        self.chunks = 0
+        self.renders = 0
+        self._stop = threading.Event()
+        if executor is not None:
+            executor.submit(self._consume, stream)
+        else:
+            threading.Thread(target=self._consume, args=(stream,), name="answer-stream", daemon=True).start()
+
+    def _consume(self, stream):
+        try:
+            for chunk in stream:
+                if self.first_chunk_at is None:
+                    self.first_chunk_at = time.time()
+                self.chunks += 1
+                self.queue.put(chunk)
+                if self._stop.is_set():
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            if self._stop.is_set() and hasattr(stream, "close"):
+                stream.close() # Ends the Ollama request too
+            self.finished_at = time.time()
+            self.queue.put(_DONE)
+
+    def stop(self):
+        self._stop.set()
+
+    def batches(self, interval: float = RENDER_INTERVAL_SECONDS):
+        """Yields (answer so far, done). Between renders new tokens are only collected; the last yield has done=True
+        and the whole answer. An error in the stream is raised here, after the tokens that did arrive."""
+        text = ""
+        pending = False # Tokens that arrived since the last yield
+        last_yield = 0.0
+        while True:
+            wait = max(0.0, last_yield + interval - time.monotonic()) if pending else STREAM_POLL_SECONDS
+            try:
+                item = self.queue.get(timeout=wait) if wait > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                item = None
+            new_chunks = []
+            while item is not None and item is not _DONE:
+                new_chunks.append(item)
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            if new_chunks:
+                text += "".join(new_chunks)
+                pending = True
+            if item is _DONE:
+                self.renders += 1
+                yield text, True
+                if self.error is not None:
+                    raise self.error
+                return
+            if pending and time.monotonic() - last_yield >= interval:
+                last_yield = time.monotonic()
+                pending = False
+                self.renders += 1
+                yield text, False
+
+    @property
+    def time_to_first_chunk(self) -> float | None:
+        return None if self.first_chunk_at is None else self.first_chunk_at - self.started_at
+
+
+def _fake_stream(tokens: int, tokens_per_second: float):
+    for i in range(tokens):
+        time.sleep(1 / tokens_per_second)
+        yield f"token{i} "
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders and characters sent to the browser: per-token vs throttled rendering.")
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200.0, help="Tokens per second the fake LLM produces.")
+    parser.add_argument("--interval", type=float, default=RENDER_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    # Per token: what mainUI did before, the whole answer re-rendered after every token
+    start_time = time.time()
+    text = ""
+    sent_per_token = 0
+    for chunk in _fake_stream(args.tokens, args.rate):
+        text += chunk
+        sent_per_token += len(text)
+    per_token_seconds = time.time() - start_time
+    print(f"Per token: {args.tokens} renders, {sent_per_token:,} characters re-rendered, {per_token_seconds:.2f} seconds.")
+
+    start_time = time.time()
+    stream = BackgroundStream(_fake_stream(args.tokens, args.rate))
+    sent_throttled = 0
+    for text, done in stream.batches(args.interval):
+        sent_throttled += len(text)
+    throttled_seconds = time.time() - start_time
+    print(f"Throttled ({args.interval}s): {stream.renders} renders, {sent_throttled:,} characters re-rendered, {throttled_seconds:.2f} seconds.")
+    print(f"✅ {sent_per_token / max(sent_throttled, 1):.0f}x less rendering, first token after {stream.time_to_first_chunk:.4f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# chunkStore.py
+
+# In-memory copy of every chunk's text and metadata, laid out in document order, so get_contextual_chunks can expand
+# the neighbor window of a hit without building id strings and going back to the db with a second get() call.
+# Rows are sorted by (source, index) and every source owns a contiguous run of "slots" (one per chunk index), so the
+# neighbors of a hit are just slot +/- window, and the rows come out already in document order.
+
+import time
+import numpy as np
+from langchain.schema.document import Document
+from vectorEngine import split_chunk_id
+
+
+class ChunkStore:
+
+    def __init__(self, ids: list[str], documents: list[str], metadatas: list[dict], index_version: int | None = None):
+        self.index_version = index_version
+
+        order = sorted(range(len(ids)), key=lambda i: split_chunk_id(ids[i]))
+        parsed = [split_chunk_id(ids[i]) for i in order]
+        self.ids = [ids[i] for i in order]
+        self.metadatas = [metadatas[i] or {} for i in order]
+        self.row_by_id = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+
+        # All texts in one utf-8 blob plus offsets, instead of thousands of separate python strings
+        encoded = [(documents[i] or "").encode("utf-8") for i in order]
+        self._text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        self._text_offsets[1:] = np.cumsum([len(blob) for blob in encoded])
+        self._text_bytes = b"".join(encoded)
+
+        # sources[s] owns slots slot_start[s] .. slot_start[s + 1] - 1, one per chunk index 0..max index.
+        # A slot is -1 when that chunk index is missing from the db (e.g. it failed to embed)
+        self.sources = list(dict.fromkeys(source for source, _ in parsed))
+        self._source_number = source_number = {source: s for s, source in enumerate(self.sources)}
+        max_index = np.full(len(self.sources), -1, dtype=np.int64)
+        for source, index in parsed:
+            max_index[source_number[source]] = max(max_index[source_number[source]], index)
+        self.slot_start = np.zeros(len(self.sources) + 1, dtype=np.int64)
+        self.slot_start[1:] = np.cumsum(max_index + 1)
+        self.row_of_slot = np.full(int(self.slot_start[-1]), -1, dtype=np.int32)
+        self.source_of_row = np.zeros(len(self.ids), dtype=np.int32)
+        self.index_of_row = np.zeros(len(self.ids), dtype=np.int32)
+        for row, (source, index) in enumerate(parsed):
+            s = source_number[source]
+            self.source_of_row[row] = s
+            self.index_of_row[row] = index
+            if index >= 0:
+                self.row_of_slot[self.slot_start[s] + index] = row
+
+    @classmethod
+    def from_db(cls, db, index_version: int | None = None) -> "ChunkStore":
+        # Works with Chroma and NumpyVectorStore, both have the same get()
+        print("CHUNK_STORE: Loading all chunks into memory...")
+        start_time = time.time()
+        data = db.get(include=["documents", "metadatas"])
+        store = cls(list(data["ids"]), list(data["documents"]), list(data["metadatas"]), index_version)
+        print(f"✅ CHUNK_STORE: Loaded {len(store)} chunks from {len(store.sources)} sources in {time.time() - start_time:.2f} seconds.")
+        return store
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.row_by_id
+
+    def text(self, row: int) -> str:
+        return self._text_bytes[self._text_offsets[row]:self._text_offsets[row + 1]].decode("utf-8")
+
+    def document(self, row: int) -> Document:
+        return Document(page_content=self.text(row), metadata=dict(self.metadatas[row]))
+
+    def source_documents(self, source: str) -> list[Document]:
+        # Every chunk of one source, in order
+        if source not in self._source_number:
+            return []
+        s = self._source_number[source]
+        rows = self.row_of_slot[self.slot_start[s]:self.slot_start[s + 1]]
+        return [self.document(int(row)) for row in rows if row >= 0]
+
+    def expand_rows(self, hit_rows, window: int) -> np.ndarray:
+        """Rows of the hits plus up to `window` neighbors on each side (same source only), unique and in document order."""
+        wanted = []
+        for row in hit_rows:
+            s = self.source_of_row[row]
+            index = int(self.index_of_row[row])
+            if index < 0:
+                wanted.append(np.array([row], dtype=np.int32))
+                continue
+            first = self.slot_start[s] + max(0, index - window)
+            last = min(self.slot_start[s] + index + window + 1, self.slot_start[s + 1])
+            wanted.append(self.row_of_slot[first:last])
+        if not wanted:
+            return np.zeros(0, dtype=np.int32)
+        rows = np.unique(np.concatenate(wanted)) # Sorted, and row order is document order
+        return rows[rows >= 0]
+
+    def expand(self, hit_ids: list[str], window: int) -> list[Document]:
+        rows = self.expand_rows([self.row_by_id[chunk_id] for chunk_id in hit_ids if chunk_id in self.row_by_id], window)
+        return [self.document(int(row)) for row in rows]
@@ -2,20 +2,57 @@
 
 import sys
 import time # Import the time module
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from langchain_chroma import Chroma
 from langchain.prompts import ChatPromptTemplate
-from langchain_ollama import OllamaLLM
-from embeddingsMain import get_embed_function # Assuming this is efficient or also caches
+from langchain_ollama import OllamaLLM, ChatOllama
+from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+from embeddingsMain import get_embed_function, get_index_version, get_stored_chunking_mode, chunk_document, calculate_chunk_ids, CHUNKING_MODE # Assuming this is efficient or also caches
+from vectorEngine import NumpyVectorStore, VECTOR_INDEX_PATH, neighbor_ids, split_chunk_id
+from embeddingCache import embed_query_batch
+from chunkStore import ChunkStore
+from queryCache import QueryCache, current_index_version
+from answerCache import SemanticAnswerCache, replay_stream
+from lexicalIndex import LexicalIndex, LEXICAL_INDEX_PATH, reciprocal_rank_fusion
+from endpointLookup import EndpointLookup
+from formattingData import ENDPOINT_INDEX_PATH
+from contextAssembler import assemble_context, print_report as print_context_report
+from tokenCounting import count_tokens
+from resourceManager import ResourceManager
 from langchain.schema.document import Document
 from pprint import pprint
 import argparse
 import json
 import re
 import os
+import numpy as np
 
 # --- Constants ---
 CHROMADATAPATH = 'chromaDb'
 RAG_FORMATTED_DATA_PATH = "ScrapingStuff/storedData/RagFormattedData.json" # Define path for JSON data
+# How many neighbor chunks on each side of a hit get pulled in. Section chunks are already self-contained so they need far fewer.
+# Picked by how the stored db was chunked (recorded in the manifest), not by CHUNKING_MODE, see get_context_window
+CONTEXT_WINDOW_BY_CHUNKING_MODE = {"structure": 1, "recursive": 4}
+LLM_MODEL_NAME = "qwen2.5:14b" # Also picks the tokenizer the context budget is counted with
+CONTEXT_TOKEN_BUDGET = 6000 # Max tokens of documentation context per prompt (see contextAssembler.py)
+BATCH_LLM_CONCURRENCY = 2 # Parallel generations in batch_query (set OLLAMA_NUM_PARALLEL on the server to match)
+ASYNC_RETRIEVAL_WORKERS = 4 # Threads asingle_query runs retrieval on (embedding + search are CPU bound)
+RETRIEVAL_BACKEND = "chroma" # "chroma" or "numpy" (in-process index from vectorEngine.py, build it with: python vectorEngine.py build)
+USE_QUERY_CACHE = True # Remember query embeddings and retrieved chunk ids for repeated questions (see queryCache.py)
+USE_ANSWER_CACHE = True # Replay stored answers for near-duplicate questions instead of generating again (see answerCache.py)
+ANSWER_CACHE_THRESHOLD = 0.95 # Cosine similarity a new query needs with an answered one to reuse its answer
+USE_LEXICAL_INDEX = True # Fuse BM25 keyword hits with the dense hits (exact paths / parameter names), see lexicalIndex.py
+HYBRID_CANDIDATE_FACTOR = 3 # Each ranking contributes k * this candidates to the fusion
+USE_ENDPOINT_LOOKUP = True # Questions naming an endpoint (GET /v1/..., "Delete blueprint") go straight to its page, no embedding
+USE_CHUNK_STORE = True # Keep every chunk in memory so neighbor windows don't need a second DB call per query
+# "prefix": the static instructions go in a byte-identical system message through the chat API and the context + question
+# come last, so Ollama can reuse the already computed KV cache of that prefix. "legacy": the original single PROMPT through
+# plain completion. Compare the two with: python promptCacheBench.py
+PROMPT_MODE = "prefix"
+OLLAMA_KEEP_ALIVE = "30m" # How long Ollama keeps the model (and its prefix cache) loaded after a request, its default is 5m
+OLLAMA_NUM_CTX = 8192 # Has to fit CONTEXT_TOKEN_BUDGET + instructions + answer, otherwise Ollama cuts the start of the prompt (the cached prefix)
 
 PROMPT = """
 You are an AI Documentation Chatbot. Your sole purpose is to provide answers based *exclusively* on the API documentation context provided below.
@@ -33,62 +70,178 @@ User Question: {question}
 Answer:
 """
 
-# --- Global Initialization of Expensive Resources ---
-print("\nCONTEXT_MODEL.PY: Initializing global resources...")
-start_time_global_init = time.time() # Start timer for global init
+# PROMPT_MODE = "prefix": nothing in here may change between requests (no dates, no formatting), or the cached prefix is lost
+SYSTEM_PROMPT = """You are an AI Documentation Chatbot. Your sole purpose is to provide answers based *exclusively* on the API documentation context provided in the user's message.
+You must not use any external knowledge or make assumptions beyond what is written in the context.
+It is crucial that you *do not* mention the process of information retrieval, the context itself, or that you are basing your answer on provided documents. Act as if you inherently know this information from the documentation.
+If the answer to the question cannot be found within the provided context, you *must* state: 'The information to answer this question is not available in the provided documentation.' Do not attempt to infer, guess, or provide related information not directly supported by the context."""
+
+# Everything that changes per query, after the system message
+QUESTION_PROMPT = """Provided API Documentation Context:
+{context}
+
+---
+
+Based *only* on the Provided API Documentation Context above, answer the following user question:
+User Question: {question}"""
+
+# --- Expensive Resources (created lazily, see resourceManager.py) ---
+# Nothing heavy happens at import anymore. Each resource is built the first time a query needs it (or by warm_up()),
+# once, even with several threads asking. The old globals (MODEL, DB, ...) still work through __getattr__ below.
+RESOURCES = ResourceManager("CONTEXT_MODEL")
 
 # 1. LLM Model
-try:
+def _load_model():
+    if PROMPT_MODE == "prefix":
+        # Chat API so the instructions are a separate system message, StrOutputParser so stream()/astream()/batch() still give text
+        model = ChatOllama(model=LLM_MODEL_NAME, temperature=.3, keep_alive=OLLAMA_KEEP_ALIVE, num_ctx=OLLAMA_NUM_CTX) | StrOutputParser()
+        print(f"✅ Global LLM (MODEL) initialized (chat API, prefix-stable prompt, keep_alive={OLLAMA_KEEP_ALIVE}).")
+        return model
     # MODEL = OllamaLLM(model="phi3:mini", temperature=.3)
-    MODEL = OllamaLLM(model="qwen2.5:14b", temperature=.3)
+    model = OllamaLLM(model=LLM_MODEL_NAME, temperature=.3, keep_alive=OLLAMA_KEEP_ALIVE, num_ctx=OLLAMA_NUM_CTX)
     # MODEL = OllamaLLM(model="qwen2.5:14b-instruct-q4_K_M", temperature=.3) # Using the quantized model to make it run faster
     # MODEL = OllamaLLM(model="qwen2.5:14b-instruct-q4_K_S", temperature=.3)
     # qwen2.5:14b-instruct-q4_K_S
     print("✅ Global LLM (MODEL) initialized.")
-except Exception as e:
-    MODEL = None
-    print(f"❌ Failed to initialize global LLM (MODEL): {e}")
+    return model
 
 # 2. Embedding Function
-try:
-    EMBEDDING_FUNCTION = get_embed_function()
+def _load_embedding_function():
+    embedding_function = get_embed_function()
     print("✅ Global EMBEDDING_FUNCTION initialized.")
-except Exception as e:
-    EMBEDDING_FUNCTION = None
-    print(f"❌ Failed to initialize global EMBEDDING_FUNCTION: {e}")
-
-# 3. ChromaDB Connection
-DB = None # Initialize DB as None
-if EMBEDDING_FUNCTION and os.path.exists(CHROMADATAPATH):
-    try:
-        DB = Chroma(persist_directory=CHROMADATAPATH, embedding_function=EMBEDDING_FUNCTION)
-        print(f"✅ Global Chroma DB connection (DB) established to {CHROMADATAPATH}.")
-    except Exception as e:
-        DB = None
-        print(f"❌ Failed to establish global Chroma DB connection (DB): {e}")
-elif not os.path.exists(CHROMADATAPATH):
-    print(f"⚠️ Global Chroma DB path not found at {CHROMADATAPATH}. DB not initialized.")
-elif not EMBEDDING_FUNCTION:
-    print(f"⚠️ Embedding function not available. DB not initialized.")
-
+    return embedding_function
+
+# 3. ChromaDB Connection (or the numpy index, which has the same search/get methods)
+def _load_db():
+    if RETRIEVAL_BACKEND == "numpy":
+        if not os.path.exists(VECTOR_INDEX_PATH):
+            print(f"⚠️ Numpy vector index not found at {VECTOR_INDEX_PATH}. DB not initialized.")
+            return None
+        embedding_function = get_embedding_function()
+        # Without an embedding function the index can still serve chunks for keyword-only retrieval, same as Chroma
+        db = NumpyVectorStore(VECTOR_INDEX_PATH, embedding_function=embedding_function)
+        print(f"✅ Global numpy vector index (DB) loaded from {VECTOR_INDEX_PATH} ({len(db)} chunks).")
+        if not embedding_function:
+            print(f"⚠️ Embedding function not available, only keyword (BM25) retrieval will work.")
+        if db.index_version != get_index_version():
+            print(f"⚠️ Numpy vector index is older than the Chroma DB, rebuild it with: python vectorEngine.py build")
+        return db
+    if not os.path.exists(CHROMADATAPATH):
+        print(f"⚠️ Global Chroma DB path not found at {CHROMADATAPATH}. DB not initialized.")
+        return None
+    embedding_function = get_embedding_function()
+    # Without an embedding function the DB can still serve chunks for keyword-only retrieval
+    db = Chroma(persist_directory=CHROMADATAPATH, embedding_function=embedding_function)
+    print(f"✅ Global Chroma DB connection (DB) established to {CHROMADATAPATH}.")
+    if not embedding_function:
+        print(f"⚠️ Embedding function not available, only keyword (BM25) retrieval will work.")
+    return db
+
+# 3b. In-memory chunk store for expanding context windows without a second DB round trip
+def _load_chunk_store():
+    db = get_db()
+    if not db or not USE_CHUNK_STORE:
+        return None
+    return ChunkStore.from_db(db, index_version=get_index_version())
+
+# 3c. BM25 keyword index (built at the end of ingestion)
+def _load_lexical_index():
+    if not USE_LEXICAL_INDEX:
+        return None
+    if not os.path.exists(LEXICAL_INDEX_PATH):
+        print(f"⚠️ BM25 index not found at {LEXICAL_INDEX_PATH}, using dense retrieval only. Build it with: python lexicalIndex.py build")
+        return None
+    lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+    print(f"✅ Global BM25 index (LEXICAL_INDEX) loaded from {LEXICAL_INDEX_PATH} ({len(lexical_index)} chunks).")
+    if lexical_index.index_version != get_index_version():
+        print(f"⚠️ BM25 index is older than the Chroma DB, rebuild it with: python lexicalIndex.py build")
+    return lexical_index
+
+# 3d. Query embedding / retrieval result cache (starts empty, cleared whenever the index version changes)
+def _load_query_cache():
+    return QueryCache() if USE_QUERY_CACHE else None
+
+# 3e. Semantic answer cache (starts empty)
+def _load_answer_cache():
+    return SemanticAnswerCache(threshold=ANSWER_CACHE_THRESHOLD) if USE_ANSWER_CACHE else None
 
 # 4. Formatted RAG Data (optional, if used frequently)
-ALL_RAG_DATA = None
-if os.path.exists(RAG_FORMATTED_DATA_PATH):
-    try:
-        with open(RAG_FORMATTED_DATA_PATH, 'r') as f:
-            ALL_RAG_DATA = json.load(f)
-        print(f"✅ Global RAG Formatted Data (ALL_RAG_DATA) loaded from {RAG_FORMATTED_DATA_PATH}.")
-    except Exception as e:
-        ALL_RAG_DATA = None
-        print(f"❌ Failed to load global RAG Formatted Data (ALL_RAG_DATA): {e}")
-else:
-    print(f"⚠️ Global RAG Formatted Data path not found at {RAG_FORMATTED_DATA_PATH}. Not loaded.")
-
-end_time_global_init = time.time() # End timer for global init
-print(f"CONTEXT_MODEL.PY: Global resource initialization complete in {end_time_global_init - start_time_global_init:.4f} seconds.")
-# --- End of Global Initialization ---
-
+def _load_rag_data():
+    if not os.path.exists(RAG_FORMATTED_DATA_PATH):
+        print(f"⚠️ Global RAG Formatted Data path not found at {RAG_FORMATTED_DATA_PATH}. Not loaded.")
+        return None
+    with open(RAG_FORMATTED_DATA_PATH, 'r') as f:
+        all_rag_data = json.load(f)
+    print(f"✅ Global RAG Formatted Data (ALL_RAG_DATA) loaded from {RAG_FORMATTED_DATA_PATH}.")
+    return all_rag_data
+
+# 5. Endpoint -> page index for direct lookups (falls back to building it from ALL_RAG_DATA)
+def _load_endpoint_lookup():
+    if not USE_ENDPOINT_LOOKUP:
+        return None
+    # The formatted data is only parsed here when the saved index is missing
+    endpoint_lookup = EndpointLookup.load(ENDPOINT_INDEX_PATH, None if os.path.exists(ENDPOINT_INDEX_PATH) else get_rag_data())
+    if endpoint_lookup is not None:
+        print(f"✅ Global endpoint index (ENDPOINT_LOOKUP) ready ({len(endpoint_lookup)} operations).")
+    else:
+        print(f"⚠️ Endpoint index not found at {ENDPOINT_INDEX_PATH}. Direct endpoint lookups disabled.")
+    return endpoint_lookup
+
+# Registration order is the warm-up order: what every query needs first, the optional extras after
+RESOURCES.register("MODEL", _load_model)
+RESOURCES.register("EMBEDDING_FUNCTION", _load_embedding_function)
+RESOURCES.register("DB", _load_db)
+RESOURCES.register("QUERY_CACHE", _load_query_cache, required=False)
+RESOURCES.register("ANSWER_CACHE", _load_answer_cache, required=False)
+RESOURCES.register("LEXICAL_INDEX", _load_lexical_index, required=False)
+RESOURCES.register("ENDPOINT_LOOKUP", _load_endpoint_lookup, required=False)
+RESOURCES.register("CHUNK_STORE", _load_chunk_store, required=False)
+RESOURCES.register("ALL_RAG_DATA", _load_rag_data, required=False)
+
+def get_model(): return RESOURCES.get("MODEL") # OllamaLLM, or ChatOllama | StrOutputParser in "prefix" mode
+def get_embedding_function(): return RESOURCES.get("EMBEDDING_FUNCTION")
+def get_db() -> Chroma | NumpyVectorStore | None: return RESOURCES.get("DB")
+def get_chunk_store() -> ChunkStore | None: return RESOURCES.get("CHUNK_STORE")
+def get_lexical_index() -> LexicalIndex | None: return RESOURCES.get("LEXICAL_INDEX")
+def get_query_cache() -> QueryCache | None: return RESOURCES.get("QUERY_CACHE")
+def get_answer_cache() -> SemanticAnswerCache | None: return RESOURCES.get("ANSWER_CACHE")
+def get_rag_data() -> dict | None: return RESOURCES.get("ALL_RAG_DATA")
+def get_endpoint_lookup() -> EndpointLookup | None: return RESOURCES.get("ENDPOINT_LOOKUP")
+
+def warm_up(background: bool = True):
+    # Start loading everything now (e.g. when the UI starts) so the first question doesn't pay for it
+    return RESOURCES.warm_up(background=background)
+
+def __getattr__(name):
+    # contextModel.MODEL, contextModel.DB, ... still work for older callers, they just load on first access now
+    if name in RESOURCES:
+        return RESOURCES.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+# --- End of Expensive Resources ---
+
+_CONTEXT_WINDOW = (None, None) # (index version it was read for, window)
+
+def get_context_window() -> int:
+    global _CONTEXT_WINDOW
+    version = current_index_version()
+    if _CONTEXT_WINDOW[1] is None or _CONTEXT_WINDOW[0] != version:
+        stored_mode = get_stored_chunking_mode()
+        if stored_mode and stored_mode != CHUNKING_MODE:
+            print(f"⚠️ The DB was chunked in '{stored_mode}' mode but CHUNKING_MODE is '{CHUNKING_MODE}'. Using the context "
+                  f"window for '{stored_mode}' until the data is re-ingested.")
+        mode = stored_mode or CHUNKING_MODE
+        _CONTEXT_WINDOW = (version, CONTEXT_WINDOW_BY_CHUNKING_MODE.get(mode, CONTEXT_WINDOW_BY_CHUNKING_MODE["recursive"]))
+    return _CONTEXT_WINDOW[1]
+
+RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=ASYNC_RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+
+def build_llm_input(context_text: str, query_text: str):
+    # What gets passed to MODEL.stream()/astream()/batch(): chat messages in "prefix" mode, one prompt string in "legacy" mode
+    if PROMPT_MODE == "prefix":
+        return [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=QUESTION_PROMPT.format(context=context_text, question=query_text))]
+    prompt_template = ChatPromptTemplate.from_template(PROMPT)
+    return prompt_template.format(context=context_text, question=query_text)
 
 def parse_chunk_id(chunk_id: str) -> tuple[str | None, int | None]:
     match = re.match(r"^(.*):(\d+)$", chunk_id)
@@ -98,7 +251,28 @@ def parse_chunk_id(chunk_id: str) -> tuple[str | None, int | None]:
         return source, index
     return None, None
 
-def get_contextual_chunks(db_conn: Chroma | None, query_text: str, k: int = 4, window: int = 1) -> tuple[list[Document], list[str], list[str]]:
+def load_chunks_by_id(db_conn: Chroma | NumpyVectorStore, chunk_ids: list[str], chunk_store: ChunkStore | None = None) -> list[Document] | None:
+    # Returns the chunks in the given order, or None if any of them can't be found anymore
+    if chunk_store is not None and all(chunk_id in chunk_store for chunk_id in chunk_ids):
+        return [chunk_store.document(chunk_store.row_by_id[chunk_id]) for chunk_id in chunk_ids]
+    retrieved_data = db_conn.get(ids=chunk_ids, include=["documents", "metadatas"])
+    docs_by_id = {
+        id_val: Document(page_content=doc, metadata=meta)
+        for id_val, doc, meta in zip(retrieved_data.get('ids', []), retrieved_data.get('documents', []), retrieved_data.get('metadatas', []))
+        if id_val and doc is not None and meta is not None
+    }
+    if len(docs_by_id) != len(set(chunk_ids)):
+        return None
+    return [docs_by_id[chunk_id] for chunk_id in chunk_ids]
+
+def mark_hit_ranks(context_docs: list[Document], hit_ids: list[str]):
+    # metadata["hit_rank"] = 0 for the best search hit, 1 for the next, ... (neighbors pulled in for context get none)
+    rank_by_id = {chunk_id: rank for rank, chunk_id in enumerate(hit_ids)}
+    for doc in context_docs:
+        if doc.metadata.get("id") in rank_by_id:
+            doc.metadata["hit_rank"] = rank_by_id[doc.metadata["id"]]
+
+def get_contextual_chunks(db_conn: Chroma | NumpyVectorStore | None, query_text: str, k: int = 4, window: int = 1, chunk_store: ChunkStore | None = None, query_cache: QueryCache | None = None, lexical_index: LexicalIndex | None = None) -> tuple[list[Document], list[str], list[str]]:
     print("\nGET_CONTEXTUAL_CHUNKS: Starting...")
     start_time_get_contextual = time.time()
 
@@ -108,38 +282,94 @@ def get_contextual_chunks(db_conn: Chroma | None, query_text: str, k: int = 4, w
         print(f"GET_CONTEXTUAL_CHUNKS: Finished (DB not available) in {end_time_get_contextual - start_time_get_contextual:.4f} seconds.")
         return [], [], []
 
+    if query_cache is not None:
+        query_cache.check_version()
+        cached = query_cache.get_retrieval(query_text, k, window)
+        if cached is not None:
+            cached_ids, cached_hit_ids = cached
+            try:
+                cached_docs = load_chunks_by_id(db_conn, cached_ids, chunk_store)
+            except Exception as e:
+                print(f"WARNING: Could not load cached chunk ids, searching again: {e}")
+                cached_docs = None
+            if cached_docs is not None:
+                mark_hit_ranks(cached_docs, cached_hit_ids)
+                unique_sorted_sources = list(dict.fromkeys(doc.metadata.get("source", "N/A") for doc in cached_docs))
+                end_time_get_contextual = time.time()
+                print(f"✅ GET_CONTEXTUAL_CHUNKS: Retrieval cache hit, {len(cached_docs)} contextual documents in {end_time_get_contextual - start_time_get_contextual:.4f} seconds.")
+                return cached_docs, list(cached_ids), unique_sorted_sources
+            query_cache.drop_retrieval(query_text, k, window)
+
     # ... (rest of your get_contextual_chunks function, ensure it uses the passed db_conn) ...
-    print(f"🔎 GET_CONTEXTUAL_CHUNKS: Initial search for top {k} chunks...")
-    start_time_search = time.time()
-    initial_results = db_conn.similarity_search_with_score(query_text, k=k) # Use db_conn
-    end_time_search = time.time()
-    print(f"GET_CONTEXTUAL_CHUNKS: Similarity search completed in {end_time_search - start_time_search:.4f} seconds.")
+    candidates = k * HYBRID_CANDIDATE_FACTOR if lexical_index is not None else k
+    dense_ids = []
+    if db_conn.embeddings is not None:
+        print(f"🔎 GET_CONTEXTUAL_CHUNKS: Initial search for top {candidates} chunks...")
+        start_time_search = time.time()
+        try:
+            if query_cache is not None:
+                # Embed through the cache (same vector Chroma would compute itself) and search by vector
+                query_vector = query_cache.embed_query(db_conn.embeddings, query_text)
+                initial_results = db_conn.similarity_search_by_vector_with_relevance_scores(query_vector, k=candidates)
+            else:
+                initial_results = db_conn.similarity_search_with_score(query_text, k=candidates) # Use db_conn
+            dense_ids = [doc.metadata.get("id") for doc, score in initial_results if doc.metadata.get("id")]
+        except Exception as e:
+            if lexical_index is None:
+                raise
+            print(f"⚠️ GET_CONTEXTUAL_CHUNKS: Dense search failed ({e}), falling back to keyword search only.")
+        end_time_search = time.time()
+        print(f"GET_CONTEXTUAL_CHUNKS: Similarity search completed in {end_time_search - start_time_search:.4f} seconds.")
+
+    lexical_ids = []
+    if lexical_index is not None:
+        start_time_lexical = time.time()
+        lexical_ids = [chunk_id for chunk_id, score in lexical_index.search(query_text, candidates)]
+        end_time_lexical = time.time()
+        print(f"GET_CONTEXTUAL_CHUNKS: BM25 search found {len(lexical_ids)} chunks in {end_time_lexical - start_time_lexical:.4f} seconds.")
+
+    if dense_ids and lexical_ids:
+        hit_ids = [chunk_id for chunk_id, score in reciprocal_rank_fusion([dense_ids, lexical_ids])[:k]]
+    else:
+        hit_ids = (dense_ids or lexical_ids)[:k]
 
-    if not initial_results:
+    if not hit_ids:
         print("❌ GET_CONTEXTUAL_CHUNKS: NO INITIAL RESULTS FOUND FOR THE QUERY")
         end_time_get_contextual = time.time()
         print(f"GET_CONTEXTUAL_CHUNKS: Finished (no initial results) in {end_time_get_contextual - start_time_get_contextual:.4f} seconds.")
         return [], [], []
 
-    print(f"GET_CONTEXTUAL_CHUNKS: Found {len(initial_results)} initial results.")
+    print(f"GET_CONTEXTUAL_CHUNKS: Found {len(hit_ids)} initial results ({len(set(hit_ids) - set(dense_ids))} only from BM25).")
+
+    # Fast path: expand the windows from the in-memory chunk store, no id strings and no second db call
+    if chunk_store is not None and hit_ids and all(doc_id in chunk_store for doc_id in hit_ids):
+        start_time_expand = time.time()
+        context_docs = chunk_store.expand(hit_ids, window)
+        mark_hit_ranks(context_docs, hit_ids)
+        sorted_retrieved_ids = [doc.metadata.get("id", "N/A") for doc in context_docs]
+        unique_sorted_sources = list(dict.fromkeys(doc.metadata.get("source", "N/A") for doc in context_docs))
+        end_time_expand = time.time()
+        if query_cache is not None:
+            query_cache.put_retrieval(query_text, k, window, sorted_retrieved_ids, hit_ids)
+        print(f"✅ GET_CONTEXTUAL_CHUNKS: Expanded {len(hit_ids)} hits to {len(context_docs)} contextual documents from the chunk store in {end_time_expand - start_time_expand:.4f} seconds.")
+        end_time_get_contextual = time.time()
+        print(f"GET_CONTEXTUAL_CHUNKS: Finished total execution in {end_time_get_contextual - start_time_get_contextual:.4f} seconds.")
+        return context_docs, sorted_retrieved_ids, unique_sorted_sources
+    if chunk_store is not None:
+        print("WARNING: Some hits are missing from the chunk store (it may be stale), falling back to db.get.")
 
     all_ids_to_fetch = set()
     original_top_k_ids = []
 
-    print(f"GET_CONTEXTUAL_CHUNKS: Identifying context window IDs for top {len(initial_results)} results (window={window})...")
+    print(f"GET_CONTEXTUAL_CHUNKS: Identifying context window IDs for top {len(hit_ids)} results (window={window})...")
     start_time_identify_ids = time.time()
-    for i, (doc, score) in enumerate(initial_results):
-        doc_id = doc.metadata.get("id")
-        if not doc_id:
-            print(f"WARNING: Initial result {i+1} is missing 'id' metadata. Skipping context window for this result.")
-            continue
-
+    for i, doc_id in enumerate(hit_ids):
         source, index = parse_chunk_id(doc_id)
         if source is None or index is None:
             print(f"WARNING: Could not parse source/index from ID '{doc_id}' for initial result {i+1}. Skipping context window for this result.")
             continue
 
-        # print(f"   - Processing initial chunk {i+1}: ID='{doc_id}', Score={score:.4f}, Source='{source}', Index={index}") # Too verbose
+        # print(f"   - Processing initial chunk {i+1}: ID='{doc_id}', Source='{source}', Index={index}") # Too verbose
         original_top_k_ids.append(doc_id)
         all_ids_to_fetch.add(doc_id)
 
@@ -197,9 +427,13 @@ def get_contextual_chunks(db_conn: Chroma | None, query_text: str, k: int = 4, w
         return (source_val, index_val)
 
     context_docs.sort(key=sort_key)
+    mark_hit_ranks(context_docs, original_top_k_ids)
     sorted_retrieved_ids = [doc.metadata.get("id", "N/A") for doc in context_docs]
     unique_sorted_sources = list(dict.fromkeys(doc.metadata.get("source", "N/A") for doc in context_docs))
 
+    if query_cache is not None:
+        query_cache.put_retrieval(query_text, k, window, sorted_retrieved_ids, original_top_k_ids)
+
     end_time_process_retrieved = time.time()
     print(f"✅ GET_CONTEXTUAL_CHUNKS: Retrieved and sorted {len(context_docs)} contextual documents in {end_time_process_retrieved - start_time_process_retrieved:.4f} seconds.")
 
@@ -208,56 +442,257 @@ def get_contextual_chunks(db_conn: Chroma | None, query_text: str, k: int = 4, w
     return context_docs, sorted_retrieved_ids, unique_sorted_sources
 
 
-def single_query(query_text: str, use_formatted_data: bool = False, k_val:int = 4):
-    print(f"\nSINGLE_QUERY: Starting for query: '{query_text}' | use_formatted_data: {use_formatted_data}")
+def search_batch(db_conn: Chroma | NumpyVectorStore, query_vectors, n: int) -> list[list[str]]:
+    # One top-n search for the whole batch, returns the hit ids (best first) for every query
+    if isinstance(db_conn, NumpyVectorStore):
+        rows, _ = db_conn.search_vectors(query_vectors, n)
+        return [[db_conn.ids[int(row)] for row in query_rows] for query_rows in rows]
+    # Chroma's collection takes a list of query embeddings and searches them together
+    results = db_conn._collection.query(query_embeddings=[list(map(float, vector)) for vector in query_vectors], n_results=n, include=[])
+    return [list(ids) for ids in results["ids"]]
+
+def batch_retrieve(query_texts: list[str], k: int = 4, window: int | None = None, db_conn: Chroma | NumpyVectorStore | None = None,
+                   chunk_store: ChunkStore | None = None, query_cache: QueryCache | None = None,
+                   lexical_index: LexicalIndex | None = None) -> tuple[list[tuple[list[Document], list[str], list[str]]], list]:
+    """Same as calling get_contextual_chunks for every query, but with one batched embedding pass, one matrix top-k
+    and one neighbor fetch for the whole batch. Returns ([(context_docs, ids, sources) per query], query vectors)."""
+    print(f"\nBATCH_RETRIEVE: Starting for {len(query_texts)} queries...")
+    if window is None:
+        window = get_context_window()
+    start_time_batch = time.time()
+    if not db_conn or not query_texts:
+        print("❌ BATCH_RETRIEVE: DB connection is not available or no queries given.")
+        return [([], [], []) for _ in query_texts], [None] * len(query_texts)
+
+    candidates = k * HYBRID_CANDIDATE_FACTOR if lexical_index is not None else k
+    query_vectors = [None] * len(query_texts)
+    dense_ids = [[] for _ in query_texts]
+    if db_conn.embeddings is not None:
+        start_time_embed = time.time()
+        if query_cache is not None:
+            query_cache.check_version()
+            query_vectors = query_cache.embed_queries(db_conn.embeddings, query_texts)
+        else:
+            query_vectors = embed_query_batch(db_conn.embeddings, query_texts)
+        end_time_embed = time.time()
+        print(f"BATCH_RETRIEVE: Embedded {len(query_texts)} queries in one batch in {end_time_embed - start_time_embed:.4f} seconds.")
+
+        start_time_search = time.time()
+        dense_ids = search_batch(db_conn, np.asarray(query_vectors, dtype=np.float32), candidates)
+        end_time_search = time.time()
+        print(f"BATCH_RETRIEVE: Batched top-{candidates} search completed in {end_time_search - start_time_search:.4f} seconds.")
+
+    all_hit_ids = []
+    for i, query_text in enumerate(query_texts):
+        lexical_ids = [chunk_id for chunk_id, score in lexical_index.search(query_text, candidates)] if lexical_index is not None else []
+        if dense_ids[i] and lexical_ids:
+            all_hit_ids.append([chunk_id for chunk_id, score in reciprocal_rank_fusion([dense_ids[i], lexical_ids])[:k]])
+        else:
+            all_hit_ids.append((dense_ids[i] or lexical_ids)[:k])
+
+    # Neighbor windows for the whole batch: from the chunk store if it has every hit, otherwise one db.get for all of them
+    start_time_expand = time.time()
+    results = []
+    if chunk_store is not None and all(chunk_id in chunk_store for hit_ids in all_hit_ids for chunk_id in hit_ids):
+        per_query_docs = [chunk_store.expand(hit_ids, window) for hit_ids in all_hit_ids]
+    else:
+        wanted_ids = set()
+        for hit_ids in all_hit_ids:
+            wanted_ids.update(neighbor_ids(hit_ids, window))
+        retrieved_data = db_conn.get(ids=list(wanted_ids), include=["documents", "metadatas"]) if wanted_ids else {"ids": []}
+        docs_by_id = {
+            id_val: (doc, meta)
+            for id_val, doc, meta in zip(retrieved_data.get('ids', []), retrieved_data.get('documents', []), retrieved_data.get('metadatas', []))
+            if id_val and doc is not None and meta is not None
+        }
+        per_query_docs = []
+        for hit_ids in all_hit_ids:
+            ids = sorted((chunk_id for chunk_id in neighbor_ids(hit_ids, window) if chunk_id in docs_by_id), key=split_chunk_id)
+            # Fresh Documents per query, since hit_rank gets written into the metadata
+            per_query_docs.append([Document(page_content=docs_by_id[chunk_id][0], metadata=dict(docs_by_id[chunk_id][1])) for chunk_id in ids])
+
+    for query_text, hit_ids, context_docs in zip(query_texts, all_hit_ids, per_query_docs):
+        mark_hit_ranks(context_docs, hit_ids)
+        ids = [doc.metadata.get("id", "N/A") for doc in context_docs]
+        if query_cache is not None and context_docs:
+            query_cache.put_retrieval(query_text, k, window, ids, hit_ids)
+        results.append((context_docs, ids, list(dict.fromkeys(doc.metadata.get("source", "N/A") for doc in context_docs))))
+    end_time_expand = time.time()
+    print(f"BATCH_RETRIEVE: Context windows for the whole batch built in {end_time_expand - start_time_expand:.4f} seconds.")
+
+    end_time_batch = time.time()
+    elapsed = end_time_batch - start_time_batch
+    print(f"✅ BATCH_RETRIEVE: Finished {len(query_texts)} queries in {elapsed:.4f} seconds ({len(query_texts) / max(elapsed, 1e-9):.1f} queries/sec).")
+    return results, query_vectors
+
+def batch_query(query_texts: list[str], k_val: int = 4) -> list[tuple[str, list[str]]]:
+    """Answers many questions at once (evaluation runs, FAQ pre-generation). Returns [(answer, sources)] in order.
+    Answers are not streamed, and they go into the answer cache so live users asking the same thing get them instantly."""
+    print(f"\nBATCH_QUERY: Starting for {len(query_texts)} queries...")
+    start_time_batch_query = time.time()
+    model = get_model()
+    db = get_db()
+    if not model or not db:
+        print("❌ BATCH_QUERY: Global LLM (MODEL) or DB not available.")
+        return [("Error: The AI model or documentation database is not available.", []) for _ in query_texts]
+
+    retrievals, query_vectors = batch_retrieve(query_texts, k=k_val, window=get_context_window(), db_conn=db, chunk_store=get_chunk_store(),
+                                               query_cache=get_query_cache(), lexical_index=get_lexical_index())
+    prompts = []
+    sources = []
+    for query_text, (context_docs, _, _) in zip(query_texts, retrievals):
+        assembled = assemble_context(context_docs, token_budget=CONTEXT_TOKEN_BUDGET, model=LLM_MODEL_NAME)
+        prompts.append(build_llm_input(assembled["text"], query_text) if context_docs else None)
+        sources.append(assembled["sources"])
+
+    results = [("I couldn't find relevant information in the documentation to answer your question.", [])] * len(query_texts)
+    to_generate = [i for i, prompt in enumerate(prompts) if prompt is not None]
+    start_time_llm = time.time()
+    answers = model.batch([prompts[i] for i in to_generate], config={"max_concurrency": BATCH_LLM_CONCURRENCY}, return_exceptions=True)
+    end_time_llm = time.time()
+    print(f"BATCH_QUERY: Generated {len(to_generate)} answers in {end_time_llm - start_time_llm:.4f} seconds.")
+
+    index_version = current_index_version()
+    answer_cache = get_answer_cache()
+    for i, answer in zip(to_generate, answers):
+        if isinstance(answer, Exception):
+            results[i] = (f"There was an error generating the response: {answer}", sources[i])
+            continue
+        results[i] = (answer, sources[i])
+        if answer_cache is not None and query_vectors[i] is not None and answer.strip():
+            answer_cache.add(query_vectors[i], query_texts[i], answer, sources[i], index_version, ("chunks", k_val))
+
+    end_time_batch_query = time.time()
+    print(f"BATCH_QUERY: Finished total execution in {end_time_batch_query - start_time_batch_query:.4f} seconds.")
+    return results
+
+
+def build_rag_context(query_text: str, use_formatted_data: bool = False, k_val: int = 4) -> dict:
+    """Everything single_query does before the LLM call: checks, endpoint lookup, answer cache, retrieval and the prompt.
+    Returns {"prompt", "sources", "reply", "cached", "answer_cache"}. When "reply" is set (error, nothing found or a cached
+    answer) that text is the answer and the LLM shouldn't be called."""
     start_time_single_query = time.time()
 
     # --- Check if global resources are available ---
-    if not MODEL:
+    if not get_model():
         print("❌ SINGLE_QUERY: Global LLM (MODEL) not available.")
         end_time_single_query = time.time()
         print(f"SINGLE_QUERY: Finished (LLM not available) in {end_time_single_query - start_time_single_query:.4f} seconds.")
-        def error_gen(): yield "Error: The AI model is not available."
-        return error_gen(), []
-
-    if not EMBEDDING_FUNCTION: # Though DB check often implies this
-        print("❌ SINGLE_QUERY: Global EMBEDDING_FUNCTION not available.")
-        end_time_single_query = time.time()
-        print(f"SINGLE_QUERY: Finished (Embeddings not available) in {end_time_single_query - start_time_single_query:.4f} seconds.")
-        def error_gen(): yield "Error: The embedding service is not available."
-        return error_gen(), []
-
-    if not DB and not use_formatted_data: # If not using formatted_data, DB is essential
-        print(f"❌ SINGLE_QUERY: Global Chroma DB (DB) not available and not using formatted_data mode.")
-        end_time_single_query = time.time()
-        print(f"SINGLE_QUERY: Finished (DB not available for RAG) in {end_time_single_query - start_time_single_query:.4f} seconds.")
-        def error_gen(): yield "Error: The documentation database is not available."
-        return error_gen(), []
-
-    if use_formatted_data and not ALL_RAG_DATA:
-        print(f"❌ SINGLE_QUERY: Formatted data mode selected, but ALL_RAG_DATA not loaded.")
-        end_time_single_query = time.time()
-        print(f"SINGLE_QUERY: Finished (Formatted data not loaded) in {end_time_single_query - start_time_single_query:.4f} seconds.")
-        def error_gen(): yield "Error: The formatted documentation content is not available."
-        return error_gen(), []
-
-    # No longer need to initialize DB, EMBEDDING_FUNCTION here.
-    # Just use the global DB and ALL_RAG_DATA.
+        return {"prompt": None, "sources": [], "reply": "Error: The AI model is not available.", "cached": False, "answer_cache": None}
 
     retrieved_sources = []
     context_text = ""
     context_docs = [] # Ensure it's initialized
 
-    if not use_formatted_data:
-        if not DB: # Redundant check if above checks are solid, but good for safety
+    # --- Direct endpoint lookup: the query names an endpoint, so we already know which page answers it ---
+    # Done before loading the embedding model and the DB, since these queries need neither
+    endpoint_links = []
+    endpoint_lookup = get_endpoint_lookup()
+    if endpoint_lookup is not None:
+        start_time_endpoint_lookup = time.time()
+        endpoint_links, endpoint_matched = endpoint_lookup.match(query_text)
+        end_time_endpoint_lookup = time.time()
+        if endpoint_links:
+            print(f"✅ SINGLE_QUERY: Query names {endpoint_matched}, resolved to {len(endpoint_links)} page(s) in {end_time_endpoint_lookup - start_time_endpoint_lookup:.4f} seconds. Skipping embedding and vector search.")
+
+    if endpoint_links:
+        start_time_endpoint_context = time.time()
+        all_rag_data = get_rag_data()
+        for rank, link in enumerate(endpoint_links):
+            if not all_rag_data or link not in all_rag_data:
+                continue # Without the formatted page we'd need the DB (and the embedding model), retrieval handles it then
+            page = Document(page_content=all_rag_data[link], metadata={"source": link})
+            # One page that fits the budget goes in whole. Several pages (or one too big) go in as their chunks, split
+            # here the same way ingestion does (no DB or embedding model needed), so assemble_context can trim them to
+            # CONTEXT_TOKEN_BUDGET instead of overflowing num_ctx
+            if len(endpoint_links) == 1 and count_tokens(page.page_content, LLM_MODEL_NAME) <= CONTEXT_TOKEN_BUDGET:
+                page_docs = [page]
+            else:
+                page_docs = calculate_chunk_ids(chunk_document(page))
+            if page_docs:
+                # The start of the page (endpoint summary, parameters) is kept first when trimming, pages in match order
+                page_docs[0].metadata["hit_rank"] = rank
+            context_docs.extend(page_docs)
+        if context_docs:
+            assembled = assemble_context(context_docs, token_budget=CONTEXT_TOKEN_BUDGET, model=LLM_MODEL_NAME)
+            context_text = assembled["text"]
+            context_docs = assembled["docs"]
+            retrieved_sources = assembled["sources"] # Only the pages that made it past the budget
+            print_context_report(assembled["report"])
+        end_time_endpoint_context = time.time()
+        print(f"SINGLE_QUERY: Endpoint page context built in {end_time_endpoint_context - start_time_endpoint_context:.4f} seconds.")
+    endpoint_context = bool(endpoint_links and context_docs)
+
+    if not endpoint_context:
+        # Everything below needs the retrieval resources, first use loads them (or waits for a running warm-up)
+        embedding_function = get_embedding_function()
+        db = get_db()
+        chunk_store = get_chunk_store()
+        lexical_index = get_lexical_index()
+        query_cache = get_query_cache()
+        all_rag_data = get_rag_data() if use_formatted_data else None
+
+        if not embedding_function and lexical_index:
+            print("⚠️ SINGLE_QUERY: Global EMBEDDING_FUNCTION not available, using keyword (BM25) retrieval only.")
+        elif not embedding_function: # Though DB check often implies this
+            print("❌ SINGLE_QUERY: Global EMBEDDING_FUNCTION not available.")
+            end_time_single_query = time.time()
+            print(f"SINGLE_QUERY: Finished (Embeddings not available) in {end_time_single_query - start_time_single_query:.4f} seconds.")
+            return {"prompt": None, "sources": [], "reply": "Error: The embedding service is not available.", "cached": False, "answer_cache": None}
+
+        if not db and not use_formatted_data: # If not using formatted_data, DB is essential
+            print(f"❌ SINGLE_QUERY: Global Chroma DB (DB) not available and not using formatted_data mode.")
+            end_time_single_query = time.time()
+            print(f"SINGLE_QUERY: Finished (DB not available for RAG) in {end_time_single_query - start_time_single_query:.4f} seconds.")
+            return {"prompt": None, "sources": [], "reply": "Error: The documentation database is not available.", "cached": False, "answer_cache": None}
+
+        if use_formatted_data and not all_rag_data:
+            print(f"❌ SINGLE_QUERY: Formatted data mode selected, but ALL_RAG_DATA not loaded.")
+            end_time_single_query = time.time()
+            print(f"SINGLE_QUERY: Finished (Formatted data not loaded) in {end_time_single_query - start_time_single_query:.4f} seconds.")
+            return {"prompt": None, "sources": [], "reply": "Error: The formatted documentation content is not available.", "cached": False, "answer_cache": None}
+
+    # --- Semantic answer cache: reuse the answer of a near-identical question asked before ---
+    answer_cache_vector = None
+    answer_cache_version = None
+    answer_cache_variant = ("formatted" if use_formatted_data else "chunks", k_val) # Different context, different answer
+    if endpoint_context:
+        # Same pages, same answer. Only checked when the embedding model is already loaded (warm-up), loading it just
+        # for the cache would undo the point of skipping it
+        embedding_function = get_embedding_function() if RESOURCES.is_ready("EMBEDDING_FUNCTION") else None
+        query_cache = get_query_cache()
+        answer_cache_variant = ("endpoint", tuple(retrieved_sources))
+    semantic_cache = get_answer_cache()
+    if semantic_cache is not None and embedding_function:
+        start_time_answer_cache = time.time()
+        try:
+            # Goes through the query cache, so retrieval below reuses this embedding on a miss
+            answer_cache_vector = query_cache.embed_query(embedding_function, query_text) if query_cache else embedding_function.embed_query(query_text)
+            answer_cache_version = current_index_version()
+            cached_answer = semantic_cache.lookup(answer_cache_vector, answer_cache_version, answer_cache_variant)
+        except Exception as e:
+            print(f"WARNING: SINGLE_QUERY: Answer cache lookup failed, generating normally: {e}")
+            answer_cache_vector = None
+            cached_answer = None
+        end_time_answer_cache = time.time()
+        if cached_answer:
+            print(f"✅ SINGLE_QUERY: Answer cache hit (cosine {cached_answer['similarity']:.4f} with '{cached_answer['query']}') in {end_time_answer_cache - start_time_answer_cache:.4f} seconds.")
+            end_time_single_query = time.time()
+            print(f"SINGLE_QUERY: Finished (cached answer) in {end_time_single_query - start_time_single_query:.4f} seconds.")
+            return {"prompt": None, "sources": cached_answer["sources"], "reply": cached_answer["answer"], "cached": True, "answer_cache": None}
+        print(f"SINGLE_QUERY: Answer cache miss, lookup took {end_time_answer_cache - start_time_answer_cache:.4f} seconds.")
+
+    if endpoint_context:
+        pass # Context already comes from the endpoint pages
+    elif not use_formatted_data:
+        if not db: # Redundant check if above checks are solid, but good for safety
             print("❌ SINGLE_QUERY: No DB connection available for RAG mode.")
             end_time_single_query = time.time()
             print(f"SINGLE_QUERY: Finished (DB not available for RAG path) in {end_time_single_query - start_time_single_query:.4f} seconds.")
-            def error_gen(): yield "Database not available for search."
-            return error_gen(), []
-        # Pass the global DB connection to get_contextual_chunks
+            return {"prompt": None, "sources": [], "reply": "Database not available for search.", "cached": False, "answer_cache": None}
+        # Pass the shared DB connection to get_contextual_chunks
         start_time_rag_retrieval = time.time()
-        context_docs, retrieved_ids, retrieved_sources = get_contextual_chunks(DB, query_text, k=k_val, window=4)
+        context_docs, retrieved_ids, retrieved_sources = get_contextual_chunks(db, query_text, k=k_val, window=get_context_window(), chunk_store=chunk_store, query_cache=query_cache, lexical_index=lexical_index)
         end_time_rag_retrieval = time.time()
         print(f"SINGLE_QUERY: RAG Retrieval (get_contextual_chunks) completed in {end_time_rag_retrieval - start_time_rag_retrieval:.4f} seconds.")
 
@@ -265,47 +700,37 @@ def single_query(query_text: str, use_formatted_data: bool = False, k_val:int =
             print("❌ SINGLE_QUERY: No relevant context found in the database for this query.")
             end_time_single_query = time.time()
             print(f"SINGLE_QUERY: Finished (no context found) in {end_time_single_query - start_time_single_query:.4f} seconds.")
-            def empty_gen(): yield "I couldn't find relevant information in the documentation to answer your question."
-            return empty_gen(), []
+            return {"prompt": None, "sources": [], "reply": "I couldn't find relevant information in the documentation to answer your question.", "cached": False, "answer_cache": None}
 
         start_time_context_format = time.time()
-        context_pieces = []
-        last_source = None
-        for i, doc in enumerate(context_docs):
-            current_source = doc.metadata.get("source")
-            current_content = doc.page_content
-            if i > 0:
-                if current_source != last_source:
-                    context_pieces.append("\n\n---\n\n")
-                elif current_source == last_source:
-                    context_pieces.append("\n\n")
-            context_pieces.append(current_content)
-            last_source = current_source
-        context_text = "".join(context_pieces)
+        # Merges the windows, cuts the repeated chunk overlap and fills CONTEXT_TOKEN_BUDGET best hit first
+        assembled = assemble_context(context_docs, token_budget=CONTEXT_TOKEN_BUDGET, model=LLM_MODEL_NAME)
+        context_text = assembled["text"]
+        context_docs = assembled["docs"]
+        retrieved_sources = assembled["sources"]
+        print_context_report(assembled["report"])
         end_time_context_format = time.time()
         print(f"SINGLE_QUERY: Context text formatting completed in {end_time_context_format - start_time_context_format:.4f} seconds.")
 
     else: # use_formatted_data is True
-        if not ALL_RAG_DATA: # Check if global data is loaded
+        if not all_rag_data: # Check if global data is loaded
              print("❌ SINGLE_QUERY: RagFormattedData.json was not loaded globally.")
              end_time_single_query = time.time()
              print(f"SINGLE_QUERY: Finished (formatted data not loaded) in {end_time_single_query - start_time_single_query:.4f} seconds.")
-             def error_gen(): yield "Error: Formatted data file not available."
-             return error_gen(), []
+             return {"prompt": None, "sources": [], "reply": "Error: Formatted data file not available.", "cached": False, "answer_cache": None}
 
         # Need to perform a lightweight search to find relevant source URLs first
         # We pass k=1 and window=0 because we only need the source URLs from the top few documents
         # to then look up in ALL_RAG_DATA.
         # Ensure DB is available even for this minimal lookup if your logic requires it.
-        if not DB:
+        if not db:
             print("❌ SINGLE_QUERY: DB connection needed for initial source lookup in formatted_data mode.")
             end_time_single_query = time.time()
             print(f"SINGLE_QUERY: Finished (DB not available for lookup) in {end_time_single_query - start_time_single_query:.4f} seconds.")
-            def error_gen(): yield "Database not available for initial source lookup."
-            return error_gen(), []
+            return {"prompt": None, "sources": [], "reply": "Database not available for initial source lookup.", "cached": False, "answer_cache": None}
 
         start_time_formatted_lookup = time.time()
-        temp_context_docs, _, _ = get_contextual_chunks(DB, query_text, k=k_val, window=0) # Small k, window=0
+        temp_context_docs, _, _ = get_contextual_chunks(db, query_text, k=k_val, window=0, chunk_store=chunk_store, query_cache=query_cache, lexical_index=lexical_index) # Small k, window=0
         end_time_formatted_lookup = time.time()
         print(f"SINGLE_QUERY: Formatted data source lookup (via get_contextual_chunks) completed in {end_time_formatted_lookup - start_time_formatted_lookup:.4f} seconds.")
 
@@ -313,8 +738,7 @@ def single_query(query_text: str, use_formatted_data: bool = False, k_val:int =
             print("❌ SINGLE_QUERY: No relevant base documents found for formatted data lookup.")
             end_time_single_query = time.time()
             print(f"SINGLE_QUERY: Finished (no base docs for lookup) in {end_time_single_query - start_time_single_query:.4f} seconds.")
-            def empty_gen(): yield "I couldn't find base documents to retrieve formatted context."
-            return empty_gen(), []
+            return {"prompt": None, "sources": [], "reply": "I couldn't find base documents to retrieve formatted context.", "cached": False, "answer_cache": None}
 
         start_time_formatted_build = time.time()
         context_text_pieces = ["The first page of api documentation is:\n\n"]
@@ -323,7 +747,7 @@ def single_query(query_text: str, use_formatted_data: bool = False, k_val:int =
             source_url = doc.metadata.get("source")
             if source_url and source_url not in unique_sources_used:
                 # Use the pre-loaded ALL_RAG_DATA
-                page_content = ALL_RAG_DATA.get(source_url, f"[Content for {source_url} not found in pre-loaded RagFormattedData.json]\n")
+                page_content = all_rag_data.get(source_url, f"[Content for {source_url} not found in pre-loaded RagFormattedData.json]\n")
                 context_text_pieces.append(page_content)
                 context_text_pieces.append("\n\nThe next page of api documentation is:\n\n")
                 unique_sources_used.add(source_url)
@@ -339,14 +763,13 @@ def single_query(query_text: str, use_formatted_data: bool = False, k_val:int =
         # not the full content from JSON. If you need to represent the JSON content as Document objects,
         # you'd need to construct them. For now, context_text directly holds the content.
         # For consistency, if you need context_docs to reflect the formatted data:
-        context_docs = [Document(page_content=ALL_RAG_DATA.get(src, ""), metadata={"source": src}) for src in retrieved_sources]
+        context_docs = [Document(page_content=all_rag_data.get(src, ""), metadata={"source": src}) for src in retrieved_sources]
         end_time_formatted_build = time.time()
         print(f"SINGLE_QUERY: Formatted context text building completed in {end_time_formatted_build - start_time_formatted_build:.4f} seconds.")
 
 
     start_time_prompt_format = time.time()
-    prompt_template = ChatPromptTemplate.from_template(PROMPT)
-    prompt = prompt_template.format(context=context_text, question=query_text)
+    prompt = build_llm_input(context_text, query_text)
     end_time_prompt_format = time.time()
     print(f"SINGLE_QUERY: Prompt formatting completed in {end_time_prompt_format - start_time_prompt_format:.4f} seconds.")
 
@@ -360,10 +783,40 @@ def single_query(query_text: str, use_formatted_data: bool = False, k_val:int =
     # print(f"\nFull Prompt:\n{prompt}\n") # Uncomment for debugging the full prompt
     print("-" * 30)
 
+    answer_cache = (answer_cache_vector, answer_cache_version, answer_cache_variant) if answer_cache_vector is not None else None
+    return {"prompt": prompt, "sources": retrieved_sources, "reply": None, "cached": False, "answer_cache": answer_cache}
+
+def reply_stream(rag_context: dict):
+    # Cached answers replay word by word like a live answer, errors/notices come out in one piece
+    if rag_context["cached"]:
+        yield from replay_stream(rag_context["reply"])
+    else:
+        yield rag_context["reply"]
+
+def single_query(query_text: str, use_formatted_data: bool = False, k_val:int = 4, rag_context: dict | None = None):
+    # rag_context: a build_rag_context result for this query that's already done (e.g. by speculativeRetrieval.py)
+    print(f"\nSINGLE_QUERY: Starting for query: '{query_text}' | use_formatted_data: {use_formatted_data}")
+    start_time_single_query = time.time()
+
+    if rag_context is None:
+        rag_context = build_rag_context(query_text, use_formatted_data, k_val)
+    else:
+        print("SINGLE_QUERY: Using precomputed context, skipping retrieval.")
+    if rag_context["reply"] is not None:
+        return reply_stream(rag_context), rag_context["sources"]
+    prompt = rag_context["prompt"]
+    retrieved_sources = rag_context["sources"]
+
     print("SINGLE_QUERY: Invoking LLM (stream)...")
     start_time_llm_invoke = time.time()
     try:
-        response_stream = MODEL.stream(prompt)
+        response_stream = get_model().stream(prompt)
+        answer_cache = get_answer_cache()
+        if answer_cache is not None and rag_context["answer_cache"] is not None:
+            # Stored once the stream has been fully consumed without errors
+            answer_cache_vector, answer_cache_version, answer_cache_variant = rag_context["answer_cache"]
+            response_stream = answer_cache.record_stream(response_stream, answer_cache_vector, query_text, retrieved_sources,
+                                                         answer_cache_version, answer_cache_variant)
         end_time_llm_invoke = time.time()
         print(f"✅ SINGLE_QUERY: LLM stream invocation (time until generator ready) completed in {end_time_llm_invoke - start_time_llm_invoke:.4f} seconds.")
     except Exception as e:
@@ -374,38 +827,116 @@ def single_query(query_text: str, use_formatted_data: bool = False, k_val:int =
         def error_gen(): yield f"There was an error generating the response stream: {e}"
         return error_gen(), retrieved_sources # retrieved_sources might be from RAG path
 
-    # Removed 'del db' as DB is now global and managed outside this function's lifecycle
+    # Removed 'del db' as DB is now shared and managed by RESOURCES outside this function's lifecycle
     end_time_single_query = time.time()
     print(f"SINGLE_QUERY: Finished total execution in {end_time_single_query - start_time_single_query:.4f} seconds.")
     return response_stream, retrieved_sources
 
+async def astream_answer(prompt, query_text: str, sources: list, answer_cache=None):
+    """Async token stream from Ollama. If the consumer stops early (client disconnected, task cancelled) the request
+    to Ollama gets closed too, so it stops generating for nobody."""
+    start_time_astream = time.time()
+    response_stream = get_model().astream(prompt)
+    pieces = []
+    completed = False
+    try:
+        async for piece in response_stream:
+            pieces.append(piece)
+            yield piece
+        completed = True
+    except asyncio.CancelledError:
+        print(f"⚠️ ASINGLE_QUERY: Cancelled after {len(pieces)} chunks and {time.time() - start_time_astream:.4f} seconds.")
+        raise
+    finally:
+        await response_stream.aclose()
+        if not completed and pieces:
+            print(f"⚠️ ASINGLE_QUERY: Stream closed early after {len(pieces)} chunks, answer not cached.")
+        answer = "".join(pieces)
+        semantic_cache = get_answer_cache()
+        if completed and semantic_cache is not None and answer_cache is not None and answer.strip():
+            answer_cache_vector, answer_cache_version, answer_cache_variant = answer_cache
+            semantic_cache.add(answer_cache_vector, query_text, answer, sources, answer_cache_version, answer_cache_variant)
+
+async def areply_stream(rag_context: dict):
+    for piece in reply_stream(rag_context):
+        yield piece
+
+async def asingle_query(query_text: str, use_formatted_data: bool = False, k_val: int = 4):
+    """Async single_query: returns (async token stream, sources). Retrieval (embedding, search, context assembly) is
+    CPU bound so it runs on RETRIEVAL_EXECUTOR, the LLM call is a non-blocking Ollama request, so many chat sessions can
+    share one event loop."""
+    print(f"\nASINGLE_QUERY: Starting for query: '{query_text}' | use_formatted_data: {use_formatted_data}")
+    start_time_asingle_query = time.time()
+    # Loading the LLM client is cheap, everything heavy loads on the executor thread inside build_rag_context
+    if not get_model():
+        print("❌ ASINGLE_QUERY: Global LLM (MODEL) not available.")
+        return areply_stream({"reply": "Error: The AI model is not available.", "cached": False}), []
+
+    loop = asyncio.get_running_loop()
+    rag_context = await loop.run_in_executor(RETRIEVAL_EXECUTOR, build_rag_context, query_text, use_formatted_data, k_val)
+    end_time_retrieval = time.time()
+    print(f"ASINGLE_QUERY: Context ready in {end_time_retrieval - start_time_asingle_query:.4f} seconds.")
+    if rag_context["reply"] is not None:
+        return areply_stream(rag_context), rag_context["sources"]
+    return astream_answer(rag_context["prompt"], query_text, rag_context["sources"], rag_context["answer_cache"]), rag_context["sources"]
+
+
 # --- Main execution for command line testing ---
 def main():
     print("MAIN: Starting contextModel script...")
     start_time_main = time.time()
 
     parser = argparse.ArgumentParser(description="Query the AI Documentation Chatbot.")
-    parser.add_argument("query_text", type=str, help="The question to ask the chatbot.")
+    parser.add_argument("query_text", type=str, nargs="?", default=None, help="The question to ask the chatbot.")
     parser.add_argument("--formatted", action="store_true", help="Use formatted RAG data.") # Added option
+    parser.add_argument("--batch", type=str, default=None, help="Text file with one question per line, answered with batch_query.")
+    parser.add_argument("--retrieve-only", action="store_true", help="With --batch, only run batch_retrieve (no LLM).")
+    parser.add_argument("--concurrent", action="store_true", help="With --batch, answer every question concurrently with asingle_query.")
+    parser.add_argument("--status", action="store_true", help="Print which resources got loaded and how long each took.")
 
     args = parser.parse_args()
     query_text = args.query_text
     use_formatted = args.formatted # Get the flag
 
-    # Ensure global resources are loaded before first query,
-    # which they will be if this script is run directly or imported.
-    # The global initialization block runs automatically on import.
-    if not MODEL or not EMBEDDING_FUNCTION:
+    if args.batch:
+        with open(args.batch, 'r', encoding='utf-8') as f:
+            batch_questions = [line.strip() for line in f if line.strip()]
+        if args.concurrent:
+            async def answer_all():
+                async def answer(question):
+                    stream, answer_sources = await asingle_query(question)
+                    return "".join([piece async for piece in stream]), answer_sources
+                return await asyncio.gather(*(answer(question) for question in batch_questions))
+            for question, (answer, batch_sources) in zip(batch_questions, asyncio.run(answer_all())):
+                print(f"\n{'-' * 30}\nQ: {question}\nA: {answer}\nSources: {batch_sources}")
+        elif args.retrieve_only:
+            retrievals, _ = batch_retrieve(batch_questions, k=4, window=get_context_window(), db_conn=get_db(), chunk_store=get_chunk_store(),
+                                           query_cache=get_query_cache(), lexical_index=get_lexical_index())
+            for question, (_, _, batch_sources) in zip(batch_questions, retrievals):
+                print(f"\n{question}\n  -> {batch_sources}")
+        else:
+            for question, (answer, batch_sources) in zip(batch_questions, batch_query(batch_questions)):
+                print(f"\n{'-' * 30}\nQ: {question}\nA: {answer}\nSources: {batch_sources}")
+        end_time_main = time.time()
+        print(f"MAIN: Batch of {len(batch_questions)} finished in {end_time_main - start_time_main:.4f} seconds.")
+        if args.status:
+            RESOURCES.print_status()
+        return
+    if not query_text:
+        parser.error("query_text is required unless --batch is given")
+
+    # Resources load on first use now, so these checks are what actually loads them for a CLI run
+    if not get_model() or not get_embedding_function():
         print("Critical error: Core models (LLM or Embedding) not initialized. Exiting.")
         end_time_main = time.time()
         print(f"MAIN: Finished (critical init error) in {end_time_main - start_time_main:.4f} seconds.")
         return
-    if not DB and not use_formatted:
+    if not get_db() and not use_formatted:
          print("Critical error: DB not initialized and not using formatted data. Exiting.")
          end_time_main = time.time()
          print(f"MAIN: Finished (critical DB error) in {end_time_main - start_time_main:.4f} seconds.")
          return
-    if use_formatted and not ALL_RAG_DATA:
+    if use_formatted and not get_rag_data():
          print("Critical error: Formatted data requested but not loaded. Exiting.")
          end_time_main = time.time()
          print(f"MAIN: Finished (critical formatted data error) in {end_time_main - start_time_main:.4f} seconds.")
@@ -449,6 +980,8 @@ def main():
 
     end_time_main = time.time()
     print(f"MAIN: Script execution finished in {end_time_main - start_time_main:.4f} seconds.")
+    if args.status:
+        RESOURCES.print_status()
 
 
 if __name__ == "__main__":
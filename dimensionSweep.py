@@ -0,0 +1,115 @@
+# dimensionSweep.py
+
+# Figures out how small EMBED_TRUNCATE_DIM in embeddingsMain.py can go before answers get worse.
+# Takes the full 1536-dim vectors already in Chroma, rebuilds a numpy index for every candidate size (truncated and
+# renormalized, exactly what TruncatedEmbeddings produces), and checks recall@k against the full-dimension results.
+# Usage: python dimensionSweep.py --dims 256,512,1024 --k 4
+
+import argparse
+import os
+import shutil
+import time
+import numpy as np
+from langchain_chroma import Chroma
+from embeddingsMain import CHROMADATAPATH, EMBED_TRUNCATE_DIM, get_embed_function, truncate_and_normalize
+from vectorEngine import DEFAULT_BENCH_QUERIES, NumpyVectorStore, build_vector_index
+
+SWEEP_INDEX_PATH = 'dimensionSweep'
+TARGET_RECALL = 0.95 # Smallest size at or above this gets recommended
+
+
+# Looks enough like Chroma for build_vector_index, but serves the already-fetched (and maybe truncated) vectors
+class _TruncatedExport:
+
+    def __init__(self, data: dict, dim: int | None):
+        self.data = dict(data)
+        if dim is not None:
+            self.data["embeddings"] = truncate_and_normalize(data["embeddings"], dim)
+
+    def get(self, include=None):
+        return self.data
+
+
+def run_sweep(dims: list[int], queries: list[str], k: int = 4, repeats: int = 5, keep_indexes: bool = False):
+    if EMBED_TRUNCATE_DIM:
+        print(f"❌ DIMENSION_SWEEP: EMBED_TRUNCATE_DIM is set to {EMBED_TRUNCATE_DIM}, the sweep needs a DB built at full size.")
+        return []
+
+    embedder = get_embed_function(truncate_dim=None)
+    chroma_db = Chroma(persist_directory=CHROMADATAPATH, embedding_function=embedder)
+    data = chroma_db.get(include=["embeddings", "documents", "metadatas"])
+    if not data["ids"]:
+        print("❌ DIMENSION_SWEEP: The Chroma DB is empty.")
+        return []
+    full_dim = len(data["embeddings"][0])
+
+    print(f"DIMENSION_SWEEP: Embedding {len(queries)} queries at full size ({full_dim} dims)...")
+    query_vectors = np.asarray([embedder.embed_query(query) for query in queries], dtype=np.float32)
+
+    # Ground truth is the full-size index with the same distance Chroma uses, i.e. what we serve today
+    build_vector_index(_TruncatedExport(data, None), os.path.join(SWEEP_INDEX_PATH, "full"))
+    full_store = NumpyVectorStore(os.path.join(SWEEP_INDEX_PATH, "full"))
+    expected_rows, _ = full_store.search_vectors_exact(query_vectors, k)
+    expected = [set(full_store.ids[row] for row in rows) for rows in expected_rows]
+
+    results = []
+    for dim in sorted(set(dims + [full_dim])):
+        if dim > full_dim:
+            print(f"⚠️ DIMENSION_SWEEP: Skipping {dim}, the model only outputs {full_dim} dims.")
+            continue
+        index_dir = os.path.join(SWEEP_INDEX_PATH, f"dim_{dim}")
+        build_vector_index(_TruncatedExport(data, dim), index_dir)
+        store = NumpyVectorStore(index_dir)
+        truncated_queries = truncate_and_normalize(query_vectors, dim)
+
+        timings = []
+        recall_total = 0.0
+        for query_vector, wanted in zip(truncated_queries, expected):
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                rows, _ = store.search_vectors(query_vector, k)
+                timings.append(time.perf_counter() - start_time)
+            recall_total += len(set(store.ids[row] for row in rows[0]) & wanted) / max(1, len(wanted))
+
+        results.append({
+            "dim": dim,
+            "recall": recall_total / len(queries),
+            "p50_ms": float(np.percentile(timings, 50)) * 1000,
+            "index_mb": store.resident_bytes() / 1e6,
+        })
+
+    if not keep_indexes:
+        shutil.rmtree(SWEEP_INDEX_PATH, ignore_errors=True)
+    return results
+
+
+def print_results(results: list[dict], k: int):
+    print("\n" + "-" * 50)
+    print(f"{'dims':>6} {f'recall@{k}':>10} {'p50 ms':>10} {'index MB':>10}")
+    for result in results:
+        print(f"{result['dim']:>6} {result['recall']:>10.3f} {result['p50_ms']:>10.3f} {result['index_mb']:>10.2f}")
+    print("-" * 50)
+    good_enough = [result for result in results if result["recall"] >= TARGET_RECALL]
+    if good_enough:
+        best = min(good_enough, key=lambda result: result["dim"])
+        print(f"Smallest size with recall@{k} >= {TARGET_RECALL}: {best['dim']} (set EMBED_TRUNCATE_DIM = {best['dim']} and rebuild)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep embedding truncation sizes and compare recall/latency against full size.")
+    parser.add_argument("--dims", type=str, default="256,512,1024", help="Comma separated sizes to try.")
+    parser.add_argument("--k", type=int, default=4, help="Top k to compare.")
+    parser.add_argument("--queries", type=str, default=None, help="Text file with one query per line.")
+    parser.add_argument("--keep-indexes", action="store_true", help=f"Keep the per-size indexes in {SWEEP_INDEX_PATH}/.")
+    args = parser.parse_args()
+
+    queries = DEFAULT_BENCH_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    dims = [int(value) for value in args.dims.split(",") if value.strip()]
+    print_results(run_sweep(dims, queries, k=args.k, keep_indexes=args.keep_indexes), args.k)
+
+
+if __name__ == "__main__":
+    main()
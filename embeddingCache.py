@@ -0,0 +1,212 @@
+# embeddingCache.py
+
+# Persistent cache that sits in front of an embedding function so we never compute the same vector twice.
+# Vectors live in a memory-mapped float32 file, and a small sqlite db maps text hashes to slots in that file.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- Constants ---
+EMBEDDING_CACHE_DIR = 'embeddingCache'
+DEFAULT_MAX_CACHE_BYTES = 2 * 1024 ** 3 # 2 GB of vectors (~350k vectors at 1536 dims)
+SQLITE_BATCH_SIZE = 500 # Max number of hashes per "IN (...)" query
+
+
+def make_namespace(key_parts: dict) -> str:
+    # Everything that changes what vector a text maps to (model, encode kwargs, ...) goes into the namespace
+    return hashlib.sha256(json.dumps(key_parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def embed_query_batch(embedder, texts: list[str]) -> list[list[float]]:
+    # Many queries in one forward pass instead of one embed_query call each
+    if not texts:
+        return []
+    if hasattr(embedder, "embed_queries"):
+        return embedder.embed_queries(texts)
+    if hasattr(embedder, "encode_kwargs") and not getattr(embedder, "query_encode_kwargs", None):
+        # HuggingFaceEmbeddings embeds queries exactly like documents unless query_encode_kwargs is set
+        return embedder.embed_documents(texts)
+    return [embedder.embed_query(text) for text in texts]
+
+
+def hash_text(kind: str, text: str) -> str:
+    # kind is "doc" or "query" since the model can encode them differently
+    return hashlib.sha256(f"{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+
+    def __init__(self, inner: Embeddings, key_parts: dict, cache_dir: str = EMBEDDING_CACHE_DIR, max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        self.inner = inner
+        self.key_parts = key_parts
+        self.namespace = make_namespace(key_parts)
+        self.store_dir = os.path.join(cache_dir, self.namespace)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._vectors = None # np.memmap, opened once we know the dimension
+        self._dim = None
+        self._capacity = None
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.store_dir, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (text_hash TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('key_parts', ?)", (json.dumps(key_parts, sort_keys=True, default=str),))
+        self._conn.commit()
+
+        dim = self._get_meta("dim")
+        if dim is not None:
+            self._open_vectors(int(dim))
+
+    # Lets callers still reach things on the wrapped embedder (e.g. the tokenizer on the sentence-transformers client)
+    def __getattr__(self, name):
+        inner = self.__dict__.get("inner")
+        if inner is None:
+            raise AttributeError(name)
+        return getattr(inner, name)
+
+    def _get_meta(self, key: str):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def _open_vectors(self, dim: int):
+        self._dim = dim
+        self._capacity = max(1, self.max_bytes // (dim * 4))
+        path = os.path.join(self.store_dir, "vectors.f32")
+        stored_capacity = self._get_meta("capacity")
+        if os.path.exists(path) and stored_capacity is not None and int(stored_capacity) == self._capacity:
+            self._vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(self._capacity, dim))
+        else:
+            # First use (or the size limit changed), start a fresh file. It's sparse so it only uses disk as it fills up
+            self._conn.execute("DELETE FROM entries")
+            self._vectors = np.memmap(path, dtype=np.float32, mode="w+", shape=(self._capacity, dim))
+            self._set_meta("dim", dim)
+            self._set_meta("capacity", self._capacity)
+            self._set_meta("next_slot", 0)
+            self._conn.commit()
+
+    def _lookup(self, hashes: list[str]) -> dict[str, int]:
+        slots = {}
+        for i in range(0, len(hashes), SQLITE_BATCH_SIZE):
+            batch = hashes[i:i + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(f"SELECT text_hash, slot FROM entries WHERE text_hash IN ({placeholders})", batch).fetchall()
+            slots.update(rows)
+        return slots
+
+    def _allocate_slots(self, count: int) -> list[int]:
+        next_slot = int(self._get_meta("next_slot") or 0)
+        fresh = min(count, self._capacity - next_slot)
+        slots = list(range(next_slot, next_slot + fresh))
+        self._set_meta("next_slot", next_slot + fresh)
+
+        # Cache is full, evict the least recently used entries and reuse their slots
+        needed = count - fresh
+        if needed > 0:
+            evicted = self._conn.execute("SELECT text_hash, slot FROM entries ORDER BY last_used LIMIT ?", (needed,)).fetchall()
+            self._conn.executemany("DELETE FROM entries WHERE text_hash = ?", [(text_hash,) for text_hash, _ in evicted])
+            slots.extend(slot for _, slot in evicted)
+            self.evictions += len(evicted)
+        return slots
+
+    def _store(self, hashes: list[str], vectors: list[list[float]]):
+        if not hashes:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        if self._vectors is None:
+            self._open_vectors(array.shape[1])
+        # Another thread may have stored the same text while the model ran (the lookup happened under an earlier lock).
+        # Giving it a second slot would leave the first one pointed to by nothing and never evicted
+        stored = self._lookup(hashes)
+        if stored:
+            keep = [i for i, h in enumerate(hashes) if h not in stored]
+            if not keep:
+                return
+            hashes = [hashes[i] for i in keep]
+            array = array[keep]
+        # Never try to cache more than fits
+        hashes = hashes[-self._capacity:]
+        array = array[-self._capacity:]
+        slots = self._allocate_slots(len(hashes))
+        self._vectors[slots] = array
+        self._vectors.flush()
+        now = time.time()
+        self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", [(h, slot, now) for h, slot in zip(hashes, slots)])
+        self._conn.commit()
+
+    def _embed_cached(self, kind: str, texts: list[str], compute) -> list[list[float]]:
+        hashes = [hash_text(kind, text) for text in texts]
+        with self._lock:
+            slots = self._lookup(list(dict.fromkeys(hashes))) if self._vectors is not None else {}
+            results = [None] * len(texts)
+            for i, h in enumerate(hashes):
+                if h in slots:
+                    results[i] = self._vectors[slots[h]].tolist()
+            if slots:
+                now = time.time()
+                self._conn.executemany("UPDATE entries SET last_used = ? WHERE text_hash = ?", [(now, h) for h in slots])
+                self._conn.commit()
+
+        # Only run the model on texts we haven't seen (and only once per duplicate text)
+        missing = {}
+        for i, h in enumerate(hashes):
+            if results[i] is None:
+                missing.setdefault(h, []).append(i)
+        hit_count = len(texts) - sum(len(positions) for positions in missing.values())
+
+        if missing:
+            missing_hashes = list(missing)
+            computed = compute([texts[missing[h][0]] for h in missing_hashes])
+            for h, vector in zip(missing_hashes, computed):
+                for i in missing[h]:
+                    results[i] = list(vector)
+            with self._lock:
+                self._store(missing_hashes, computed)
+
+        with self._lock:
+            self.hits += hit_count
+            self.misses += len(texts) - hit_count
+        return results
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed_cached("doc", texts, self.inner.embed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed_cached("query", [text], lambda missing: [self.inner.embed_query(missing[0])])[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        return self._embed_cached("query", texts, lambda missing: embed_query_batch(self.inner, missing))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "namespace": self.namespace,
+                "entries": entries,
+                "capacity": self._capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"EMBEDDING_CACHE: {stats['hits']} hits / {stats['misses']} misses "
+              f"(hit rate {stats['hit_rate']:.1%}), {stats['entries']} cached vectors, {stats['evictions']} evictions.")
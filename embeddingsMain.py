@@ -1,39 +1,135 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain.schema.document import Document
-import torch
+from langchain_core.embeddings import Embeddings
+from embeddingCache import CachedEmbeddings, embed_query_batch
+from formattingData import build_endpoint_index, save_endpoint_index, split_formatted_sections
+from lexicalIndex import build_lexical_index
 import os
 import shutil
 import stat
 import json
-import re # <-- re was imported but not used, can be kept or removed
+import re
+import hashlib
+import time
+import numpy as np
 from tqdm import tqdm # <-- Import tqdm for progress bars
 
-# Check PyTorch version and CUDA availability
-print(f"PyTorch version: {torch.__version__}")
-print(f"CUDA available: {torch.cuda.is_available()}")
-
 # device = "cuda" if torch.cuda.is_available() else "cpu"
 device = "cpu" # Force CPU as per original code
-print(f"Using device: {device}") # Confirm which device is used
 
 # Random constants (mostly configuration)
 CHROMADATAPATH = 'chromaDb' # Path for the Chroma database
+INPUT_JSON_PATH = "ScrapingStuff/storedData/RagFormattedData.json" # Formatted data (output of formattingData.py)
+MANIFEST_PATH = os.path.join(CHROMADATAPATH, 'chunkManifest.json') # Per-chunk content hashes for incremental re-indexing
 model_name = "Alibaba-NLP/gte-Qwen2-1.5B-instruct" # Embedding model
 model_kwargs = {'device': device, 'trust_remote_code': True}
 encode_kwargs = {'normalize_embeddings': False}
 
+# "structure": chunks follow the sections formattingData.py writes (overview, request parameters, responses, models) so a
+# parameter list or response table doesn't get cut in half. "recursive": the original fixed-size 514 character splitter
+CHUNKING_MODE = "structure"
+STRUCTURED_CHUNK_SIZE = 1500 # Sections longer than this get split on parameter/response/property boundaries
+MIN_SECTION_PIECE_CHARS = 100 # Pieces shorter than this get merged into the next piece of the same section
+
+# Reuse vectors we've already computed (see embeddingCache.py)
+USE_EMBEDDING_CACHE = True
+
 # Batching is just for the progress bar so I know how close I am to finishing
 CHROMA_ADD_BATCH_SIZE = 64
+# Embedding batches are built by token count instead (batch size * longest chunk in the batch, padding included)
+MAX_BATCH_TOKENS = 8192
+
+# Keep only the first N dimensions of each vector (None = full 1536). Smaller index and faster search, see dimensionSweep.py
+# to pick a size. Changing this needs a full rebuild (CLEAR_DB_ON_START = True) since the stored vectors change size
+EMBED_TRUNCATE_DIM = None
+
+# Which runtime computes the embeddings: "torch" (sentence-transformers), "onnx" or "onnx-int8" (see onnxEmbeddings.py,
+# run "python onnxEmbeddings.py --parity" first to check the vectors match the PyTorch ones)
+EMBED_BACKEND = "torch"
 
 # Embedding Function
-def get_embed_function():
-    return HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs=model_kwargs,
-        encode_kwargs=encode_kwargs
-    )
+def get_embed_function(use_cache: bool = USE_EMBEDDING_CACHE, truncate_dim: int | None = EMBED_TRUNCATE_DIM, backend: str = EMBED_BACKEND):
+    if backend == "torch":
+        # Imported here so importing this module (contextModel, queryCache, ...) doesn't pull in torch and sentence-transformers
+        import torch
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        # Check PyTorch version and CUDA availability
+        print(f"PyTorch version: {torch.__version__}")
+        print(f"CUDA available: {torch.cuda.is_available()}")
+        print(f"Using device: {device}") # Confirm which device is used
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs=model_kwargs,
+            encode_kwargs=encode_kwargs
+        )
+    elif backend in ("onnx", "onnx-int8"):
+        from onnxEmbeddings import OnnxEmbeddings # Optional dependency, only imported when it's actually used
+        embeddings = OnnxEmbeddings(
+            model_name,
+            quantize=backend == "onnx-int8",
+            normalize=encode_kwargs.get("normalize_embeddings", False)
+        )
+    else:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected 'torch', 'onnx' or 'onnx-int8'.")
+
+    if use_cache:
+        # Keyed by everything that changes the output vectors, so switching models/settings never serves stale vectors
+        key_parts = {"model_name": model_name, "encode_kwargs": encode_kwargs}
+        if backend != "torch":
+            key_parts["backend"] = backend # Left out for torch so vectors cached before this option still get used
+        embeddings = CachedEmbeddings(embeddings, key_parts=key_parts)
+    if truncate_dim:
+        # Truncating outside the cache means the cached full vectors work for every truncation size
+        embeddings = TruncatedEmbeddings(embeddings, truncate_dim)
+    return embeddings
+
+
+# Everything that decides what the stored vectors look like (saved in the manifest so a mismatch gets caught).
+# Pass the embedder that is actually used so the dimension it truncates to gets recorded, not just EMBED_TRUNCATE_DIM
+def get_embedding_config(backend: str = EMBED_BACKEND, embedder=None) -> dict:
+    truncate_dim = EMBED_TRUNCATE_DIM
+    if embedder is not None:
+        truncate_dim = embedder.dim if isinstance(embedder, TruncatedEmbeddings) else None
+    config = {"model_name": model_name, "encode_kwargs": encode_kwargs, "truncate_dim": truncate_dim}
+    if backend != "torch":
+        config["backend"] = backend # Left out for torch (like the cache key) so manifests from before this option still match
+    return config
+
+
+# Keeps the first dim values of each vector and rescales them back to unit length
+def truncate_and_normalize(vectors, dim: int) -> np.ndarray:
+    truncated = np.atleast_2d(np.asarray(vectors, dtype=np.float32))[:, :dim]
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    return truncated / np.maximum(norms, 1e-12)
+
+
+class TruncatedEmbeddings(Embeddings):
+
+    def __init__(self, inner: Embeddings, dim: int):
+        self.inner = inner
+        self.dim = dim
+
+    # Lets callers still reach things on the wrapped embedder (tokenizer, cache stats, ...)
+    def __getattr__(self, name):
+        inner = self.__dict__.get("inner")
+        if inner is None:
+            raise AttributeError(name)
+        return getattr(inner, name)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return truncate_and_normalize(self.inner.embed_documents(texts), self.dim).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return truncate_and_normalize(self.inner.embed_query(text), self.dim)[0].tolist()
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return truncate_and_normalize(embed_query_batch(self.inner, texts), self.dim).tolist()
 
 # Adding stuff the chroma database (also has progress bar)
 def add_to_chroma(chunks: list[Document]):
@@ -64,34 +160,306 @@ def add_to_chroma(chunks: list[Document]):
 
     # Addding the new chunks to the database
     if len(new_chunks):
-        print(f"Adding {len(new_chunks)} new documents in batches of {CHROMA_ADD_BATCH_SIZE}...")
-
-        # Using tqdm for the progress bar over batches (i is the batches of chunks)
-        for i in tqdm(range(0, len(new_chunks), CHROMA_ADD_BATCH_SIZE), desc="Adding to ChromaDB"):
-            # Get the current batch of chunks
-            batch = new_chunks[i:i + CHROMA_ADD_BATCH_SIZE]
-            if not batch: # Should not happen with range logic, but safety check
-                continue
-
-            # Get the corresponding IDs for this batch
-            batch_ids = [chunk.metadata["id"] for chunk in batch]
-
-            # Add the current batch to ChromaDB
-            # Embedding happens inside this call for the batch
-            try:
-                db.add_documents(batch, ids=batch_ids)
-            except Exception as e:
-                 print(f"\nError adding batch starting at index {i} to ChromaDB: {e}")
-
+        print(f"Adding {len(new_chunks)} new documents...")
+        add_chunks_in_batches(db, new_chunks)
         print("✅ New documents added successfully.")
 
     else:
         # No new documents found
         print("✅ No new documents to add.")
 
+    # Keep the manifest in line with what's actually in the db so incremental runs can pick up from here
+    save_manifest(build_manifest_from_db(db), changed=bool(new_chunks), embedder=db.embeddings)
+
     return db # Return the database client
 
 
+# Embeds and adds chunks to the db. Chunks get grouped by token length first so each batch has as little padding as possible
+def add_chunks_in_batches(db: Chroma, chunks: list[Document], desc: str = "Adding to ChromaDB"):
+    texts = [chunk.page_content for chunk in chunks]
+    vectors = embed_with_token_batches(db.embeddings, texts, desc=desc)
+
+    # Chunks from batches that failed come back as None, skip them (and hand their ids back to the caller)
+    embedded = [(chunk, vector) for chunk, vector in zip(chunks, vectors) if vector is not None]
+    failed_ids = [chunk.metadata["id"] for chunk, vector in zip(chunks, vectors) if vector is None]
+    try:
+        upsert_embedded_chunks(db, [chunk for chunk, _ in embedded], [vector for _, vector in embedded])
+    except Exception as e:
+         print(f"\nError adding chunks to ChromaDB: {e}")
+         failed_ids = [chunk.metadata["id"] for chunk in chunks]
+    return failed_ids
+
+
+_TOKENIZER = None # Loaded on first use by get_tokenizer
+
+# Tokenizer of the embedding model (taken from the loaded model if we have it, so it doesn't get loaded twice)
+def get_tokenizer(embedder=None):
+    global _TOKENIZER
+    if getattr(embedder, "tokenizer", None) is not None: # ONNX backend
+        return embedder.tokenizer
+    client = getattr(embedder, "_client", None) if embedder is not None else None
+    if getattr(client, "tokenizer", None) is not None:
+        return client.tokenizer
+    if _TOKENIZER is None:
+        try:
+            from transformers import AutoTokenizer
+            _TOKENIZER = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+        except Exception as e:
+            print(f"Warning: Could not load the tokenizer for {model_name}, estimating token lengths from characters: {e}")
+            return None
+    return _TOKENIZER
+
+
+def get_token_lengths(texts: list[str], tokenizer=None) -> list[int]:
+    if tokenizer is None:
+        return [max(1, len(text) // 4) for text in texts] # Rough estimate, ~4 characters per token
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=True)["input_ids"]]
+
+
+# Groups text indexes into batches of similar token length, each batch under max_tokens once padded
+def plan_token_batches(lengths: list[int], max_tokens: int = MAX_BATCH_TOKENS, max_batch_size: int | None = None) -> list[list[int]]:
+    batches = []
+    current = []
+    longest = 0
+    for i in sorted(range(len(lengths)), key=lambda index: lengths[index]):
+        new_longest = max(longest, lengths[i])
+        too_many_tokens = new_longest * (len(current) + 1) > max_tokens
+        too_many_texts = max_batch_size is not None and len(current) >= max_batch_size
+        if current and (too_many_tokens or too_many_texts):
+            batches.append(current)
+            current = []
+            new_longest = lengths[i]
+        current.append(i)
+        longest = new_longest
+    if current:
+        batches.append(current)
+    return batches
+
+
+# Fraction of the tokens in the forward passes that are just padding
+def padding_waste(lengths: list[int], batches: list[list[int]]) -> float:
+    real_tokens = sum(lengths[i] for batch in batches for i in batch)
+    padded_tokens = sum(max(lengths[i] for i in batch) * len(batch) for batch in batches if batch)
+    return 1 - real_tokens / padded_tokens if padded_tokens else 0.0
+
+
+# Same batches as the old fixed-count loop (document order), just so we can compare the padding waste
+def fixed_count_batches(count: int, batch_size: int = CHROMA_ADD_BATCH_SIZE) -> list[list[int]]:
+    return [list(range(i, min(i + batch_size, count))) for i in range(0, count, batch_size)]
+
+
+# Embeds the texts in token-budgeted batches and returns the vectors back in the original order
+def embed_with_token_batches(embedder, texts: list[str], tokenizer=None, max_tokens: int = MAX_BATCH_TOKENS, desc: str | None = None) -> list:
+    if tokenizer is None:
+        tokenizer = get_tokenizer(embedder)
+    lengths = get_token_lengths(texts, tokenizer)
+    batches = plan_token_batches(lengths, max_tokens)
+    if desc:
+        print(f"Embedding {len(texts)} chunks in {len(batches)} token-budgeted batches (padding waste {padding_waste(lengths, batches):.1%}, "
+              f"was {padding_waste(lengths, fixed_count_batches(len(texts))):.1%} with fixed batches of {CHROMA_ADD_BATCH_SIZE})...")
+
+    vectors = [None] * len(texts)
+    for batch in (tqdm(batches, desc=desc) if desc else batches):
+        try:
+            batch_vectors = embedder.embed_documents([texts[i] for i in batch])
+        except Exception as e:
+            print(f"\nError embedding batch of {len(batch)} chunks: {e}")
+            continue
+        for i, vector in zip(batch, batch_vectors):
+            vectors[i] = np.asarray(vector, dtype=np.float32) # Much smaller than a list of python floats
+    return vectors
+
+
+# Writes chunks whose vectors we already have straight into the collection (no model call)
+def upsert_embedded_chunks(db: Chroma, chunks: list[Document], embeddings: list[list[float]]):
+    if not chunks:
+        return
+    for i in range(0, len(chunks), CHROMA_ADD_BATCH_SIZE):
+        batch = chunks[i:i + CHROMA_ADD_BATCH_SIZE]
+        db._collection.upsert(
+            ids=[chunk.metadata["id"] for chunk in batch],
+            embeddings=[np.asarray(vec, dtype=np.float32).tolist() for vec in embeddings[i:i + CHROMA_ADD_BATCH_SIZE]],
+            metadatas=[chunk.metadata for chunk in batch],
+            documents=[chunk.page_content for chunk in batch]
+        )
+
+
+# Hash of a chunk's text plus its metadata (minus the positional id) so we can tell if it changed
+def hash_chunk(chunk: Document) -> str:
+    meta = {key: val for key, val in chunk.metadata.items() if key != "id"}
+    payload = chunk.page_content + "\x00" + json.dumps(meta, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Manifest format: {"version": int, "updated": timestamp, "sources": {source: [hash of chunk 0, hash of chunk 1, ...]}}
+def load_manifest() -> dict | None:
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("sources"), dict):
+            print(f"Warning: Manifest at {MANIFEST_PATH} is malformed, ignoring it.")
+            return None
+        return manifest
+    except Exception as e:
+        print(f"Warning: Could not read manifest at {MANIFEST_PATH}: {e}")
+        return None
+
+
+# changed=False: nothing was written to or deleted from the db, keep the version so caches/indexes built on it stay valid
+def save_manifest(manifest: dict, changed: bool = True, embedder=None):
+    previous = load_manifest()
+    previous_version = previous.get("version", 0) if previous else 0
+    manifest["version"] = previous_version + 1 if changed or not previous_version else previous_version
+    manifest["updated"] = time.time()
+    manifest.setdefault("embedding_config", get_embedding_config(embedder=embedder))
+    manifest.setdefault("chunking_mode", CHUNKING_MODE) # Query time picks its neighbor window from how the db was chunked
+    os.makedirs(CHROMADATAPATH, exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, MANIFEST_PATH) # Atomic swap so a crash never leaves half a manifest
+
+
+# Bumped every time the db contents change, so anything built from the db (indexes, caches) can tell when it's stale
+def get_index_version() -> int | None:
+    manifest = load_manifest()
+    return manifest.get("version") if manifest else None
+
+
+# How the stored chunks were made ("structure" or "recursive"), None without a manifest
+def get_stored_chunking_mode() -> str | None:
+    manifest = load_manifest()
+    if manifest is None:
+        return None
+    # Manifests from before the mode was recorded were all written by the fixed-size splitter
+    return manifest.get("chunking_mode", "recursive")
+
+
+# Rebuilds the manifest from whatever is already stored (used when there's no manifest yet, no embedding needed)
+def build_manifest_from_db(db: Chroma) -> dict:
+    stored = db.get(include=["documents", "metadatas"])
+    by_source = {}
+    for chunk_id, text, meta in zip(stored.get("ids", []), stored.get("documents", []), stored.get("metadatas", [])):
+        if text is None or meta is None:
+            continue
+        source, _, index = chunk_id.rpartition(":")
+        if not index.isdigit():
+            continue
+        by_source.setdefault(source, {})[int(index)] = hash_chunk(Document(page_content=text, metadata=meta))
+
+    sources = {}
+    for source, hashes_by_index in by_source.items():
+        # A gap in the indexes means a chunk is missing, leave it blank so it never matches
+        sources[source] = [hashes_by_index.get(i, "") for i in range(max(hashes_by_index) + 1)]
+    return {"sources": sources}
+
+
+# Loads the manifest, but doesn't trust it if it doesn't match what's actually in the db
+def load_or_rebuild_manifest(db: Chroma) -> dict:
+    manifest = load_manifest()
+    stored_count = db._collection.count()
+    if manifest is None or sum(len(hashes) for hashes in manifest["sources"].values()) != stored_count:
+        print(f"Manifest missing or out of sync with the DB ({stored_count} stored chunks), rebuilding it from stored documents...")
+        manifest = build_manifest_from_db(db)
+    # Vectors made with different settings can't be mixed in one collection
+    stored_config = manifest.get("embedding_config")
+    current_config = get_embedding_config(embedder=db.embeddings) # The embedder this run will write with
+    if stored_config is not None and stored_config != json.loads(json.dumps(current_config)):
+        raise ValueError(f"The DB was built with embedding settings {stored_config} but the current settings are "
+                         f"{current_config}. Do a full rebuild (CLEAR_DB_ON_START = True).")
+    return manifest
+
+
+# Incremental version of add_to_chroma: only embeds new/changed chunks and removes stale ids
+def sync_to_chroma(chunks: list[Document]):
+
+    db = Chroma(
+        persist_directory=CHROMADATAPATH,
+        embedding_function=get_embed_function()
+    )
+
+    chunks_with_ids = calculate_chunk_ids(chunks)
+
+    old_sources = load_or_rebuild_manifest(db)["sources"]
+
+    # Grouping the new chunks by source (chunk ids are positional within a source)
+    new_sources = {}
+    for chunk in chunks_with_ids:
+        new_sources.setdefault(chunk.metadata.get("source", "unknown_source"), []).append(chunk)
+
+    new_manifest_sources = {}
+    to_embed = [] # Chunks with content we've never embedded
+    to_reuse = [] # (chunk, old id that already has the same content's vector)
+    stale_ids = []
+    unchanged_count = 0
+
+    for source, source_chunks in new_sources.items():
+        new_hashes = [hash_chunk(chunk) for chunk in source_chunks]
+        old_hashes = old_sources.get(source, [])
+        new_manifest_sources[source] = new_hashes
+
+        if new_hashes == old_hashes:
+            unchanged_count += len(new_hashes)
+            continue
+
+        # Edits shift every later chunk's id, so reuse the stored vector wherever the same content already exists
+        old_index_by_hash = {}
+        for old_index, old_hash in enumerate(old_hashes):
+            old_index_by_hash.setdefault(old_hash, old_index)
+
+        for index, (chunk, chunk_hash) in enumerate(zip(source_chunks, new_hashes)):
+            if index < len(old_hashes) and old_hashes[index] == chunk_hash:
+                unchanged_count += 1
+            elif chunk_hash in old_index_by_hash:
+                to_reuse.append((chunk, f"{source}:{old_index_by_hash[chunk_hash]}"))
+            else:
+                to_embed.append(chunk)
+
+        # The source got shorter, so the ids past the new end are stale
+        stale_ids.extend(f"{source}:{i}" for i in range(len(new_hashes), len(old_hashes)))
+
+    # Sources that disappeared completely
+    removed_sources = [source for source in old_sources if source not in new_sources]
+    for source in removed_sources:
+        stale_ids.extend(f"{source}:{i}" for i in range(len(old_sources[source])))
+
+    print(f"Incremental sync: {unchanged_count} unchanged, {len(to_reuse)} moved (reusing vectors), "
+          f"{len(to_embed)} new/changed, {len(stale_ids)} stale ids, {len(removed_sources)} removed sources.")
+
+    # Grab the vectors to reuse BEFORE writing anything, since the upserts below can overwrite those ids
+    if to_reuse:
+        reuse_ids = list(dict.fromkeys(old_id for _, old_id in to_reuse))
+        stored = db.get(ids=reuse_ids, include=["embeddings"])
+        vectors_by_id = dict(zip(stored["ids"], stored["embeddings"]))
+        reuse_chunks = []
+        reuse_vectors = []
+        for chunk, old_id in to_reuse:
+            if old_id in vectors_by_id:
+                reuse_chunks.append(chunk)
+                reuse_vectors.append(vectors_by_id[old_id])
+            else:
+                to_embed.append(chunk) # Vector went missing somehow, just embed it again
+        upsert_embedded_chunks(db, reuse_chunks, reuse_vectors)
+
+    if to_embed:
+        print(f"Embedding {len(to_embed)} new/changed chunks...")
+        failed_ids = add_chunks_in_batches(db, to_embed, desc="Re-indexing changed chunks")
+        # Blank out whatever failed so its hash never matches and the next sync embeds it again
+        for chunk_id in failed_ids:
+            source, _, index = chunk_id.rpartition(":")
+            new_manifest_sources[source][int(index)] = ""
+
+    if stale_ids:
+        for i in range(0, len(stale_ids), CHROMA_ADD_BATCH_SIZE):
+            db.delete(ids=stale_ids[i:i + CHROMA_ADD_BATCH_SIZE])
+
+    save_manifest({"sources": new_manifest_sources}, changed=bool(to_embed or to_reuse or stale_ids), embedder=db.embeddings)
+    print("✅ Incremental sync finished.")
+    return db
+
+
 # Calculates and assigns unique chunk ids
 def calculate_chunk_ids(chunks: list[Document]):
 
@@ -108,6 +476,30 @@ def calculate_chunk_ids(chunks: list[Document]):
     return chunks
 
 
+# Loads the formatted data json (returns None if anything is wrong with it)
+def load_processed_data(input_json_path: str) -> dict | None:
+    print(f"Loading processed data from: {input_json_path}")
+    try:
+        with open(input_json_path, 'r', encoding='utf-8') as f:
+            processed_data_dict = json.load(f)
+        print(f"Loaded {len(processed_data_dict)} entries.")
+    # Extra error handling for debugging
+    except FileNotFoundError:
+        print(f"❌ Error: Input file not found at {input_json_path}")
+        return None
+    except json.JSONDecodeError:
+        print(f"❌ Error: Could not decode JSON from {input_json_path}")
+        return None
+    except Exception as e:
+         print(f"❌ An unexpected error occurred during loading: {e}")
+         return None
+
+    if not isinstance(processed_data_dict, dict) or not processed_data_dict:
+        print(f"❌ Error: Input data is not a valid non-empty dictionary. Exiting.")
+        return None
+    return processed_data_dict
+
+
 # Turning the data dictionary to a list of Langchain Documents
 def generate_docs(processed_data: dict):
     documents = []
@@ -121,10 +513,9 @@ def generate_docs(processed_data: dict):
     print(f"Generated {len(documents)} Document objects.")
     return documents
 
-# Splits each document into chunks
-def split_documents(documents: list[Document]):
-
-    text_splitter = RecursiveCharacterTextSplitter(
+# The splitter settings used for every chunk in the db
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(
         chunk_size=514, # Use around 950 for longer context
         chunk_overlap=50, # Use around 100 if you use around 950 chunk size
         length_function=len,
@@ -132,8 +523,68 @@ def split_documents(documents: list[Document]):
         separators=["\n\n", "\n", ". ", " "], # Which seperators to split on
         keep_separator=False
     )
-    print(f"Splitting {len(documents)} documents into chunks...")
-    chunks = text_splitter.split_documents(documents)
+
+# Only used on sections that are too long to be one chunk, keep_separator="start" keeps "- Param" / "Property '" intact
+def get_section_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=STRUCTURED_CHUNK_SIZE,
+        chunk_overlap=50,
+        length_function=len,
+        is_separator_regex=False,
+        separators=["\n\n", "\n", " - ", " Property '", ". ", " "], # Parameter, response and property boundaries first
+        keep_separator="start"
+    )
+
+# "Title: ..." and "API Operation: METHOD /path" of a formatted entry, put in front of its later chunks so a
+# "Request Details:" chunk on its own still says which operation it belongs to
+def get_section_header(text: str) -> str:
+    lines = []
+    title = re.match(r"Title: .*", text)
+    if title:
+        lines.append(title.group(0))
+    operation = re.search(r"^(?:Content: )?(API Operation: [A-Z]+ \S+)", text, re.MULTILINE)
+    if operation:
+        lines.append(operation.group(1))
+    return "\n".join(lines)
+
+# Splits one document into chunks using the current CHUNKING_MODE
+def chunk_document(document: Document, text_splitter=None, section_splitter=None) -> list[Document]:
+    if CHUNKING_MODE != "structure":
+        return (text_splitter or get_text_splitter()).split_documents([document])
+
+    # Small sections next to each other with the same name (e.g. short article paragraphs) share a chunk
+    sections = []
+    for name, text in split_formatted_sections(document.page_content):
+        if sections and sections[-1][0] == name and len(sections[-1][1]) + len(text) + 2 <= STRUCTURED_CHUNK_SIZE:
+            sections[-1] = (name, sections[-1][1] + "\n\n" + text)
+        else:
+            sections.append((name, text))
+
+    section_splitter = section_splitter or get_section_splitter()
+    header = get_section_header(document.page_content)
+    chunks = []
+    for name, text in sections:
+        pieces = [text] if len(text) <= STRUCTURED_CHUNK_SIZE else section_splitter.split_text(text)
+        # A label line like "Request Details:" can end up on its own, glue it onto the piece after it
+        merged_pieces = []
+        for piece in pieces:
+            if merged_pieces and len(merged_pieces[-1]) < MIN_SECTION_PIECE_CHARS:
+                merged_pieces[-1] = merged_pieces[-1] + "\n" + piece
+            else:
+                merged_pieces.append(piece)
+        for piece in merged_pieces:
+            if chunks and header: # The first chunk starts with the title already
+                piece = header + "\n" + piece
+            chunks.append(Document(page_content=piece, metadata={**document.metadata, "section": name}))
+    return chunks
+
+# Splits each document into chunks
+def split_documents(documents: list[Document]):
+
+    text_splitter = get_text_splitter()
+    section_splitter = get_section_splitter()
+    print(f"Splitting {len(documents)} documents into chunks ({CHUNKING_MODE} mode)...")
+    chunks = [chunk for document in documents for chunk in chunk_document(document, text_splitter, section_splitter)]
     print(f"Split into {len(chunks)} chunks.")
     return chunks
 
@@ -161,31 +612,15 @@ def clear_database():
 # Main testing stuff
 if __name__ == '__main__':
 
-    CLEAR_DB_ON_START = True # Set to True to clear DB first
-    INPUT_JSON_PATH = "ScrapingStuff/storedData/RagFormattedData.json" # Input file
+    CLEAR_DB_ON_START = False # Set to True to clear DB first (full rebuild)
+    INCREMENTAL_INDEXING = True # Only re-embed chunks whose content changed (uses the chunk manifest)
 
     if CLEAR_DB_ON_START:
         clear_database()
 
     # Loading data
-    print(f"Loading processed data from: {INPUT_JSON_PATH}")
-    try:
-        with open(INPUT_JSON_PATH, 'r', encoding='utf-8') as f:
-            processed_data_dict = json.load(f)
-        print(f"Loaded {len(processed_data_dict)} entries.")
-    # Extra error handling for debugging
-    except FileNotFoundError:
-        print(f"❌ Error: Input file not found at {INPUT_JSON_PATH}")
-        exit()
-    except json.JSONDecodeError:
-        print(f"❌ Error: Could not decode JSON from {INPUT_JSON_PATH}")
-        exit()
-    except Exception as e:
-         print(f"❌ An unexpected error occurred during loading: {e}")
-         exit()
-
-    if not isinstance(processed_data_dict, dict) or not processed_data_dict:
-        print(f"❌ Error: Input data is not a valid non-empty dictionary. Exiting.")
+    processed_data_dict = load_processed_data(INPUT_JSON_PATH)
+    if processed_data_dict is None:
         exit()
 
     # Generating all the langchain documents
@@ -202,6 +637,17 @@ if __name__ == '__main__':
 
     # Adding and vectorizing the chunks to the chromadb
     print("\nAdding chunks to Chroma DB...")
-    db_instance = add_to_chroma(chunks) # Has a cool progress bar now 😎
+    if INCREMENTAL_INDEXING and not CLEAR_DB_ON_START:
+        db_instance = sync_to_chroma(chunks)
+    else:
+        db_instance = add_to_chroma(chunks) # Has a cool progress bar now 😎
+
+    # Keyword index for the hybrid retrieval in contextModel.py
+    build_lexical_index(db_instance, index_version=get_index_version())
+    # Endpoint -> page index for the direct lookup in contextModel.py
+    save_endpoint_index(build_endpoint_index(processed_data_dict))
+
+    if hasattr(db_instance.embeddings, "print_stats"):
+        db_instance.embeddings.print_stats()
 
     print("\n--- Script Finished ---")
\ No newline at end of file
@@ -0,0 +1,99 @@
+# endpointLookup.py
+
+# Resolves questions that name an endpoint ("what does GET /v1/tenants/{Tenant}/blueprints return", "DELETE
+# /v1/tenants/42/blueprints/7", "how does Delete blueprint work") straight to the page documenting it, using the
+# endpoint index formattingData.py writes. No embedding and no vector search needed for those.
+# Try it: python endpointLookup.py "GET /v1/tenants/{Tenant}/blueprints"
+
+import argparse
+import json
+import os
+import re
+from formattingData import ENDPOINT_INDEX_PATH, HTTP_METHODS, build_endpoint_index, normalize_endpoint_path, normalize_operation_name
+
+# --- Constants ---
+MAX_ENDPOINT_MATCHES = 3 # More than this and the query is too vague to skip retrieval
+MIN_NAME_WORDS = 2 # Operation names shorter than this ("Login") are too likely to show up by accident
+
+_PATH_RE = re.compile(r"(?:\b(" + "|".join(HTTP_METHODS) + r")\s+)?(?:https?://[^/\s]+)?(/[\w{}\-.~%:/]+)", re.IGNORECASE)
+
+
+class EndpointLookup:
+
+    def __init__(self, endpoint_index: dict):
+        self.operations = endpoint_index.get("operations", {})
+        self.names = endpoint_index.get("names", {})
+        # Path templates split into segments, so concrete paths (/tenants/42) can match placeholders (/tenants/{})
+        self._templates = {}
+        for key, link in self.operations.items():
+            method, path = key.split(" ", 1)
+            self._templates.setdefault(len(path.split("/")), []).append((method, path.split("/"), link))
+        # Longest names first, so "delete blueprint version" wins over "delete blueprint"
+        self._names = sorted(((name, links) for name, links in self.names.items() if len(name.split()) >= MIN_NAME_WORDS),
+                             key=lambda item: len(item[0]), reverse=True)
+
+    @classmethod
+    def load(cls, path: str = ENDPOINT_INDEX_PATH, processed_data: dict | None = None) -> "EndpointLookup | None":
+        # Use the saved index, or build one on the fly from the formatted data if it hasn't been written yet
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        if processed_data:
+            return cls(build_endpoint_index(processed_data))
+        return None
+
+    def __len__(self):
+        return len(self.operations)
+
+    def match_path(self, method: str | None, path: str) -> list[str]:
+        segments = normalize_endpoint_path(path).split("/")
+        links = []
+        for template_method, template, link in self._templates.get(len(segments), []):
+            if method and template_method != method.upper():
+                continue
+            if all(want == got or want == "{}" for want, got in zip(template, segments)):
+                links.append(link)
+        return links
+
+    def match(self, query_text: str) -> tuple[list[str], str | None]:
+        """Returns (source urls, what matched). Empty list when the query doesn't clearly name an endpoint."""
+        links = []
+        matched = []
+        for method, path in _PATH_RE.findall(query_text):
+            path = path.rstrip(".:") # End of a sentence, not part of the path
+            if path.count("/") < 2:
+                continue # A lone "/something" is more likely prose than an endpoint
+            for link in self.match_path(method or None, path):
+                if link not in links:
+                    links.append(link)
+            matched.append(f"{method.upper() + ' ' if method else ''}{path}")
+
+        if not links:
+            query = f" {normalize_operation_name(query_text)} "
+            for name, name_links in self._names:
+                if f" {name} " in query:
+                    links = list(name_links)
+                    matched.append(f"operation '{name}'")
+                    break
+
+        if not links or len(links) > MAX_ENDPOINT_MATCHES:
+            return [], None
+        return links, ", ".join(matched)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check which documentation page a query resolves to directly.")
+    parser.add_argument("query", type=str)
+    args = parser.parse_args()
+
+    from embeddingsMain import INPUT_JSON_PATH, load_processed_data
+    lookup = EndpointLookup.load(processed_data=None if os.path.exists(ENDPOINT_INDEX_PATH) else load_processed_data(INPUT_JSON_PATH))
+    if lookup is None:
+        print("❌ ENDPOINT_LOOKUP: No endpoint index found, run formattingData.py first.")
+        return
+    links, matched = lookup.match(args.query)
+    print(f"Matched {matched}: {links}" if links else "No direct endpoint match, the query would go through normal retrieval.")
+
+
+if __name__ == "__main__":
+    main()
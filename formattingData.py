@@ -1,5 +1,6 @@
 import json
 import os
+import re
 
 # Formatting all the data into the output format we want (so that our LLM can read it)
 def format_properties(properties_dict):
@@ -234,6 +235,90 @@ def process_api_doc_entry(entry):
     return fullText.strip()
 
 
+# Markers process_api_doc_entry writes in front of each part of an entry, used to split the text back into sections
+SECTION_MARKERS = [
+    ("request", "\nRequest Details:\n"),
+    ("responses", "\nResponse Details:\n"),
+    ("models", "\nReferenced Model Definitions:\n"),
+    ("models", " Bundled model definitions: "),
+]
+
+def split_formatted_sections(text):
+    """Splits text made by process_api_doc_entry back into [(section_name, section_text), ...] in order."""
+    cuts = []
+    for name, marker in SECTION_MARKERS:
+        pos = text.find(marker)
+        if pos != -1:
+            cuts.append((pos, name, marker))
+    cuts.sort()
+
+    # Articles have none of the markers, split them on their markdown headings instead
+    if not cuts:
+        for match in re.finditer(r"\n(?=#{1,6} )", text):
+            cuts.append((match.start(), "article", "\n"))
+
+    sections = []
+    start = 0
+    current = "overview"
+    for pos, name, marker in cuts:
+        if name == current and name != "article":
+            continue # e.g. operations have both model markers, they're one section
+        piece = text[start:pos].strip()
+        if piece:
+            sections.append((current, piece))
+        # The marker's label (e.g. "Request Details:") stays at the top of its section
+        start = pos + len(marker) - len(marker.lstrip("\n"))
+        current = name
+    piece = text[start:].strip()
+    if piece:
+        sections.append((current, piece))
+    return sections
+
+
+# Endpoint index: (METHOD, path template) and operation name -> source url, so questions that name an endpoint
+# can go straight to its page (see endpointLookup.py)
+ENDPOINT_INDEX_PATH = "ScrapingStuff/storedData/endpointIndex.json"
+HTTP_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS")
+
+def normalize_endpoint_path(path):
+    """Lowercase, no host/query string/trailing slash, and every {Placeholder} becomes {} so templates compare equal."""
+    path = re.sub(r"^[a-z]+://[^/]+", "", path.strip(), flags=re.IGNORECASE)
+    path = path.split("?", 1)[0].split("#", 1)[0]
+    path = re.sub(r"\{[^}/]*\}", "{}", path)
+    path = re.sub(r"/+", "/", path).rstrip("/")
+    return path.lower() or "/"
+
+def normalize_operation_name(name):
+    return " ".join(re.findall(r"[a-z0-9]+", name.lower()))
+
+def build_endpoint_index(processedDocs):
+    """Builds the endpoint index from the formatted texts (works on RagFormattedData.json, no raw data needed)."""
+    operations = {}
+    names = {}
+    for link, text in processedDocs.items():
+        if not isinstance(text, str):
+            continue
+        operation = re.search(r"^Content: API Operation: ([A-Z]+) (\S+)", text, re.MULTILINE)
+        if not operation:
+            continue
+        method, path = operation.group(1), normalize_endpoint_path(operation.group(2))
+        operations.setdefault(f"{method} {path}", link)
+        title = re.match(r"Title: (.*)", text)
+        if title:
+            name = normalize_operation_name(title.group(1))
+            if name and link not in names.setdefault(name, []):
+                names[name].append(link)
+    return {"operations": operations, "names": names}
+
+def save_endpoint_index(endpointIndex, output_filepath=ENDPOINT_INDEX_PATH):
+    try:
+        with open(output_filepath, 'w', encoding='utf-8') as f:
+            json.dump(endpointIndex, f, indent=4)
+        print(f"Saved endpoint index ({len(endpointIndex['operations'])} operations, {len(endpointIndex['names'])} names) to {output_filepath}")
+    except IOError as e:
+        print(f"Error: Could not write endpoint index to {output_filepath}: {e}")
+
+
 
 if __name__ == "__main__":
     try:
@@ -269,6 +354,7 @@ if __name__ == "__main__":
         with open(output_filepath, 'w', encoding='utf-8') as f:
             json.dump(processedDocs, f, indent=4)
         print(f"\nSuccessfully saved processed data to {output_filepath}")
+        save_endpoint_index(build_endpoint_index(processedDocs))
     except IOError as e:
         print(f"\nError: Could not write output file to {output_filepath}: {e}")
     except Exception as e:
@@ -0,0 +1,145 @@
+# historyCompactor.py
+
+# Keeps the chat history that goes into the reframing prompt (reframeQuery.py) under a hard token budget, so reframing
+# costs the same on turn 50 as on turn 2 instead of re-reading every answer the assistant ever gave.
+#   - the most recent messages (the last question and answer by default) stay in full
+#   - older assistant answers shrink to their subject words ("earlier answer about: blueprint, upload, design"), which
+#     is all the reframer is allowed to take from them anyway (rule 4 of the prompt: no paths, parameters, product names)
+#   - older user messages are kept, cut short if someone pasted a wall of text
+#   - it walks from the newest message back and stops when the budget is full, so the cost doesn't grow with the chat
+# Tokens are counted with the reframing model's tokenizer (tokenCounting.py).
+# See how it scales: python historyCompactor.py --turns 50
+
+import argparse
+import re
+import time
+from collections import Counter
+from tokenCounting import count_tokens, truncate_to_tokens
+
+# --- Constants ---
+HISTORY_TOKEN_BUDGET = 600 # Hard cap for the whole formatted history
+KEEP_RECENT_MESSAGES = 2 # Newest messages kept word for word
+OLD_USER_MESSAGE_MAX_TOKENS = 60
+MAX_SUBJECT_WORDS = 6
+TRUNCATION_MARK = " ..."
+
+# Words that show up in every answer and say nothing about what it was about
+_SKIP_WORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "then", "so", "to", "of", "in", "on", "for", "with", "by", "at", "from", "as",
+    "into", "via", "is", "are", "was", "were", "be", "been", "being", "it", "its", "this", "that", "these", "those", "you",
+    "your", "we", "our", "they", "their", "i", "my", "can", "could", "should", "would", "will", "may", "might", "must",
+    "do", "does", "did", "have", "has", "had", "not", "no", "yes", "all", "any", "some", "each", "also", "just", "only",
+    "there", "here", "which", "what", "when", "where", "who", "how", "why", "use", "using", "used", "send", "make", "sure",
+    "need", "needs", "want", "include", "includes", "including", "example", "following", "first", "then", "next", "okay",
+    "get", "gets", "set", "new", "one", "more", "other", "same", "such", "like", "about", "out", "up", "able", "well",
+    "ensure", "it's", "you're", "don't", "kind", "seeing", "located", "found", "provide", "provides",
+}
+_TECHNICAL_RE = re.compile(r"`[^`]*`|https?://\S+|\S*/\S*|\{[^}]*\}|\S+_\S+|\b\w*[a-z][A-Z]\w*\b") # Code, urls, paths, placeholders, identifiers
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z'-]+")
+_SENTENCE_START_RE = re.compile(r"(?:^|[.!?:]\s+)([A-Za-z][A-Za-z'-]+)")
+
+
+def subject_words(text: str, limit: int = MAX_SUBJECT_WORDS) -> list[str]:
+    """Most repeated plain words of an answer, in the order they first appear. Technical details and capitalized names
+    (products, systems) are left out."""
+    text = _TECHNICAL_RE.sub(" ", text)
+    sentence_starts = {match.start(1) for match in _SENTENCE_START_RE.finditer(text)}
+    counts = Counter()
+    first_seen = {}
+    for match in _WORD_RE.finditer(text):
+        word = match.group(0)
+        if word[0].isupper() and match.start() not in sentence_starts:
+            continue # Name in the middle of a sentence
+        word = word.lower().strip("'-")
+        if len(word) < 3 or word in _SKIP_WORDS or word.endswith("ly"):
+            continue
+        counts[word] += 1
+        first_seen.setdefault(word, match.start())
+    top = sorted(counts, key=lambda word: (-counts[word], first_seen[word]))[:limit]
+    return sorted(top, key=first_seen.get)
+
+
+def compact_history(history: list[dict], token_budget: int = HISTORY_TOKEN_BUDGET, model: str | None = None,
+                    keep_recent: int = KEEP_RECENT_MESSAGES) -> tuple[list[str], dict]:
+    """Returns (formatted "Role: content" lines oldest first, report)."""
+    lines = []
+    used = 0
+    compacted = 0
+    truncated = 0
+    for position, message in enumerate(reversed(history or [])):
+        role = message.get('role', 'unknown').capitalize()
+        content = message.get('content', '')
+        if position >= keep_recent:
+            if message.get('role') == 'assistant':
+                words = subject_words(content)
+                content = f"[earlier answer about: {', '.join(words)}]" if words else "[earlier answer]"
+                compacted += 1
+            else:
+                shortened = truncate_to_tokens(content, OLD_USER_MESSAGE_MAX_TOKENS, model)
+                if shortened != content:
+                    content = shortened.rstrip() + TRUNCATION_MARK
+                    truncated += 1
+        line = f"{role}: {content}"
+        tokens = count_tokens(line, model) + 1 # + the newline
+        if used + tokens > token_budget:
+            if position < keep_recent:
+                # A recent message doesn't fit whole: keep its start, that's where the subject usually is
+                mark_tokens = count_tokens(f"{role}: {TRUNCATION_MARK}", model) + 1
+                head = truncate_to_tokens(content, token_budget - used - mark_tokens, model)
+                if head:
+                    line = f"{role}: {head.rstrip()}{TRUNCATION_MARK}"
+                    lines.append(line)
+                    used += count_tokens(line, model) + 1
+                    truncated += 1
+            break
+        lines.append(line)
+        used += tokens
+    lines.reverse()
+    report = {
+        "messages_in": len(history or []),
+        "messages_kept": len(lines),
+        "messages_dropped": len(history or []) - len(lines),
+        "answers_compacted": compacted,
+        "messages_truncated": truncated,
+        "tokens": used,
+        "token_budget": token_budget,
+    }
+    return lines, report
+
+
+def _synthetic_session(turns: int) -> list[dict]:
+    # Long chat built from the reframer's test conversations, answers padded to a realistic length
+    from reframeQuery import TEST_CASES
+    messages = [message for test in TEST_CASES for message in test["history"]]
+    history = []
+    while len(history) < turns * 2:
+        for message in messages:
+            if message["role"] == "assistant":
+                message = {"role": "assistant", "content": " ".join([message["content"]] * 4)}
+            history.append(message)
+    return history[:turns * 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History tokens sent to the reframer per turn, with and without compaction.")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--budget", type=int, default=HISTORY_TOKEN_BUDGET)
+    parser.add_argument("--model", type=str, default="phi3:mini", help="Tokenizer to count with (an Ollama model name).")
+    args = parser.parse_args()
+
+    history = _synthetic_session(args.turns)
+    print(f"{'turn':>5}{'full tokens':>13}{'compacted':>11}{'kept':>6}{'ms':>9}")
+    for turn in range(1, args.turns + 1):
+        turn_history = history[:turn * 2]
+        full_tokens = count_tokens("\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in turn_history), args.model)
+        start_time = time.perf_counter()
+        lines, report = compact_history(turn_history, args.budget, args.model)
+        elapsed = time.perf_counter() - start_time
+        if turn <= 3 or turn % 5 == 0 or turn == args.turns:
+            print(f"{turn:>5}{full_tokens:>13}{report['tokens']:>11}{report['messages_kept']:>6}{elapsed * 1000:>9.2f}")
+    print("\nLast compacted history:")
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# lexicalIndex.py
+
+# BM25 keyword index over the chunk texts, to go next to the dense search. Embeddings are bad at exact strings like
+# "/v1/tenants/{Tenant}/blueprints" or "BlueprintId", BM25 is great at them, so get_contextual_chunks fuses both
+# rankings with reciprocal rank fusion. It also works on its own when the embedding model isn't available.
+# Built at the end of ingestion (or by hand: python lexicalIndex.py build) and stored as a few numpy arrays:
+# the postings are one flat array per field, with term_offsets[t]..term_offsets[t + 1] being term t's slice (CSR layout).
+
+import argparse
+import json
+import os
+import re
+import time
+import numpy as np
+from vectorEngine import split_chunk_id
+
+# --- Constants ---
+LEXICAL_INDEX_PATH = 'lexicalIndex'
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60 # Standard reciprocal rank fusion constant, bigger = flatter
+
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased words, plus the camelCase/snake_case parts of identifiers (BlueprintId -> blueprintid, blueprint, id)."""
+    tokens = []
+    for word in _WORD_RE.findall(text):
+        lowered = word.lower()
+        tokens.append(lowered)
+        parts = [part.lower() for piece in word.split("_") for part in _CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def build_lexical_index(db, index_dir: str = LEXICAL_INDEX_PATH, index_version: int | None = None):
+    print(f"LEXICAL_INDEX: Building BM25 index into {index_dir}...")
+    start_time = time.time()
+    data = db.get(include=["documents"])
+    ids = list(data["ids"])
+    if not ids:
+        print("❌ LEXICAL_INDEX: The DB is empty, nothing to index.")
+        return None
+    order = sorted(range(len(ids)), key=lambda i: split_chunk_id(ids[i]))
+    ids = [ids[i] for i in order]
+    documents = [data["documents"][i] or "" for i in order]
+
+    vocabulary = {}
+    term_rows = {} # term id -> list of (row, term frequency)
+    doc_lengths = np.zeros(len(ids), dtype=np.int32)
+    for row, text in enumerate(documents):
+        tokens = tokenize(text)
+        doc_lengths[row] = len(tokens)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            term_id = vocabulary.setdefault(token, len(vocabulary))
+            term_rows.setdefault(term_id, []).append((row, count))
+
+    term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    term_offsets[1:] = np.cumsum([len(term_rows[term_id]) for term_id in range(len(vocabulary))])
+    posting_rows = np.empty(term_offsets[-1], dtype=np.int32)
+    posting_tf = np.empty(term_offsets[-1], dtype=np.uint16)
+    for term_id in range(len(vocabulary)):
+        postings = term_rows[term_id]
+        posting_rows[term_offsets[term_id]:term_offsets[term_id + 1]] = [row for row, _ in postings]
+        posting_tf[term_offsets[term_id]:term_offsets[term_id + 1]] = [min(count, 65535) for _, count in postings]
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.savez(os.path.join(index_dir, "postings.npz"), term_offsets=term_offsets, posting_rows=posting_rows,
+             posting_tf=posting_tf, doc_lengths=doc_lengths)
+    with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "vocabulary": vocabulary, "index_version": index_version}, f)
+    print(f"✅ LEXICAL_INDEX: Indexed {len(ids)} chunks ({len(vocabulary)} terms, {len(posting_rows)} postings) in {time.time() - start_time:.2f} seconds.")
+    return index_dir
+
+
+class LexicalIndex:
+
+    def __init__(self, index_dir: str = LEXICAL_INDEX_PATH):
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self.vocabulary = meta["vocabulary"]
+        self.index_version = meta.get("index_version")
+        with np.load(os.path.join(index_dir, "postings.npz")) as arrays:
+            self.term_offsets = arrays["term_offsets"]
+            self.posting_rows = arrays["posting_rows"]
+            self.posting_tf = arrays["posting_tf"].astype(np.float32)
+            doc_lengths = arrays["doc_lengths"].astype(np.float32)
+
+        document_frequency = np.diff(self.term_offsets).astype(np.float32)
+        self.idf = np.log1p((len(self.ids) - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        # Per-document part of the BM25 denominator, precomputed once
+        self._length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / max(float(doc_lengths.mean()), 1e-9))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, query_text: str) -> np.ndarray:
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query_text)):
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            rows = self.posting_rows[start:end]
+            tf = self.posting_tf[start:end]
+            scores[rows] += self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + self._length_norm[rows])
+        return scores
+
+    def search(self, query_text: str, k: int = 4) -> list[tuple[str, float]]:
+        """Top k (chunk id, BM25 score), best first. Chunks without any query term are never returned."""
+        scores = self.scores(query_text)
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[tuple[str, float]]:
+    """Fuses several best-first id lists: score(id) = sum of 1 / (k + rank). Best first."""
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the BM25 index over the Chroma chunks.")
+    parser.add_argument("command", choices=["build", "search"])
+    parser.add_argument("query", nargs="?", default=None, help="Query text for the search command.")
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from langchain_chroma import Chroma
+        from embeddingsMain import CHROMADATAPATH, get_index_version
+        build_lexical_index(Chroma(persist_directory=CHROMADATAPATH), index_version=get_index_version())
+    else:
+        index = LexicalIndex()
+        for chunk_id, score in index.search(args.query or "", args.k):
+            print(f"{score:8.3f}  {chunk_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# lruCache.py
+
+# The small in-memory LRU (max entries + optional time to live) and query normalization shared by the caches
+# (queryCache.py, reframeCache.py). Standard library only, so a cache module can use it without importing the
+# embedding/Chroma stack.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_whitespace(text: str) -> str:
+    # Same text with different spacing. Case is kept, the embedding model sees it ("GET /v1/Tenants" != "get /v1/tenants")
+    return " ".join(text.split())
+
+
+def normalize_query(query_text: str) -> str:
+    # Same question with different casing/spacing should hit the same entry
+    return normalize_whitespace(query_text).casefold()
+
+
+class LRUCache:
+    """Thread safe LRU with a max number of entries and a time to live per entry."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (stored at, value), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            stored_at, value = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def items(self) -> list[tuple]:
+        # (key, value) pairs that haven't expired, least recently used first (for saving a cache to disk)
+        with self._lock:
+            now = time.monotonic()
+            return [(key, value) for key, (stored_at, value) in self._entries.items()
+                    if self.ttl_seconds is None or now - stored_at <= self.ttl_seconds]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "capacity": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
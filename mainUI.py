@@ -2,8 +2,31 @@
 
 import streamlit as st
 import time # Import the time module
+from concurrent.futures import ThreadPoolExecutor
 import contextModel # Your RAG system model
 import reframeQuery # Our new query reframing module
+import speculativeRetrieval # Retrieval for the original query runs while it's being reframed
+from backgroundStream import BackgroundStream, RENDER_INTERVAL_SECONDS # Answer tokens read on a worker thread, rendered in batches
+
+# --- Constants ---
+HISTORY_PAGE_SIZE = 20 # Messages rendered on each rerun, older ones only after "Show earlier messages"
+ANSWER_STREAM_WORKERS = 32 # Answers being streamed at the same time, across all sessions
+
+# Shared by every session of this server process, created once on the first page load. Streamlit reruns the whole
+# script per interaction and per user, these just hand back the same objects
+@st.cache_resource(show_spinner=False)
+def get_shared_resources():
+    # Model, embedder, DB, indexes and caches (contextModel.RESOURCES). Warm-up loads them in the background while
+    # the page renders, the first question only waits for what's still loading
+    contextModel.warm_up()
+    return contextModel.RESOURCES
+
+@st.cache_resource(show_spinner=False)
+def get_answer_stream_executor():
+    return ThreadPoolExecutor(max_workers=ANSWER_STREAM_WORKERS, thread_name_prefix="answer-stream")
+
+RESOURCES = get_shared_resources()
+ANSWER_STREAM_EXECUTOR = get_answer_stream_executor()
 
 # Configuring page
 st.set_page_config(page_title="Documentation Chatbot", layout="centered")
@@ -18,18 +41,38 @@ if "messages" not in st.session_state:
 if "use_query_reframing" not in st.session_state:
     st.session_state.use_query_reframing = True # Default to using reframing
 
+if "use_speculative_retrieval" not in st.session_state:
+    st.session_state.use_speculative_retrieval = speculativeRetrieval.USE_SPECULATIVE_RETRIEVAL
+
+if "visible_messages" not in st.session_state:
+    st.session_state.visible_messages = HISTORY_PAGE_SIZE
+
 # Add the toggle button to the sidebar
 with st.sidebar:
     st.header("Settings")
+    resource_health = RESOURCES.health()
+    if resource_health["ok"]:
+        st.caption("✅ Models ready")
+    elif resource_health["loading"] or resource_health["not_loaded"]:
+        st.caption(f"⏳ Loading: {', '.join(resource_health['loading'] + resource_health['not_loaded'])}")
+    else:
+        st.caption(f"❌ Not available: {', '.join(resource_health['failed'] + resource_health['unavailable'])}")
     st.session_state.use_query_reframing = st.toggle(
         "Use Query Reframing",
         value=st.session_state.use_query_reframing,
         help="Turn this on to allow the system to rephrase your query based on chat history for better context. Turn it off to send the original query directly."
     )
+    st.session_state.use_speculative_retrieval = st.toggle(
+        "Speculative Retrieval",
+        value=st.session_state.use_speculative_retrieval,
+        help="Search the documentation for your original question while it's being reframed. Saves time whenever the reframed question comes back unchanged."
+    )
+    speculation_stats = speculativeRetrieval.SPECULATION_STATS.stats()
+    if speculation_stats["attempts"]:
+        st.caption(f"Speculation: {speculation_stats['hits']}/{speculation_stats['attempts']} hits, {speculation_stats['saved_seconds']:.1f}s saved")
 
 
-# Display chat messages from history on app rerun
-for message in st.session_state.messages:
+def render_message(message):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         if "sources" in message and message["sources"]:
@@ -43,6 +86,17 @@ for message in st.session_state.messages:
         if "time_to_first_token" in message and message["time_to_first_token"] is not None:
              st.caption(f"⏱️ Time to first token: {message['time_to_first_token']:.2f} seconds")
 
+def show_earlier_messages():
+    st.session_state.visible_messages += HISTORY_PAGE_SIZE
+
+# Display chat messages from history on app rerun
+# Only the newest page of messages, so a rerun costs the same on a long chat as on a short one
+hidden_messages = max(0, len(st.session_state.messages) - st.session_state.visible_messages)
+if hidden_messages:
+    st.button(f"Show earlier messages ({hidden_messages} hidden)", on_click=show_earlier_messages)
+for message in st.session_state.messages[hidden_messages:]:
+    render_message(message)
+
 
 # Get input from the user
 if user_prompt := st.chat_input("What is your question?"):
@@ -53,6 +107,7 @@ if user_prompt := st.chat_input("What is your question?"):
 
     # --- Determine the final query based on the toggle state ---
     final_query_for_rag = user_prompt # Start with the original user prompt
+    speculation = None # Retrieval started for the original query before reframing (only when reframing is on)
 
     # Check if the reframe toggle is on
     if st.session_state.use_query_reframing:
@@ -63,6 +118,9 @@ if user_prompt := st.chat_input("What is your question?"):
             for msg in st.session_state.messages[:-1] # Exclude the current user_prompt
         ]
 
+        if st.session_state.use_speculative_retrieval:
+            speculation = speculativeRetrieval.SpeculativeRetrieval(user_prompt, use_formatted_data=False)
+
         # Reframe the user's prompt based on the chat history (NON-STREAMING call)
         try:
             rephrased_query = reframeQuery.reframe_query_with_history(
@@ -108,23 +166,26 @@ if user_prompt := st.chat_input("What is your question?"):
 
             # Call the single_query function from your contextModel file
             # This part assumes contextModel.single_query returns a stream generator and sources
-            response_stream, rag_sources = contextModel.single_query(final_query_for_rag, use_formatted_data=False)
+            # With speculation the context is usually ready already (or reused as soon as it is), see speculativeRetrieval.py
+            rag_context = speculation.resolve(final_query_for_rag) if speculation else None
+            response_stream, rag_sources = contextModel.single_query(final_query_for_rag, use_formatted_data=False, rag_context=rag_context)
 
             if response_stream:
-                first_chunk_received = False
-                # Manually iterate the stream to time the first chunk and display progressively
-                for chunk in response_stream:
-                    if not first_chunk_received:
-                        # --- Stop Timer ---
-                        # Record the time when the very first chunk is received
-                        end_time_first_chunk = time.time()
-                        time_to_first_chunk = end_time_first_chunk - start_time_stream
-                        first_chunk_received = True
-                        # --- End Timer ---
-
-                    full_rag_response += chunk
-                    # Update the placeholder with the accumulated response as chunks arrive
-                    message_placeholder.markdown(full_rag_response)
+                # The stream is read on a worker thread (see backgroundStream.py), here we only re-render the answer
+                # every RENDER_INTERVAL_SECONDS with the tokens that arrived in between instead of after every token
+                answer_stream = BackgroundStream(response_stream, ANSWER_STREAM_EXECUTOR)
+                try:
+                    for full_rag_response, done in answer_stream.batches(RENDER_INTERVAL_SECONDS):
+                        # Update the placeholder with the accumulated response, with a cursor while it's still coming
+                        message_placeholder.markdown(full_rag_response if done else full_rag_response + "▌")
+                finally:
+                    # Page closed or rerun mid-answer: stop generating
+                    answer_stream.stop()
+                # --- Stop Timer ---
+                # Time when the very first chunk was received (on the worker thread)
+                if answer_stream.first_chunk_at is not None:
+                    time_to_first_chunk = answer_stream.first_chunk_at - start_time_stream
+                # --- End Timer ---
 
 
                 print(f"DEBUG: RAG Stream finished. Full response length: {len(full_rag_response)}")
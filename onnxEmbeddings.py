@@ -0,0 +1,175 @@
+# onnxEmbeddings.py
+
+# ONNX Runtime backend for the embedding model. PyTorch eager mode is the slowest part of both ingestion and every
+# query on CPU, so this exports the model to an ONNX graph once (optionally with dynamic int8 quantization), caches it
+# on disk, and serves embed_documents/embed_query from onnxruntime instead.
+# Needs the optional packages: pip install optimum[onnxruntime]
+# Parity check against the PyTorch path: python onnxEmbeddings.py --parity [--int8]
+
+import argparse
+import os
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- Constants ---
+ONNX_MODEL_DIR = 'onnxModels'
+ONNX_BATCH_SIZE = 16
+ONNX_MAX_LENGTH = 8192 # Same max sequence length sentence-transformers uses for gte-Qwen2
+PARITY_MIN_COSINE = {"fp32": 0.999, "int8": 0.98} # Lowest cosine vs PyTorch we accept for each variant
+PARITY_NORM_RTOL = 1e-2 # Vector lengths have to match too, Chroma compares by L2 distance
+
+
+def _import_optimum():
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+    except ImportError as e:
+        raise ImportError("The ONNX embedding backend needs optimum and onnxruntime: pip install optimum[onnxruntime]") from e
+    return ORTModelForFeatureExtraction, ORTQuantizer, AutoQuantizationConfig, AutoTokenizer
+
+
+def export_onnx_model(model_name: str, quantize: bool = False, cache_dir: str = ONNX_MODEL_DIR) -> str:
+    """Exports (and optionally int8-quantizes) the model once and returns the directory holding the ONNX files."""
+    ORTModelForFeatureExtraction, ORTQuantizer, AutoQuantizationConfig, AutoTokenizer = _import_optimum()
+    export_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+
+    if not os.path.exists(os.path.join(export_dir, "model.onnx")):
+        print(f"ONNX_EMBEDDINGS: Exporting {model_name} to ONNX in {export_dir} (only happens once)...")
+        start_time = time.time()
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True, trust_remote_code=True)
+        model.save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(model_name, trust_remote_code=True).save_pretrained(export_dir)
+        print(f"✅ ONNX_EMBEDDINGS: Export finished in {time.time() - start_time:.1f} seconds.")
+    if not quantize:
+        return export_dir
+
+    quantized_dir = export_dir + "-int8"
+    if not os.path.exists(os.path.join(quantized_dir, "model_quantized.onnx")):
+        print(f"ONNX_EMBEDDINGS: Quantizing to dynamic int8 in {quantized_dir} (only happens once)...")
+        start_time = time.time()
+        quantizer = ORTQuantizer.from_pretrained(export_dir)
+        # Dynamic quantization: weights stored as int8, activations quantized on the fly, so no calibration data needed
+        quantization_config = AutoQuantizationConfig.avx2(is_static=False, per_channel=True)
+        quantizer.quantize(save_dir=quantized_dir, quantization_config=quantization_config)
+        AutoTokenizer.from_pretrained(export_dir).save_pretrained(quantized_dir)
+        print(f"✅ ONNX_EMBEDDINGS: Quantization finished in {time.time() - start_time:.1f} seconds.")
+    return quantized_dir
+
+
+class OnnxEmbeddings(Embeddings):
+
+    def __init__(self, model_name: str, quantize: bool = False, normalize: bool = False,
+                 batch_size: int = ONNX_BATCH_SIZE, num_threads: int | None = None):
+        ORTModelForFeatureExtraction, _, _, AutoTokenizer = _import_optimum()
+        import onnxruntime
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.normalize = normalize
+        self.batch_size = batch_size
+
+        model_dir = export_onnx_model(model_name, quantize)
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            session_options.intra_op_num_threads = num_threads
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name="model_quantized.onnx" if quantize else "model.onnx",
+            provider="CPUExecutionProvider",
+            session_options=session_options,
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = self.tokenizer(texts[i:i + self.batch_size], padding=True, truncation=True,
+                                   max_length=ONNX_MAX_LENGTH, return_tensors="np")
+            hidden = np.asarray(self.model(**batch).last_hidden_state, dtype=np.float32)
+            mask = batch["attention_mask"]
+            # gte-Qwen2 uses last token pooling, the last real token depends on which side the tokenizer padded
+            if mask[:, -1].all():
+                pooled = hidden[:, -1]
+            else:
+                last_positions = mask.sum(axis=1) - 1
+                pooled = hidden[np.arange(len(hidden)), last_positions]
+            vectors.append(pooled)
+        result = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        if self.normalize and len(result):
+            result = result / np.maximum(np.linalg.norm(result, axis=1, keepdims=True), 1e-12)
+        return result
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return self._encode(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._encode([text])[0].tolist()
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents(texts) # No query instruction, queries and documents are encoded the same way
+
+
+# --- Parity check against the PyTorch path ---
+def parity_check(quantize: bool = False, sample_size: int = 32) -> bool:
+    from embeddingsMain import INPUT_JSON_PATH, encode_kwargs, get_embed_function, load_processed_data, model_name
+    from vectorEngine import DEFAULT_BENCH_QUERIES
+
+    texts = list(DEFAULT_BENCH_QUERIES)
+    processed_data = load_processed_data(INPUT_JSON_PATH)
+    if processed_data:
+        texts += [text[:1500] for text in list(processed_data.values())[:sample_size]]
+
+    torch_embedder = get_embed_function(use_cache=False, truncate_dim=None, backend="torch")
+    onnx_embedder = OnnxEmbeddings(model_name, quantize=quantize, normalize=encode_kwargs.get("normalize_embeddings", False))
+
+    start_time = time.time()
+    torch_vectors = np.asarray(torch_embedder.embed_documents(texts), dtype=np.float32)
+    torch_seconds = time.time() - start_time
+    start_time = time.time()
+    onnx_vectors = np.asarray(onnx_embedder.embed_documents(texts), dtype=np.float32)
+    onnx_seconds = time.time() - start_time
+
+    cosines = np.einsum("ij,ij->i", torch_vectors, onnx_vectors) / (
+        np.linalg.norm(torch_vectors, axis=1) * np.linalg.norm(onnx_vectors, axis=1) + 1e-12)
+    variant = "int8" if quantize else "fp32"
+    # Cosine ignores length, but Chroma searches by L2 distance: a missing/extra normalization would pass the cosine
+    # check and still put every ONNX vector at the wrong distance from the torch-built index
+    torch_norms = np.linalg.norm(torch_vectors, axis=1)
+    onnx_norms = np.linalg.norm(onnx_vectors, axis=1)
+    norms_match = bool(np.allclose(onnx_norms, torch_norms, rtol=PARITY_NORM_RTOL))
+    squared_l2 = np.sum((torch_vectors - onnx_vectors) ** 2, axis=1)
+    passed = float(cosines.min()) >= PARITY_MIN_COSINE[variant] and norms_match
+
+    print("\n" + "-" * 60)
+    print(f"ONNX ({variant}) vs PyTorch on {len(texts)} texts")
+    print(f"cosine: min {cosines.min():.5f}, mean {cosines.mean():.5f}")
+    print(f"norms: PyTorch mean {torch_norms.mean():.4f}, ONNX mean {onnx_norms.mean():.4f}, largest relative difference "
+          f"{np.max(np.abs(onnx_norms - torch_norms) / np.maximum(torch_norms, 1e-12)):.4%} {'✅' if norms_match else '❌'}")
+    print(f"squared L2 difference: max {squared_l2.max():.6f}, mean {squared_l2.mean():.6f}")
+    print(f"time: PyTorch {torch_seconds:.2f}s, ONNX {onnx_seconds:.2f}s ({torch_seconds / max(onnx_seconds, 1e-9):.2f}x)")
+    print(f"{'✅ Parity check passed' if passed else '❌ Parity check failed'} (min cosine threshold {PARITY_MIN_COSINE[variant]}, "
+          f"norms within {PARITY_NORM_RTOL:.0%})")
+    print("-" * 60)
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX and check it against PyTorch.")
+    parser.add_argument("--int8", action="store_true", help="Use the dynamically int8-quantized graph.")
+    parser.add_argument("--parity", action="store_true", help="Compare ONNX and PyTorch embeddings.")
+    args = parser.parse_args()
+
+    from embeddingsMain import model_name
+    if args.parity:
+        parity_check(quantize=args.int8)
+    else:
+        export_onnx_model(model_name, quantize=args.int8)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# parallelIngest.py
+
+# Parallel version of the ingestion in embeddingsMain.py.
+# The chunks get sharded across N worker processes (each one loads its own copy of the embedding model with a
+# pinned number of torch threads), and the main process is the only one writing the vectors into Chroma.
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+from langchain_chroma import Chroma
+from langchain.schema.document import Document
+from tqdm import tqdm
+from embeddingsMain import (
+    CHROMADATAPATH,
+    INPUT_JSON_PATH,
+    MAX_BATCH_TOKENS,
+    build_manifest_from_db,
+    calculate_chunk_ids,
+    clear_database,
+    fixed_count_batches,
+    generate_docs,
+    get_embed_function,
+    get_index_version,
+    get_token_lengths,
+    get_tokenizer,
+    load_processed_data,
+    padding_waste,
+    plan_token_batches,
+    save_manifest,
+    split_documents,
+    upsert_embedded_chunks,
+)
+from lexicalIndex import build_lexical_index
+
+# Set inside each worker process by _init_worker
+_WORKER_EMBEDDER = None
+_WORKER_LOAD_SECONDS = None
+
+
+def get_peak_rss_mb() -> float | None:
+    # Peak resident memory of the current process (None if we can't tell on this OS)
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KB on Linux
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024) # peak_wset only exists on Windows
+    except ImportError:
+        return None
+
+
+def _init_worker(threads_per_worker: int):
+    global _WORKER_EMBEDDER, _WORKER_LOAD_SECONDS
+    import torch
+    # Pin the intra-op threads so N workers don't all fight over every core
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass # Can only be set once per process, fine if torch already started its pool
+
+    start_time_load = time.time()
+    # The disk cache isn't safe to write from several processes at once, so workers always run the model
+    _WORKER_EMBEDDER = get_embed_function(use_cache=False)
+    _WORKER_LOAD_SECONDS = time.time() - start_time_load
+
+
+def _embed_shard(shard: tuple[int, list[str]]):
+    shard_index, texts = shard
+    vectors = _WORKER_EMBEDDER.embed_documents(texts)
+    return shard_index, vectors, os.getpid(), get_peak_rss_mb(), _WORKER_LOAD_SECONDS
+
+
+def embed_in_parallel(chunks: list[Document], workers: int, threads_per_worker: int | None = None,
+                      max_tokens: int = MAX_BATCH_TOKENS, on_shard_done=None) -> dict:
+    """Embeds the chunks across worker processes and calls on_shard_done(shard_chunks, vectors) in the main process."""
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+
+    # Shards are token-budgeted batches of similar length chunks, so there's little padding and the work per shard is even
+    lengths = get_token_lengths([chunk.page_content for chunk in chunks], get_tokenizer())
+    shard_indexes = plan_token_batches(lengths, max_tokens)
+    shards = [[chunks[i] for i in shard] for shard in shard_indexes]
+    worker_stats = {} # pid -> (peak rss mb, model load seconds)
+
+    start_time = time.time()
+    # spawn instead of fork, forking after torch has started its thread pools can deadlock
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(processes=workers, initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+        tasks = ((i, [chunk.page_content for chunk in shard]) for i, shard in enumerate(shards))
+        for shard_index, vectors, pid, peak_rss_mb, load_seconds in tqdm(pool.imap_unordered(_embed_shard, tasks), total=len(shards), desc=f"Embedding ({workers} workers)"):
+            worker_stats[pid] = (peak_rss_mb, load_seconds)
+            if on_shard_done:
+                on_shard_done(shards[shard_index], vectors)
+    elapsed = time.time() - start_time
+
+    rss_values = [rss for rss, _ in worker_stats.values() if rss is not None]
+    load_values = [load for _, load in worker_stats.values() if load is not None]
+    return {
+        "workers": workers,
+        "threads_per_worker": threads_per_worker,
+        "chunks": len(chunks),
+        "seconds": elapsed,
+        "chunks_per_sec": len(chunks) / elapsed if elapsed > 0 else 0.0,
+        "max_model_load_seconds": max(load_values) if load_values else None,
+        "peak_rss_mb_per_worker": max(rss_values) if rss_values else None,
+        "peak_rss_mb_total": sum(rss_values) if rss_values else None,
+        "writer_peak_rss_mb": get_peak_rss_mb(),
+        "padding_waste_fixed": padding_waste(lengths, fixed_count_batches(len(chunks))),
+        "padding_waste": padding_waste(lengths, shard_indexes),
+    }
+
+
+def parallel_add_to_chroma(chunks: list[Document], workers: int, threads_per_worker: int | None = None) -> dict:
+    # The main process is the single writer, it only needs the db (no model) since the vectors come from the workers
+    db = Chroma(persist_directory=CHROMADATAPATH)
+    chunks_with_ids = calculate_chunk_ids(chunks)
+
+    try:
+        existing_ids = set(db.get(include=[])["ids"])
+        print(f"Number of existing documents in DB: {len(existing_ids)}")
+    except Exception as e:
+        print(f"Warning: Could not get existing items, assuming DB is empty or needs rebuild: {e}")
+        existing_ids = set()
+
+    new_chunks = [chunk for chunk in chunks_with_ids if chunk.metadata.get("id") not in existing_ids]
+    if not new_chunks:
+        print("✅ No new documents to add.")
+        return {}
+
+    def write_shard(shard_chunks, vectors):
+        try:
+            upsert_embedded_chunks(db, shard_chunks, vectors)
+        except Exception as e:
+            print(f"\nError writing shard starting at {shard_chunks[0].metadata.get('id')} to ChromaDB: {e}")
+
+    print(f"Adding {len(new_chunks)} new documents using {workers} worker processes...")
+    report = embed_in_parallel(new_chunks, workers, threads_per_worker, on_shard_done=write_shard)
+    save_manifest(build_manifest_from_db(db))
+    build_lexical_index(db, index_version=get_index_version())
+    print("✅ New documents added successfully.")
+    return report
+
+
+def print_report(reports: list[dict]):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "n/a"
+
+    print("\n" + "-" * 96)
+    print(f"{'workers':>8} {'threads/wkr':>12} {'chunks':>8} {'seconds':>9} {'chunks/sec':>11} {'model load s':>13} {'RSS/wkr MB':>11} {'RSS total MB':>13}")
+    for report in reports:
+        print(f"{report['workers']:>8} {report['threads_per_worker']:>12} {report['chunks']:>8} {report['seconds']:>9.1f} "
+              f"{report['chunks_per_sec']:>11.2f} {fmt(report['max_model_load_seconds'], '>13.1f')} "
+              f"{fmt(report['peak_rss_mb_per_worker'], '>11.0f')} {fmt(report['peak_rss_mb_total'], '>13.0f')}")
+    print("-" * 96)
+    if reports:
+        # Same chunks in every run, so the padding numbers are the same for all of them
+        print(f"Padding waste: {reports[0]['padding_waste_fixed']:.1%} with fixed batches in document order -> "
+              f"{reports[0]['padding_waste']:.1%} with token-length bucketed batches")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed the documentation chunks with several worker processes.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of embedding worker processes.")
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="torch intra-op threads per worker (default: cores / workers).")
+    parser.add_argument("--clear", action="store_true", help="Clear the Chroma DB before ingesting.")
+    parser.add_argument("--sweep", type=str, default=None, help="Comma separated worker counts to benchmark (e.g. 1,2,4,8). Nothing is written to the DB.")
+    parser.add_argument("--sample", type=int, default=512, help="Number of chunks to embed per sweep run.")
+    args = parser.parse_args()
+
+    processed_data_dict = load_processed_data(INPUT_JSON_PATH)
+    if processed_data_dict is None:
+        return
+    chunks = split_documents(generate_docs(processed_data_dict))
+    if not chunks:
+        print("No chunks were created after splitting. Exiting.")
+        return
+
+    if args.sweep:
+        sample = chunks[:args.sample]
+        reports = []
+        for workers in [int(value) for value in args.sweep.split(",") if value.strip()]:
+            print(f"\nSWEEP: {workers} workers on {len(sample)} chunks...")
+            reports.append(embed_in_parallel(sample, workers, args.threads_per_worker))
+        print_report(reports)
+        return
+
+    if args.clear:
+        clear_database()
+    report = parallel_add_to_chroma(chunks, args.workers, args.threads_per_worker)
+    if report:
+        print_report([report])
+
+
+if __name__ == "__main__":
+    main()
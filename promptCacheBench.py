@@ -0,0 +1,272 @@
+# promptCacheBench.py
+
+# Measures how much prompt prefill the two PROMPT_MODEs in contextModel.py cost, against a stand-in Ollama server
+# (stdlib only, runs in this process) instead of a real one, so the numbers don't depend on the GPU or on what else
+# Ollama has loaded. The stand-in behaves like Ollama's runner where it matters here:
+#   - it renders /api/chat messages and /api/generate prompts with the model's chat template (Qwen ChatML)
+#   - it keeps the tokens of the last prompt and only "prefills" what comes after the longest common prefix
+#   - prompts longer than num_ctx (Ollama defaults to 2048) get their start cut off, which also kills the prefix reuse
+#   - the model unloads after keep_alive (default 5m), the next request pays the load time and starts with an empty cache
+# Prefill and decode are simulated with a fixed time per token, and every answer streams back as NDJSON like Ollama does.
+# Try it: python promptCacheBench.py --queries 8 --follow-ups 1
+
+import argparse
+import json
+import os
+import re
+import statistics
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextModel import PROMPT, SYSTEM_PROMPT, QUESTION_PROMPT, LLM_MODEL_NAME, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX, RAG_FORMATTED_DATA_PATH
+
+# --- Constants ---
+PREFILL_SECONDS_PER_TOKEN = 0.0004 # ~2500 tokens/sec of prompt processing
+DECODE_SECONDS_PER_TOKEN = 0.02
+MODEL_LOAD_SECONDS = 1.5
+DEFAULT_KEEP_ALIVE_SECONDS = 5 * 60 # Ollama's default
+DEFAULT_NUM_CTX = 2048 # Ollama's default when the request doesn't set num_ctx
+NUM_KEEP = 4 # Tokens Ollama keeps from the start of the prompt when it has to cut it
+ANSWER_TOKENS = 30
+DEFAULT_SYSTEM_PROMPT = "You are Qwen, created by Alibaba Cloud. You are a helpful assistant." # What the Qwen template adds without a system message
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def tokenize(text: str) -> list[str]:
+    # Not the real tokenizer, but stable and close enough in size to compare layouts
+    return _TOKEN_RE.findall(text)
+
+
+def parse_keep_alive(value) -> float:
+    # Same formats Ollama takes: seconds as a number, or "30s" / "5m" / "1h", negative means never unload
+    if value is None:
+        return DEFAULT_KEEP_ALIVE_SECONDS
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)([smh]?)", str(value).strip())
+    if not match:
+        return DEFAULT_KEEP_ALIVE_SECONDS
+    seconds = float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+    return float("inf") if seconds < 0 else seconds
+
+
+def render_chatml(messages: list[dict]) -> str:
+    if not messages or messages[0].get("role") != "system":
+        messages = [{"role": "system", "content": DEFAULT_SYSTEM_PROMPT}] + list(messages)
+    parts = [f"<|im_start|>{message['role']}\n{message['content']}<|im_end|>\n" for message in messages]
+    return "".join(parts) + "<|im_start|>assistant\n"
+
+
+class StandInOllama:
+
+    def __init__(self, prefix_cache: bool = True, default_keep_alive: float = DEFAULT_KEEP_ALIVE_SECONDS,
+                 prefill_seconds_per_token: float = PREFILL_SECONDS_PER_TOKEN):
+        self.prefix_cache = prefix_cache
+        self.default_keep_alive = default_keep_alive
+        self.prefill_seconds_per_token = prefill_seconds_per_token
+        self.cached_tokens = [] # Prompt tokens of the last request, what the KV cache holds
+        self.unload_at = None # None = model not loaded
+        self.lock = threading.Lock() # One slot, like OLLAMA_NUM_PARALLEL=1
+
+    def prefill(self, prompt_text: str, keep_alive, num_ctx: int) -> dict:
+        tokens = tokenize(prompt_text)
+        truncated = len(tokens) > num_ctx
+        if truncated:
+            tokens = tokens[:NUM_KEEP] + tokens[-(num_ctx - NUM_KEEP):]
+
+        now = time.monotonic()
+        load_seconds = 0.0
+        if self.unload_at is None or now > self.unload_at:
+            load_seconds = MODEL_LOAD_SECONDS
+            self.cached_tokens = [] # Unloading drops the KV cache too
+            time.sleep(load_seconds)
+
+        reused = 0
+        if self.prefix_cache:
+            for cached, token in zip(self.cached_tokens, tokens):
+                if cached != token:
+                    break
+                reused += 1
+            reused = min(reused, len(tokens) - 1) # The last prompt token always gets evaluated to start generating
+        evaluated = len(tokens) - reused
+        time.sleep(evaluated * self.prefill_seconds_per_token)
+
+        self.cached_tokens = tokens
+        keep_alive_seconds = parse_keep_alive(keep_alive) if keep_alive is not None else self.default_keep_alive
+        self.unload_at = time.monotonic() + keep_alive_seconds
+        return {"prompt_tokens": len(tokens), "prompt_eval_count": evaluated, "prompt_cache_tokens": reused,
+                "truncated": truncated, "load_duration": int(load_seconds * 1e9)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass # Keep the benchmark output readable
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/api/chat":
+            prompt_text = render_chatml(body.get("messages", []))
+        elif self.path == "/api/generate":
+            prompt_text = render_chatml([{"role": "user", "content": body.get("prompt", "")}])
+        else:
+            self.send_error(404)
+            return
+        options = body.get("options") or {}
+        simulator = self.server.simulator
+
+        with simulator.lock:
+            start_time = time.perf_counter()
+            stats = simulator.prefill(prompt_text, body.get("keep_alive"), int(options.get("num_ctx") or DEFAULT_NUM_CTX))
+            stats["prompt_eval_duration"] = int((time.perf_counter() - start_time) * 1e9)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for i in range(ANSWER_TOKENS):
+                piece = f"token{i} "
+                line = {"model": body.get("model"), "done": False}
+                line.update({"message": {"role": "assistant", "content": piece}} if self.path == "/api/chat" else {"response": piece})
+                self.wfile.write((json.dumps(line) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(DECODE_SECONDS_PER_TOKEN)
+            self.wfile.write((json.dumps({"model": body.get("model"), "done": True, "eval_count": ANSWER_TOKENS, **stats}) + "\n").encode("utf-8"))
+
+
+def start_server(simulator: StandInOllama) -> tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.simulator = simulator
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def stream_request(base_url: str, path: str, payload: dict) -> dict:
+    """Sends one streaming request, returns the final stats plus time to first token and total time."""
+    request = urllib.request.Request(base_url + path, data=json.dumps({**payload, "stream": True}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    start_time = time.perf_counter()
+    first_token_seconds = None
+    final = {}
+    with urllib.request.urlopen(request) as response:
+        for raw_line in response:
+            line = json.loads(raw_line)
+            if line.get("done"):
+                final = line
+            elif first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - start_time
+    final["ttft"] = first_token_seconds
+    final["total"] = time.perf_counter() - start_time
+    return final
+
+
+def legacy_request(context_text: str, question: str, tuned: bool = False) -> tuple[str, dict]:
+    # One completion prompt like PROMPT_MODE = "legacy". Untuned is how it was sent before (Ollama's default keep_alive
+    # and num_ctx), tuned has the same keep_alive/num_ctx as the prefix mode so only the layout differs
+    from langchain.prompts import ChatPromptTemplate
+    prompt = ChatPromptTemplate.from_template(PROMPT).format(context=context_text, question=question)
+    payload = {"model": LLM_MODEL_NAME, "prompt": prompt}
+    if tuned:
+        payload.update({"keep_alive": OLLAMA_KEEP_ALIVE, "options": {"num_ctx": OLLAMA_NUM_CTX}})
+    return "/api/generate", payload
+
+
+def prefix_request(context_text: str, question: str) -> tuple[str, dict]:
+    # What PROMPT_MODE = "prefix" sends through ChatOllama
+    messages = [{"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": QUESTION_PROMPT.format(context=context_text, question=question)}]
+    return "/api/chat", {"model": LLM_MODEL_NAME, "messages": messages, "keep_alive": OLLAMA_KEEP_ALIVE,
+                         "options": {"num_ctx": OLLAMA_NUM_CTX}}
+
+
+def load_contexts(count: int, context_words: int) -> list[str]:
+    # Real documentation pages if the formatted data is around, made up text otherwise
+    pages = []
+    if os.path.exists(RAG_FORMATTED_DATA_PATH):
+        with open(RAG_FORMATTED_DATA_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        text = "\n\n".join(data.values())
+        words = text.split(" ")
+        pages = [" ".join(words[i * context_words:(i + 1) * context_words]) for i in range(count) if (i + 1) * context_words <= len(words)]
+    while len(pages) < count:
+        i = len(pages)
+        pages.append(" ".join(f"field{i}_{j} of /v1/tenants/{{Tenant}}/resource{i} is a string." for j in range(context_words // 8)))
+    return pages
+
+
+def run_config(name: str, build_request, workload: list[tuple[str, str]], prefix_cache: bool, gap: float,
+               default_keep_alive: float, prefill_seconds_per_token: float) -> dict:
+    server, base_url = start_server(StandInOllama(prefix_cache, default_keep_alive, prefill_seconds_per_token))
+    results = []
+    try:
+        for i, (context_text, question) in enumerate(workload):
+            if i and gap:
+                time.sleep(gap)
+            path, payload = build_request(context_text, question)
+            results.append(stream_request(base_url, path, payload))
+    finally:
+        server.shutdown()
+        server.server_close()
+    ttfts = [result["ttft"] for result in results]
+    return {
+        "name": name,
+        "requests": len(results),
+        "prompt_tokens": sum(result["prompt_tokens"] for result in results),
+        "prefill_tokens": sum(result["prompt_eval_count"] for result in results),
+        "reused_tokens": sum(result["prompt_cache_tokens"] for result in results),
+        "truncated": sum(1 for result in results if result["truncated"]),
+        "loads": sum(1 for result in results if result["load_duration"]),
+        "first_ttft": ttfts[0],
+        "mean_ttft": statistics.mean(ttfts),
+        "median_ttft": statistics.median(ttfts),
+        "warm_mean_ttft": statistics.mean(ttfts[1:]) if len(ttfts) > 1 else ttfts[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefill tokens and time to first token of the legacy vs prefix-stable prompt layout, against a stand-in Ollama.")
+    parser.add_argument("--queries", type=int, default=8, help="Distinct retrieved contexts (one new question each).")
+    parser.add_argument("--follow-ups", type=int, default=1, help="Extra questions asked on each context right after (chat follow-ups).")
+    parser.add_argument("--context-words", type=int, default=2500, help="Size of each retrieved context.")
+    parser.add_argument("--gap", type=float, default=0.0, help="Seconds between requests (set above --default-keep-alive to see unloads).")
+    parser.add_argument("--default-keep-alive", type=float, default=DEFAULT_KEEP_ALIVE_SECONDS, help="Stand-in's keep_alive when the request sets none.")
+    parser.add_argument("--prefill-ms-per-token", type=float, default=PREFILL_SECONDS_PER_TOKEN * 1000)
+    args = parser.parse_args()
+
+    contexts = load_contexts(args.queries, args.context_words)
+    workload = []
+    for i, context_text in enumerate(contexts):
+        workload.append((context_text, f"What does the endpoint in section {i} return?"))
+        for j in range(args.follow_ups):
+            workload.append((context_text, f"And which parameters does it need (follow-up {j + 1})?"))
+    print(f"PROMPT_CACHE_BENCH: {len(workload)} requests over {len(contexts)} contexts of ~{args.context_words} words, gap {args.gap}s.")
+
+    configs = [
+        ("legacy (completion, defaults)", legacy_request, True),
+        ("legacy + keep_alive, num_ctx", lambda context_text, question: legacy_request(context_text, question, tuned=True), True),
+        ("prefix (chat, keep_alive, num_ctx)", prefix_request, True),
+        ("prefix, no prefix reuse", prefix_request, False),
+    ]
+    reports = []
+    for name, build_request, prefix_cache in configs:
+        print(f"PROMPT_CACHE_BENCH: Running '{name}'...")
+        reports.append(run_config(name, build_request, workload, prefix_cache, args.gap, args.default_keep_alive, args.prefill_ms_per_token / 1000))
+
+    print(f"\n{'config':<38}{'prompt tok':>11}{'prefilled':>11}{'reused':>9}{'cut':>5}{'loads':>7}{'first ttft':>12}{'warm ttft':>11}{'median':>9}")
+    for report in reports:
+        print(f"{report['name']:<38}{report['prompt_tokens']:>11}{report['prefill_tokens']:>11}{report['reused_tokens']:>9}"
+              f"{report['truncated']:>5}{report['loads']:>7}{report['first_ttft']:>11.3f}s{report['warm_mean_ttft']:>10.3f}s{report['median_ttft']:>8.3f}s")
+    baseline = reports[-1] # Same prompts with nothing reused
+    for report in reports[:-1]:
+        if report["truncated"]:
+            print(f"⚠️ {report['name']}: {report['truncated']}/{report['requests']} prompts were longer than num_ctx, the stand-in "
+                  f"(like Ollama) dropped their start, so the instructions and part of the context never reached the model.")
+            continue
+        print(f"✅ {report['name']}: {report['reused_tokens']}/{report['prompt_tokens']} prompt tokens reused "
+              f"({report['reused_tokens'] / max(report['prompt_tokens'], 1):.1%}), median TTFT {report['median_ttft']:.3f}s vs "
+              f"{baseline['median_ttft']:.3f}s without reuse ({baseline['median_ttft'] / max(report['median_ttft'], 1e-9):.2f}x).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# queryCache.py
+
+# In-memory caches in front of retrieval, so asking the same question again (retries, a popular FAQ) doesn't re-run
+# the 1.5B embedding model and the similarity search.
+#   level 1: query text (spacing normalized, case kept since the model sees it) -> query embedding
+#   level 2: (normalized query text, k, window) -> ids of the retrieved context chunks (and which of them were hits)
+# Both are bounded LRUs with a TTL, and both get dropped as soon as the index version in the chunk manifest changes.
+
+import os
+import threading
+from embeddingCache import embed_query_batch
+from lruCache import LRUCache, normalize_whitespace
+from embeddingsMain import MANIFEST_PATH, get_index_version
+
+# --- Constants ---
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+RETRIEVAL_CACHE_SIZE = 512
+QUERY_CACHE_TTL_SECONDS = 60 * 60
+
+# Reading the whole manifest on every query would be slow, so the version is only re-read when the file changes
+_VERSION_LOCK = threading.Lock()
+_VERSION_STAMP = None # (mtime_ns, size) of the manifest the cached version was read from
+_VERSION = None
+
+
+def current_index_version() -> int | None:
+    global _VERSION_STAMP, _VERSION
+    try:
+        stat = os.stat(MANIFEST_PATH)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        stamp = None
+    with _VERSION_LOCK:
+        if stamp != _VERSION_STAMP:
+            _VERSION = get_index_version() if stamp else None
+            _VERSION_STAMP = stamp
+        return _VERSION
+
+
+class QueryCache:
+
+    def __init__(self, embedding_entries: int = QUERY_EMBEDDING_CACHE_SIZE, retrieval_entries: int = RETRIEVAL_CACHE_SIZE,
+                 ttl_seconds: float | None = QUERY_CACHE_TTL_SECONDS):
+        self.embeddings = LRUCache(embedding_entries, ttl_seconds)
+        self.retrievals = LRUCache(retrieval_entries, ttl_seconds)
+        self.index_version = current_index_version()
+        self.invalidations = 0
+
+    def check_version(self):
+        # Anything cached against an older index could point at chunks that changed or no longer exist
+        version = current_index_version()
+        if version != self.index_version:
+            print(f"QUERY_CACHE: Index version changed ({self.index_version} -> {version}), clearing cached queries.")
+            self.embeddings.clear()
+            self.retrievals.clear()
+            self.index_version = version
+            self.invalidations += 1
+
+    def embed_query(self, embedder, query_text: str) -> list[float]:
+        # The key is exactly the text that gets embedded, so a hit is the same vector the model would give
+        key = normalize_whitespace(query_text)
+        vector = self.embeddings.get(key)
+        if vector is None:
+            vector = embedder.embed_query(key)
+            self.embeddings.put(key, vector)
+        return vector
+
+    def embed_queries(self, embedder, query_texts: list[str]) -> list[list[float]]:
+        # Cached ones come from memory, all the others are embedded together in one batch
+        keys = [normalize_whitespace(query_text) for query_text in query_texts]
+        vectors = [self.embeddings.get(key) for key in keys]
+        missing = {}
+        for i, key in enumerate(keys):
+            if vectors[i] is None:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            computed = embed_query_batch(embedder, list(missing))
+            for (key, positions), vector in zip(missing.items(), computed):
+                self.embeddings.put(key, vector)
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    def get_retrieval(self, query_text: str, k: int, window: int) -> tuple[list[str], list[str]] | None:
+        """(context chunk ids in document order, hit ids best first), or None."""
+        return self.retrievals.get((normalize_whitespace(query_text), k, window))
+
+    def put_retrieval(self, query_text: str, k: int, window: int, chunk_ids: list[str], hit_ids: list[str] | None = None):
+        self.retrievals.put((normalize_whitespace(query_text), k, window), (list(chunk_ids), list(hit_ids or [])))
+
+    def drop_retrieval(self, query_text: str, k: int, window: int):
+        self.retrievals.pop((normalize_whitespace(query_text), k, window))
+
+    def print_stats(self):
+        for name, cache in (("embeddings", self.embeddings), ("retrievals", self.retrievals)):
+            stats = cache.stats()
+            print(f"QUERY_CACHE ({name}): {stats['hits']} hits / {stats['misses']} misses (hit rate {stats['hit_rate']:.1%}), "
+                  f"{stats['entries']}/{stats['capacity']} entries, {stats['evictions']} evictions, {stats['expirations']} expired.")
+        print(f"QUERY_CACHE: {self.invalidations} invalidations from index version changes.")
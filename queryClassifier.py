@@ -0,0 +1,164 @@
+# queryClassifier.py
+
+# Decides in well under a millisecond whether a chat query needs the reframing LLM call at all (reframeQuery.py).
+# Most turns don't: the first message of a chat has no history to resolve, and a question like "how do I delete a
+# config map?" already stands on its own, phi3 would just be asked to hand it back unchanged.
+# It only looks for what makes a query depend on the chat before it:
+#   - pronouns pointing back ("it", "them", "their", ...) and "one" used as a noun ("how do I delete one?")
+#   - follow-up openers ("and ...", "what about ...", "now ...") and references like "the same", "you mentioned"
+#   - demonstratives with no noun after them ("what does that return?"), queries too short to have a subject, and
+#     queries made only of generic API words ("what parameters are required?", "give me an example request"): they
+#     name a part of an endpoint but not which endpoint
+# The last two are weaker signals. If an embedder is passed they're double checked against the last user turn, and a
+# query that looks like a new topic is left alone. When in doubt it says "reframe", the LLM then makes the call.
+# Report on the labeled TEST_CASES of reframeQuery.py: python queryClassifier.py [--llm] [--embed]
+
+import argparse
+import re
+import time
+import numpy as np
+
+# --- Constants ---
+ANAPHORIC_PRONOUNS = {"it", "its", "itself", "them", "they", "their", "theirs", "themselves", "he", "she", "him", "her", "his"}
+DEMONSTRATIVES = {"this", "that", "these", "those"}
+FOLLOW_UP_OPENERS = ("and", "also", "now", "then", "so", "but", "or", "what about", "how about", "same for", "what else", "ok", "okay")
+REFERENCE_PHRASES = ("the same", "as well", "instead", "the previous", "the above", "mentioned", "you said", "earlier", "again",
+                     "the other", "the last one", "the first one", "the second one", "that one", "this one", "more details", "more info")
+# "one" right after these is standing in for a noun from earlier ("how do I delete one", "the other one")
+BEFORE_ONE_AS_NOUN = {"a", "an", "the", "another", "new", "other", "which", "each", "every", "existing", "specific", "single",
+                      "delete", "create", "upload", "get", "add", "remove", "update", "retrieve", "list", "find", "make", "edit",
+                      "modify", "rename", "copy", "move", "download", "deploy", "disable", "enable", "register"}
+# Words a demonstrative can be followed by without a noun ("what does that return", "is this required")
+NON_NOUN_WORDS = {"is", "was", "are", "were", "be", "does", "do", "did", "mean", "means", "return", "returns", "work", "works",
+                  "require", "requires", "need", "needs", "take", "takes", "support", "supports", "contain", "contains", "have",
+                  "has", "look", "looks", "one", "for", "in", "to", "with", "about", "of", "on", "again", "too", "also"}
+STOPWORDS = {"a", "an", "the", "i", "me", "my", "we", "our", "you", "your", "do", "does", "did", "is", "are", "was", "were", "be",
+             "can", "could", "should", "would", "will", "how", "what", "which", "where", "when", "who", "why", "to", "of", "in",
+             "on", "for", "with", "and", "or", "but", "so", "now", "then", "also", "please", "tell", "about", "there", "any",
+             "some", "more", "get", "use", "one", "what's", "how's", "there's"} | ANAPHORIC_PRONOUNS | DEMONSTRATIVES
+# Words every endpoint page has, a query made only of these doesn't say which endpoint it's about
+GENERIC_API_WORDS = {"parameter", "parameters", "param", "params", "argument", "arguments", "field", "fields", "property",
+                     "properties", "attribute", "attributes", "request", "requests", "response", "responses", "status",
+                     "code", "codes", "header", "headers", "body", "payload", "schema", "model", "format", "type", "types",
+                     "example", "examples", "sample", "curl", "command", "call", "endpoint", "url", "path", "method",
+                     "query", "output", "input", "result", "results", "error", "errors", "value", "values", "default",
+                     "defaults", "required", "optional", "mandatory", "returned", "return", "returns", "show", "give",
+                     "see", "explain", "list", "need", "send", "look", "like", "json", "syntax", "details", "info"}
+MIN_CONTENT_WORDS = 2 # Fewer content words than this and the query has no subject of its own ("why?", "example please")
+TOPIC_SHIFT_SIMILARITY = 0.5 # Weak signal + similarity to the last user turn below this = new topic, no reframing
+
+_WORD_RE = re.compile(r"[a-z0-9_']+")
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.casefold())
+
+
+def _cosine(a, b) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return float(a @ b / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12))
+
+
+def classify_query(query: str, chat_history: list[dict] | None, embedder=None) -> tuple[bool, str]:
+    """Returns (needs reframing, why)."""
+    if not chat_history:
+        return False, "no chat history"
+    words = _words(query)
+    if not words:
+        return False, "empty query"
+    lowered = " ".join(words)
+
+    # Strong signals: the query can't be understood without the history
+    pronouns = [word for word in words if word in ANAPHORIC_PRONOUNS]
+    if pronouns:
+        return True, f"pronoun '{pronouns[0]}'"
+    for i, word in enumerate(words):
+        if word in ("one", "ones") and (i == len(words) - 1 or (i > 0 and words[i - 1] in BEFORE_ONE_AS_NOUN)):
+            return True, f"'{word}' used as a noun"
+    for opener in FOLLOW_UP_OPENERS:
+        if lowered == opener or lowered.startswith(opener + " "):
+            return True, f"follow-up opener '{opener}'"
+    for phrase in REFERENCE_PHRASES:
+        if re.search(r"\b" + re.escape(phrase) + r"\b", lowered):
+            return True, f"reference '{phrase}'"
+
+    # Weak signals: might still be a new, complete question
+    weak_reason = None
+    for i, word in enumerate(words):
+        if word in DEMONSTRATIVES and (i == len(words) - 1 or words[i + 1] in NON_NOUN_WORDS):
+            weak_reason = f"demonstrative '{word}' without a noun"
+            break
+    content_words = [word for word in words if word not in STOPWORDS]
+    if weak_reason is None and len(content_words) < MIN_CONTENT_WORDS:
+        weak_reason = f"only {len(content_words)} content word(s)"
+    if weak_reason is None and all(word in GENERIC_API_WORDS for word in content_words):
+        weak_reason = "only generic API words"
+    if weak_reason is None:
+        return False, "self-contained"
+
+    if embedder is not None:
+        last_user_turn = next((message.get("content", "") for message in reversed(chat_history) if message.get("role") == "user"), None)
+        if last_user_turn:
+            similarity = _cosine(*embedder.embed_documents([query, last_user_turn]))
+            if similarity < TOPIC_SHIFT_SIMILARITY:
+                return False, f"{weak_reason}, but new topic (similarity {similarity:.2f} to the last turn)"
+            return True, f"{weak_reason}, same topic (similarity {similarity:.2f} to the last turn)"
+    return True, weak_reason
+
+
+def needs_reframing(query: str, chat_history: list[dict] | None, embedder=None) -> bool:
+    return classify_query(query, chat_history, embedder)[0]
+
+
+def same_query(a: str, b: str) -> bool:
+    # The LLM "decided" not to rewrite when it handed back the same words
+    return _words(a) == _words(b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Skip rate and accuracy of the reframing pre-classifier on reframeQuery.TEST_CASES.")
+    parser.add_argument("--llm", action="store_true", help="Also run the reframing LLM on every case and measure agreement with it.")
+    parser.add_argument("--embed", action="store_true", help="Use the embedding model for the weak-signal topic check.")
+    args = parser.parse_args()
+
+    from reframeQuery import TEST_CASES, reframe_query_with_history
+    embedder = None
+    if args.embed:
+        from embeddingsMain import get_embed_function
+        embedder = get_embed_function()
+
+    rows = []
+    for test in TEST_CASES:
+        start_time = time.perf_counter()
+        decision, reason = classify_query(test["query"], test["history"], embedder)
+        classify_seconds = time.perf_counter() - start_time
+        row = {"name": test["name"], "label": test["needs_reframing"], "decision": decision, "reason": reason, "seconds": classify_seconds}
+        if args.llm:
+            start_time = time.perf_counter()
+            rephrased = reframe_query_with_history(test["query"], test["history"], use_classifier=False)
+            row["llm_seconds"] = time.perf_counter() - start_time
+            row["llm_decision"] = not same_query(test["query"], rephrased)
+        rows.append(row)
+
+    print(f"\n{'case':<55}{'label':>7}{'rules':>7}{'llm':>6}  reason")
+    for row in rows:
+        llm = ("yes" if row["llm_decision"] else "no") if "llm_decision" in row else "-"
+        print(f"{row['name'][:54]:<55}{'yes' if row['label'] else 'no':>7}{'yes' if row['decision'] else 'no':>7}{llm:>6}  {row['reason']}")
+
+    total = len(rows)
+    skipped = [row for row in rows if not row["decision"]]
+    print(f"\nQUERY_CLASSIFIER: Skip rate {len(skipped)}/{total} ({len(skipped) / total:.1%}), "
+          f"{sum(row['seconds'] for row in rows) / total * 1000:.3f} ms per query.")
+    print(f"QUERY_CLASSIFIER: Agreement with labels {sum(row['decision'] == row['label'] for row in rows)}/{total}, "
+          f"{sum(1 for row in skipped if row['label'])} skipped that needed reframing.")
+    if args.llm:
+        agreement = sum(row["decision"] == row["llm_decision"] for row in rows)
+        llm_accuracy = sum(row["llm_decision"] == row["label"] for row in rows)
+        saved = sum(row["llm_seconds"] for row in skipped)
+        print(f"QUERY_CLASSIFIER: Agreement with the LLM {agreement}/{total}, LLM agreement with labels {llm_accuracy}/{total}.")
+        print(f"✅ QUERY_CLASSIFIER: Skipping would have saved {saved:.2f} of {sum(row['llm_seconds'] for row in rows):.2f} seconds of reframing.")
+
+
+if __name__ == "__main__":
+    main()
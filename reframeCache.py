@@ -0,0 +1,109 @@
+# reframeCache.py
+
+# Remembers what the reframing LLM answered for a (chat history, query) pair, so Streamlit reruns and users retrying the
+# same question don't send the same ~2.5k token prompt to phi3 again.
+# Key: a rolling hash over the history messages (hash of the previous messages + this one, so the key of a longer chat
+# extends the one before it) plus the normalized query. Entries live in an LRU in memory and can be saved to a json file.
+# Everything is tied to a fingerprint of the prompt template, the model and the history settings. If any of those
+# change, the cache (and a saved file written with the old ones) is dropped, since the answers could be different now.
+
+import hashlib
+import json
+import os
+import threading
+from lruCache import LRUCache, normalize_query
+
+# --- Constants ---
+REFRAME_CACHE_DIR = 'reframeCache'
+REFRAME_CACHE_PATH = os.path.join(REFRAME_CACHE_DIR, 'reframeCache.json')
+REFRAME_CACHE_SIZE = 1024
+REFRAME_CACHE_TTL_SECONDS = None # Same history + query + prompt + model gives the same answer, no need to expire
+
+
+def make_fingerprint(settings: dict) -> str:
+    # Prompt template, model name, history settings, ... anything that changes what the LLM gets to see
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def history_hash(chat_history: list[dict] | None) -> str:
+    rolling = hashlib.sha256(b"history").hexdigest()
+    for message in chat_history or []:
+        piece = json.dumps([rolling, message.get('role', ''), message.get('content', '')])
+        rolling = hashlib.sha256(piece.encode("utf-8")).hexdigest()
+    return rolling
+
+
+class ReframeCache:
+
+    def __init__(self, fingerprint: str, max_entries: int = REFRAME_CACHE_SIZE, path: str | None = None,
+                 ttl_seconds: float | None = REFRAME_CACHE_TTL_SECONDS):
+        self.fingerprint = fingerprint
+        self.path = path
+        self.entries = LRUCache(max_entries, ttl_seconds)
+        self.invalidations = 0
+        self.loaded_from_disk = 0
+        self._save_lock = threading.Lock()
+        if path:
+            self.load()
+
+    @staticmethod
+    def key(query: str, chat_history: list[dict] | None) -> str:
+        return hashlib.sha256(f"{history_hash(chat_history)}\n{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def check_fingerprint(self, fingerprint: str):
+        if fingerprint != self.fingerprint:
+            print(f"REFRAME_CACHE: Prompt/model settings changed ({self.fingerprint} -> {fingerprint}), clearing cached reframes.")
+            self.fingerprint = fingerprint
+            self.invalidate()
+
+    def invalidate(self):
+        self.entries.clear()
+        self.invalidations += 1
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def get(self, query: str, chat_history: list[dict] | None) -> str | None:
+        return self.entries.get(self.key(query, chat_history))
+
+    def put(self, query: str, chat_history: list[dict] | None, reframed_query: str):
+        self.entries.put(self.key(query, chat_history), reframed_query)
+        if self.path:
+            self.save()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read the reframe cache at {self.path}, starting empty: {e}")
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            print(f"REFRAME_CACHE: Saved cache at {self.path} was made with a different prompt/model, ignoring it.")
+            self.invalidations += 1
+            return
+        for key, value in data.get("entries", []):
+            self.entries.put(key, value)
+        self.loaded_from_disk = len(self.entries)
+        print(f"✅ REFRAME_CACHE: Loaded {self.loaded_from_disk} cached reframes from {self.path}.")
+
+    def save(self):
+        # Written to a temp file and swapped in, so a crash mid-write can't leave a broken file behind
+        with self._save_lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"fingerprint": self.fingerprint, "entries": self.entries.items()}, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Warning: Could not save the reframe cache to {self.path}: {e}")
+
+    def stats(self) -> dict:
+        return {**self.entries.stats(), "invalidations": self.invalidations, "loaded_from_disk": self.loaded_from_disk}
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"REFRAME_CACHE: {stats['hits']} hits / {stats['misses']} misses (hit rate {stats['hit_rate']:.1%}), "
+              f"{stats['entries']}/{stats['capacity']} entries, {stats['evictions']} evictions, {stats['invalidations']} invalidations.")
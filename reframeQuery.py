@@ -2,6 +2,10 @@
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama import OllamaLLM
+from resourceManager import LazyResource
+from queryClassifier import classify_query
+from historyCompactor import compact_history, HISTORY_TOKEN_BUDGET, KEEP_RECENT_MESSAGES
+from reframeCache import ReframeCache, make_fingerprint, REFRAME_CACHE_PATH
 
 # --- Enhanced Prompt Template with Few-Shot Examples ---
 REPHRASE_PROMPT_TEMPLATE = """
@@ -141,12 +145,57 @@ Original User Query:
 {query}
 """
 
-# --- LLM Initialization ---
-LLM = OllamaLLM(model='phi3:mini') # Ensure 'phi3:mini' is available
+# Ask queryClassifier.py first and only call the LLM when the query actually depends on the chat history
+USE_QUERY_CLASSIFIER = True
+# Cap the history in the prompt at HISTORY_TOKEN_BUDGET tokens, older answers shrink to their subject (see historyCompactor.py)
+USE_HISTORY_COMPACTION = True
+REFRAME_MODEL_NAME = 'phi3:mini' # Ensure 'phi3:mini' is available, also picks the tokenizer the history budget is counted with
+USE_REFRAME_CACHE = True # Same history + same query = same reframe, don't ask phi3 twice (reruns, retries)
+PERSIST_REFRAME_CACHE = False # Also keep cached reframes in reframeCache/ across restarts
 
-def format_chat_history_for_prompt(history: list[dict]) -> str:
+# --- LLM Initialization ---
+# Created on first use, so importing this module (e.g. from mainUI.py) doesn't construct anything
+REFRAME_LLM = LazyResource("REFRAME_LLM", lambda: OllamaLLM(model=REFRAME_MODEL_NAME))
+
+def get_llm() -> OllamaLLM | None:
+    return REFRAME_LLM.get()
+
+def reframe_settings_fingerprint() -> str:
+    # Everything that changes what phi3 sees or who answers. Read on every call, so changing the template or the model
+    # at runtime drops the cached reframes too
+    return make_fingerprint({
+        "template": REPHRASE_PROMPT_TEMPLATE,
+        "model": REFRAME_MODEL_NAME,
+        "compaction": USE_HISTORY_COMPACTION,
+        "history_budget": HISTORY_TOKEN_BUDGET,
+        "keep_recent": KEEP_RECENT_MESSAGES,
+    })
+
+REFRAME_CACHE = LazyResource("REFRAME_CACHE", lambda: ReframeCache(reframe_settings_fingerprint(),
+                                                                   path=REFRAME_CACHE_PATH if PERSIST_REFRAME_CACHE else None), required=False)
+
+def get_reframe_cache() -> ReframeCache | None:
+    if not USE_REFRAME_CACHE:
+        return None
+    cache = REFRAME_CACHE.get()
+    if cache is not None:
+        cache.check_fingerprint(reframe_settings_fingerprint())
+    return cache
+
+def __getattr__(name):
+    # reframeQuery.LLM still works, it's just created on first access
+    if name == "LLM":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def format_chat_history_for_prompt(history: list[dict], compact: bool = USE_HISTORY_COMPACTION) -> str:
     if not history:
         return "No prior conversation." # More explicit for the LLM
+    if compact:
+        formatted_history, report = compact_history(history, HISTORY_TOKEN_BUDGET, REFRAME_MODEL_NAME)
+        print(f"History compacted: {report['messages_kept']}/{report['messages_in']} messages, {report['answers_compacted']} answers "
+              f"shortened to their subject, {report['tokens']}/{report['token_budget']} tokens.")
+        return "\n".join(formatted_history)
     formatted_history = []
     for message in history:
         role = message.get('role', 'unknown').capitalize()
@@ -154,7 +203,7 @@ def format_chat_history_for_prompt(history: list[dict]) -> str:
         formatted_history.append(f"{role}: {content}")
     return "\n".join(formatted_history)
 
-def reframe_query_with_history(query: str, chat_history: list[dict]) -> str:
+def build_reframe_prompt(query: str, chat_history: list[dict]) -> str:
     print(f"Original query for reframing: \"{query}\"")
     
     formatted_history_str = format_chat_history_for_prompt(chat_history)
@@ -165,93 +214,225 @@ def reframe_query_with_history(query: str, chat_history: list[dict]) -> str:
     print(f"\n--- Sending this to LLM for Reframing (Full Prompt) ---")
     print(prompt_with_values) # Crucial for debugging
     print("--- End of Reframing Prompt ---\n")
+    return prompt_with_values
 
-    try:
-        response = LLM.invoke(prompt_with_values)
-        rephrased_query = response.strip() # Strip whitespace
+def clean_reframe_response(response: str) -> str:
+    rephrased_query = response.strip() # Strip whitespace
+    
+    # Additional check: Sometimes models might still output the "Rephrased Query:" prefix despite instructions.
+    # This is a fallback, ideally the prompt handles it.
+    if rephrased_query.lower().startswith("rephrased query:"):
+        rephrased_query = rephrased_query.split(":", 1)[1].strip()
         
-        # Additional check: Sometimes models might still output the "Rephrased Query:" prefix despite instructions.
-        # This is a fallback, ideally the prompt handles it.
-        if rephrased_query.lower().startswith("rephrased query:"):
-            rephrased_query = rephrased_query.split(":", 1)[1].strip()
-            
-        print(f"✅ LLM rephrased query: \"{rephrased_query}\"")
+    print(f"✅ LLM rephrased query: \"{rephrased_query}\"")
+    return rephrased_query
+
+def should_call_llm(query: str, chat_history: list[dict], use_classifier: bool = USE_QUERY_CLASSIFIER) -> bool:
+    if not use_classifier:
+        return True
+    needed, reason = classify_query(query, chat_history)
+    if needed:
+        print(f"Reframing needed ({reason}).")
+    else:
+        print(f"⏩ Skipping reframing LLM call ({reason}), using the original query: \"{query}\"")
+    return needed
+
+def cached_reframe(cache: ReframeCache | None, query: str, chat_history: list[dict]) -> str | None:
+    if cache is None:
+        return None
+    cached = cache.get(query, chat_history)
+    if cached is not None:
+        print(f"✅ Reframe cache hit, skipping the LLM call: \"{cached}\"")
+    return cached
+
+def reframe_query_with_history(query: str, chat_history: list[dict], use_classifier: bool = USE_QUERY_CLASSIFIER) -> str:
+    if not should_call_llm(query, chat_history, use_classifier):
+        return query
+    cache = get_reframe_cache()
+    cached = cached_reframe(cache, query, chat_history)
+    if cached is not None:
+        return cached
+    prompt_with_values = build_reframe_prompt(query, chat_history)
+    try:
+        rephrased_query = clean_reframe_response(get_llm().invoke(prompt_with_values))
+        if cache is not None:
+            cache.put(query, chat_history, rephrased_query)
         return rephrased_query
     except Exception as e:
         print(f"❌ Error invoking LLM for reframing: {e}")
         print("⚠️ Returning original query due to reframing error.")
         return query
 
+# Same as reframe_query_with_history but doesn't block the event loop while phi3 runs
+async def areframe_query_with_history(query: str, chat_history: list[dict], use_classifier: bool = USE_QUERY_CLASSIFIER) -> str:
+    if not should_call_llm(query, chat_history, use_classifier):
+        return query
+    cache = get_reframe_cache()
+    cached = cached_reframe(cache, query, chat_history)
+    if cached is not None:
+        return cached
+    prompt_with_values = build_reframe_prompt(query, chat_history)
+    try:
+        rephrased_query = clean_reframe_response(await get_llm().ainvoke(prompt_with_values))
+        if cache is not None:
+            cache.put(query, chat_history, rephrased_query)
+        return rephrased_query
+    except Exception as e:
+        print(f"❌ Error invoking LLM for reframing: {e}")
+        print("⚠️ Returning original query due to reframing error.")
+        return query
+
+# Labeled cases for the __main__ run below and for the classifier report in queryClassifier.py.
+# needs_reframing: whether the query depends on the history (what the LLM should decide)
+TEST_CASES = [
+    {
+        "name": "Test Case 1: Query needs context (Follow-up)",
+        "history": [
+            {"role": "user", "content": "How do I get all the service tags for my devices?"},
+            {"role": "assistant", "content": "You can retrieve service tags using the API endpoint /devices/servicetags."}
+        ],
+        "query": "Now, how can I upload them to the new portal?",
+        "expected_partial": "upload service tags to the new portal",
+        "needs_reframing": True
+    },
+    {
+        "name": "Test Case 2: Query is self-contained",
+        "history": [
+            {"role": "user", "content": "What's the weather like today?"},
+            {"role": "assistant", "content": "It's sunny with a high of 75°F."}
+        ],
+        "query": "How do I reset my password for the company portal?",
+        "expected_partial": "How do I reset my password for the company portal?",
+        "needs_reframing": False
+    },
+    {
+        "name": "Test Case 3: RAG-style context (Pronoun)",
+        "history": [
+            {"role": "user", "content": "I'm looking for information on the 'Blue-sky' project."},
+            {"role": "assistant", "content": "The 'Blue-sky' project aims to develop next-generation solar panels. Key documents include the project charter and the Q1 progress report."},
+            {"role": "user", "content": "Where can I find the Q1 progress report?"},
+            {"role": "assistant", "content": "The Q1 progress report for the 'Blue-sky' project is located in the shared drive under /projects/blue-sky/reports/Q1_Progress.pdf."},
+        ],
+        "query": "What are the main risks outlined in it?",
+        "expected_partial": "risks outlined in the Q1 progress report for the 'Blue-sky' project",
+        "needs_reframing": True
+    },
+    {
+        "name": "Test Case 4: Empty history",
+        "history": [],
+        "query": "How to install Python?",
+        "expected_partial": "How to install Python?",
+        "needs_reframing": False
+    },
+    {
+        "name": "Test Case 5: Simple pronoun",
+        "history": [
+            {"role": "user", "content": "The new XZ-500 printer is causing issues."},
+            {"role": "assistant", "content": "Okay, what kind of issues are you seeing with the XZ-500 printer?"}
+        ],
+        "query": "How do I restart it?",
+        "expected_partial": "restart the XZ-500 printer",
+        "needs_reframing": True
+    },
+    {
+        "name": "Test Case 6: Blueprint Scenario (Crucial Test)",
+        "history": [
+            {"role": "user", "content": "How can I upload a new blueprint to the system?"},
+            {"role": "assistant", "content": "You can upload a new blueprint using its ID via a POST request to the /v1/tenants/{Tenant}/blueprints/{BlueprintId} API operation. Ensure all required fields like 'name' and 'description' are correctly filled out before making the request."},
+            {"role": "user", "content": "Thanks, that worked!"} # Added a user confirmation for realism
+        ],
+        "query": "Now how do I delete one?",
+        "expected_partial": "delete an uploaded blueprint", # Or "delete a design blueprint"
+        "needs_reframing": True
+    },
+    {
+        "name": "Test Case 7: Similar to blueprint but different subject",
+        "history": [
+            {"role": "user", "content": "How do I submit a support ticket for a software bug?"},
+            {"role": "assistant", "content": "You can submit a support ticket via our online portal at support.example.com/tickets/new. Please include the software version and steps to reproduce the bug."},
+        ],
+        "query": "And how do I track its status?",
+        "expected_partial": "track the status of a support ticket", # or "track its status for a software bug"
+        "needs_reframing": True
+    },
+    # From the few-shot examples in the prompt
+    {
+        "name": "Test Case 8: Standalone technical query after unrelated history",
+        "history": [
+            {"role": "user", "content": "I was reading about managing blueprints. How do I upload a design blueprint?"},
+            {"role": "assistant", "content": "You can upload a design blueprint using a POST request to the /v1/blueprints endpoint in the system API."}
+        ],
+        "query": "how do I delete a config map?",
+        "expected_partial": "how do I delete a config map?",
+        "needs_reframing": False
+    },
+    {
+        "name": "Test Case 9: General knowledge question",
+        "history": [
+            {"role": "user", "content": "I'm trying to configure the 'DataStreamer v3' application."},
+            {"role": "assistant", "content": "Okay, to configure 'DataStreamer v3', you first need to open its configuration file located at /etc/datastreamer/config.xml."}
+        ],
+        "query": "What is the capital of France?",
+        "expected_partial": "What is the capital of France?",
+        "needs_reframing": False
+    },
+    {
+        "name": "Test Case 10: Implicit subject",
+        "history": [
+            {"role": "user", "content": "How do I get a list of all active user accounts?"},
+            {"role": "assistant", "content": "You can use the `get_active_users()` function in the admin SDK."}
+        ],
+        "query": "Now, how do I disable it?",
+        "expected_partial": "disable an active user account",
+        "needs_reframing": True
+    },
+    {
+        "name": "Test Case 11: Follow-up without a pronoun (parameters)",
+        "history": [
+            {"role": "user", "content": "How do I create a tenant?"},
+            {"role": "assistant", "content": "Send a POST request to /v1/tenants with the tenant name and description in the request body."}
+        ],
+        "query": "What parameters are required?",
+        "expected_partial": "tenant",
+        "needs_reframing": True
+    },
+    {
+        "name": "Test Case 12: Follow-up without a pronoun (response)",
+        "history": [
+            {"role": "user", "content": "How do I create a tenant?"},
+            {"role": "assistant", "content": "Send a POST request to /v1/tenants with the tenant name and description in the request body."}
+        ],
+        "query": "What's the response format?",
+        "expected_partial": "tenant",
+        "needs_reframing": True
+    },
+    {
+        "name": "Test Case 13: Follow-up without a pronoun (curl)",
+        "history": [
+            {"role": "user", "content": "How do I create a tenant?"},
+            {"role": "assistant", "content": "Send a POST request to /v1/tenants with the tenant name and description in the request body."}
+        ],
+        "query": "Can you show the curl command?",
+        "expected_partial": "tenant",
+        "needs_reframing": True
+    },
+    {
+        "name": "Test Case 14: Follow-up without a pronoun (example)",
+        "history": [
+            {"role": "user", "content": "How do I create a tenant?"},
+            {"role": "assistant", "content": "Send a POST request to /v1/tenants with the tenant name and description in the request body."}
+        ],
+        "query": "Give me an example request",
+        "expected_partial": "tenant",
+        "needs_reframing": True
+    }
+]
+
+
 if __name__ == '__main__':
     print("--- Running Test Cases for Query Reframer ---")
 
-    test_cases = [
-        {
-            "name": "Test Case 1: Query needs context (Follow-up)",
-            "history": [
-                {"role": "user", "content": "How do I get all the service tags for my devices?"},
-                {"role": "assistant", "content": "You can retrieve service tags using the API endpoint /devices/servicetags."}
-            ],
-            "query": "Now, how can I upload them to the new portal?",
-            "expected_partial": "upload service tags to the new portal"
-        },
-        {
-            "name": "Test Case 2: Query is self-contained",
-            "history": [
-                {"role": "user", "content": "What's the weather like today?"},
-                {"role": "assistant", "content": "It's sunny with a high of 75°F."}
-            ],
-            "query": "How do I reset my password for the company portal?",
-            "expected_partial": "How do I reset my password for the company portal?"
-        },
-        {
-            "name": "Test Case 3: RAG-style context (Pronoun)",
-            "history": [
-                {"role": "user", "content": "I'm looking for information on the 'Blue-sky' project."},
-                {"role": "assistant", "content": "The 'Blue-sky' project aims to develop next-generation solar panels. Key documents include the project charter and the Q1 progress report."},
-                {"role": "user", "content": "Where can I find the Q1 progress report?"},
-                {"role": "assistant", "content": "The Q1 progress report for the 'Blue-sky' project is located in the shared drive under /projects/blue-sky/reports/Q1_Progress.pdf."},
-            ],
-            "query": "What are the main risks outlined in it?",
-            "expected_partial": "risks outlined in the Q1 progress report for the 'Blue-sky' project"
-        },
-        {
-            "name": "Test Case 4: Empty history",
-            "history": [],
-            "query": "How to install Python?",
-            "expected_partial": "How to install Python?"
-        },
-        {
-            "name": "Test Case 5: Simple pronoun",
-            "history": [
-                {"role": "user", "content": "The new XZ-500 printer is causing issues."},
-                {"role": "assistant", "content": "Okay, what kind of issues are you seeing with the XZ-500 printer?"}
-            ],
-            "query": "How do I restart it?",
-            "expected_partial": "restart the XZ-500 printer"
-        },
-        {
-            "name": "Test Case 6: Blueprint Scenario (Crucial Test)",
-            "history": [
-                {"role": "user", "content": "How can I upload a new blueprint to the system?"},
-                {"role": "assistant", "content": "You can upload a new blueprint using its ID via a POST request to the /v1/tenants/{Tenant}/blueprints/{BlueprintId} API operation. Ensure all required fields like 'name' and 'description' are correctly filled out before making the request."},
-                {"role": "user", "content": "Thanks, that worked!"} # Added a user confirmation for realism
-            ],
-            "query": "Now how do I delete one?",
-            "expected_partial": "delete an uploaded blueprint" # Or "delete a design blueprint"
-        },
-        {
-            "name": "Test Case 7: Similar to blueprint but different subject",
-            "history": [
-                {"role": "user", "content": "How do I submit a support ticket for a software bug?"},
-                {"role": "assistant", "content": "You can submit a support ticket via our online portal at support.example.com/tickets/new. Please include the software version and steps to reproduce the bug."},
-            ],
-            "query": "And how do I track its status?",
-            "expected_partial": "track the status of a support ticket" # or "track its status for a software bug"
-        }
-    ]
-
-    for test in test_cases:
+    for test in TEST_CASES:
         print(f"\n--- {test['name']} ---")
         rephrased = reframe_query_with_history(query=test["query"], chat_history=test["history"])
         print(f"Original: \"{test['query']}\"")
@@ -261,4 +442,7 @@ if __name__ == '__main__':
         else:
             print(f"⚠️ Test Potentially Failed (Expected partial match: '{test['expected_partial']}', Got: '{rephrased}')")
             
-    print("\n--- End of Query Reframer Test Cases ---")
\ No newline at end of file
+    print("\n--- End of Query Reframer Test Cases ---")
+    cache = get_reframe_cache()
+    if cache is not None:
+        cache.print_stats()
@@ -0,0 +1,162 @@
+# resourceManager.py
+
+# Creates the heavy stuff (the LLMs, the embedding model, the vector DB, the indexes, ...) the first time something
+# actually uses it instead of at import time, and only once even if several threads ask for it at the same time.
+# Importing contextModel is then almost free, and a query only waits for the resources it really needs.
+# warm_up() can load everything on a background thread so the first query usually finds it all ready, and
+# status() / print_status() show what's loaded, how long each one took and what failed.
+
+import threading
+import time
+
+# --- Constants ---
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+UNAVAILABLE = "unavailable" # Factory returned None (file missing, turned off in the config, ...)
+FAILED = "failed" # Factory raised, the error is kept in .error
+
+
+class LazyResource:
+
+    def __init__(self, name: str, factory, required: bool = True):
+        self.name = name
+        self.factory = factory
+        self.required = required # Health is only "ok" when every required resource is ready
+        self.state = NOT_LOADED
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.loaded_by = None # Name of the thread that did the loading (warm-up or a request)
+        self.waits = 0 # Callers that had to block while another thread was loading it
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        # Failed and unavailable resources stay None until reset(), same as the old import time globals
+        if self.state not in (NOT_LOADED, LOADING):
+            return self.value
+        start_time = time.perf_counter()
+        with self._lock:
+            if self.state == NOT_LOADED:
+                self._load()
+            else:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - start_time
+        return self.value
+
+    def _load(self):
+        self.state = LOADING
+        self.loaded_by = threading.current_thread().name
+        start_time = time.perf_counter()
+        try:
+            self.value = self.factory()
+            self.state = READY if self.value is not None else UNAVAILABLE
+        except Exception as e:
+            self.value = None
+            self.error = e
+            self.state = FAILED
+            print(f"❌ Failed to initialize {self.name}: {e}")
+        self.load_seconds = time.perf_counter() - start_time
+        print(f"RESOURCES: {self.name} {self.state} after {self.load_seconds:.4f} seconds (thread '{self.loaded_by}').")
+
+    def reset(self):
+        # Next get() runs the factory again (e.g. after Ollama or the DB came back)
+        with self._lock:
+            self.state = NOT_LOADED
+            self.value = None
+            self.error = None
+            self.load_seconds = None
+
+
+class ResourceManager:
+
+    def __init__(self, name: str = "RESOURCES"):
+        self.name = name
+        self._resources = {} # name -> LazyResource, in registration order (also the warm-up order)
+        self._warm_up_thread = None
+        self._warm_up_lock = threading.Lock()
+        self.created_at = time.perf_counter()
+
+    def register(self, name: str, factory, required: bool = True) -> LazyResource:
+        resource = LazyResource(name, factory, required)
+        self._resources[name] = resource
+        return resource
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._resources
+
+    def get(self, name: str):
+        return self._resources[name].get()
+
+    def is_ready(self, name: str) -> bool:
+        return self._resources[name].state == READY
+
+    def reset(self, name: str):
+        self._resources[name].reset()
+
+    def warm_up(self, names: list[str] | None = None, background: bool = True) -> threading.Thread | None:
+        """Loads the given resources (all of them by default) in order. With background=True it runs on a daemon
+        thread and returns right away, queries that need something still loading just wait for that one resource.
+        Calling it again while a warm-up is running doesn't start a second one."""
+        names = list(self._resources) if names is None else names
+
+        def run():
+            start_time = time.perf_counter()
+            for name in names:
+                self.get(name)
+            print(f"✅ {self.name}: Warm-up of {len(names)} resources finished in {time.perf_counter() - start_time:.4f} seconds.")
+
+        if not background:
+            run()
+            return None
+        with self._warm_up_lock:
+            if self._warm_up_thread is not None and self._warm_up_thread.is_alive():
+                return self._warm_up_thread
+            if all(self._resources[name].state != NOT_LOADED for name in names):
+                return None # Nothing left to load
+            self._warm_up_thread = threading.Thread(target=run, name=f"{self.name.lower()}-warm-up", daemon=True)
+            self._warm_up_thread.start()
+            return self._warm_up_thread
+
+    def wait_until_ready(self, timeout: float | None = None) -> bool:
+        # Waits for a running background warm-up, False if it's still going when the timeout runs out
+        thread = self._warm_up_thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def status(self) -> dict:
+        return {
+            name: {
+                "state": resource.state,
+                "required": resource.required,
+                "load_seconds": resource.load_seconds,
+                "loaded_by": resource.loaded_by,
+                "waits": resource.waits,
+                "wait_seconds": resource.wait_seconds,
+                "error": str(resource.error) if resource.error else None,
+            }
+            for name, resource in self._resources.items()
+        }
+
+    def health(self) -> dict:
+        """{"ok": every required resource is ready, "ready", "loading", "not_loaded", "unavailable", "failed"}."""
+        by_state = {state: [] for state in (READY, LOADING, NOT_LOADED, UNAVAILABLE, FAILED)}
+        for name, resource in self._resources.items():
+            by_state[resource.state].append(name)
+        ok = all(resource.state == READY for resource in self._resources.values() if resource.required)
+        return {"ok": ok, **by_state,
+                "warming_up": self._warm_up_thread is not None and self._warm_up_thread.is_alive(),
+                "uptime_seconds": time.perf_counter() - self.created_at}
+
+    def print_status(self):
+        health = self.health()
+        print(f"{self.name}: {'healthy' if health['ok'] else 'not ready'}"
+              f"{' (warm-up running)' if health['warming_up'] else ''}, up {health['uptime_seconds']:.1f} seconds.")
+        for name, info in self.status().items():
+            timing = f"{info['load_seconds']:.4f}s" if info["load_seconds"] is not None else "-"
+            waited = f", {info['waits']} waits ({info['wait_seconds']:.4f}s)" if info["waits"] else ""
+            error = f", error: {info['error']}" if info["error"] else ""
+            print(f"  {name:<20} {info['state']:<12} {timing:>10}{waited}{error}")
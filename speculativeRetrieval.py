@@ -0,0 +1,131 @@
+# speculativeRetrieval.py
+
+# Starts retrieval (embedding, search, context assembly) for the user's original query on a background thread while the
+# query is being reframed, instead of waiting for phi3 first. Most queries come back from the reframer unchanged (the
+# prompt tells it to leave standalone questions alone), and then the retrieval is already done or halfway done when the
+# reframed query arrives. If the reframer did change the query the speculative result is thrown away and retrieval runs
+# again for the new query, which costs the same as not speculating (plus the CPU the discarded work used).
+# SPECULATION_STATS keeps the hit rate and the time to first token saved.
+# Try it on the reframer's test chats: python speculativeRetrieval.py
+
+import argparse
+import threading
+import time
+import contextModel
+from queryClassifier import same_query
+
+# --- Constants ---
+USE_SPECULATIVE_RETRIEVAL = True
+
+
+class SpeculationStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.saved_seconds = 0.0 # Retrieval time that overlapped with reframing on hits
+        self.wasted_seconds = 0.0 # Retrieval time spent on speculative results that got thrown away
+
+    def record(self, outcome: str, saved_seconds: float = 0.0, wasted_seconds: float = 0.0):
+        with self._lock:
+            self.attempts += 1
+            if outcome == "hit":
+                self.hits += 1
+            elif outcome == "miss":
+                self.misses += 1
+            else:
+                self.errors += 1
+            self.saved_seconds += saved_seconds
+            self.wasted_seconds += wasted_seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": self.hits / self.attempts if self.attempts else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "avg_saved_per_hit": self.saved_seconds / self.hits if self.hits else 0.0,
+                "wasted_seconds": self.wasted_seconds,
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"SPECULATION: {stats['hits']}/{stats['attempts']} hits (hit rate {stats['hit_rate']:.1%}), {stats['misses']} misses, "
+              f"{stats['errors']} errors. Time to first token saved: {stats['saved_seconds']:.2f} seconds total, "
+              f"{stats['avg_saved_per_hit']:.2f} per hit. Discarded retrieval work: {stats['wasted_seconds']:.2f} seconds.")
+
+
+SPECULATION_STATS = SpeculationStats()
+
+
+class SpeculativeRetrieval:
+    """Create it before reframing (retrieval for query_text starts right away), call resolve() with the final query
+    after. resolve() returns the build_rag_context result to pass to contextModel.single_query(..., rag_context=...)."""
+
+    def __init__(self, query_text: str, use_formatted_data: bool = False, k_val: int = 4, stats: SpeculationStats = SPECULATION_STATS):
+        self.query_text = query_text
+        self.use_formatted_data = use_formatted_data
+        self.k_val = k_val
+        self.stats = stats
+        self.retrieval_seconds = None
+        self.started_at = time.time()
+        print(f"SPECULATION: Starting retrieval for the original query '{query_text}' while it gets reframed...")
+        self.future = contextModel.RETRIEVAL_EXECUTOR.submit(self._retrieve)
+
+    def _retrieve(self) -> dict:
+        start_time = time.time()
+        try:
+            return contextModel.build_rag_context(self.query_text, self.use_formatted_data, self.k_val)
+        finally:
+            self.retrieval_seconds = time.time() - start_time
+
+    def resolve(self, final_query: str) -> dict:
+        reframe_seconds = time.time() - self.started_at
+        if not same_query(final_query, self.query_text):
+            # Cancel it if it's still queued, otherwise let it finish in the background and ignore it
+            self.future.cancel()
+            wasted = self.retrieval_seconds if self.retrieval_seconds is not None else reframe_seconds
+            print(f"SPECULATION: Miss, query was reframed to '{final_query}'. Discarding the speculative retrieval and retrieving again.")
+            self.stats.record("miss", wasted_seconds=wasted)
+            return contextModel.build_rag_context(final_query, self.use_formatted_data, self.k_val)
+
+        start_time_wait = time.time()
+        try:
+            rag_context = self.future.result()
+        except Exception as e:
+            print(f"❌ SPECULATION: Speculative retrieval failed ({e}), retrieving again.")
+            self.stats.record("error")
+            return contextModel.build_rag_context(final_query, self.use_formatted_data, self.k_val)
+        waited = time.time() - start_time_wait
+        # Without speculation all of the retrieval would have come after reframing, now only the part we waited for did
+        saved = max(0.0, self.retrieval_seconds - waited)
+        print(f"✅ SPECULATION: Hit, reframing took {reframe_seconds:.4f} seconds and retrieval {self.retrieval_seconds:.4f} seconds, "
+              f"waited {waited:.4f} seconds for it ({saved:.4f} seconds saved).")
+        self.stats.record("hit", saved_seconds=saved)
+        return rag_context
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speculative retrieval on the reframer's test chats: hit rate and time saved.")
+    parser.add_argument("--no-classifier", action="store_true", help="Always call the reframing LLM, even for standalone queries.")
+    args = parser.parse_args()
+
+    from reframeQuery import TEST_CASES, reframe_query_with_history
+    for test in TEST_CASES:
+        print(f"\n--- {test['name']} ---")
+        speculation = SpeculativeRetrieval(test["query"])
+        final_query = reframe_query_with_history(test["query"], test["history"], use_classifier=not args.no_classifier)
+        rag_context = speculation.resolve(final_query)
+        print(f"Final query: '{final_query}', sources: {rag_context['sources']}")
+    print()
+    SPECULATION_STATS.print_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# streamingIngest.py
+
+# Streaming version of the ingestion in embeddingsMain.py, meant for when the formatted json gets big.
+# Instead of json.load-ing the whole file and splitting every document up front, entries are read one at a time
+# and pushed through three stages that run at the same time, connected by bounded queues:
+#   chunker thread  -> reads entries, splits them, hashes the chunks and skips ones that haven't changed
+#   embedder thread -> embeds batches of chunks
+#   main thread     -> writes the vectors into Chroma
+# The queues are bounded so a slow stage makes the others wait instead of buffering the whole corpus in memory.
+
+import argparse
+import json
+import queue
+import threading
+import time
+from langchain_chroma import Chroma
+from langchain.schema.document import Document
+from embeddingsMain import (
+    CHROMADATAPATH,
+    CHROMA_ADD_BATCH_SIZE,
+    INPUT_JSON_PATH,
+    calculate_chunk_ids,
+    embed_with_token_batches,
+    get_embed_function,
+    get_index_version,
+    chunk_document,
+    get_section_splitter,
+    get_text_splitter,
+    get_tokenizer,
+    hash_chunk,
+    load_or_rebuild_manifest,
+    save_manifest,
+    upsert_embedded_chunks,
+)
+from lexicalIndex import build_lexical_index
+from parallelIngest import get_peak_rss_mb
+
+# --- Constants ---
+READ_SIZE = 1 << 16 # How many characters to read from the json file at a time
+QUEUE_DEPTH = 4 # Max number of batches waiting between two stages
+_END = object() # Sentinel that tells the next stage there's nothing left
+_NUMBER_CHARS = set("0123456789+-.eE") # What a json number can still continue with
+
+
+def iter_json_object_items(path: str, read_size: int = READ_SIZE):
+    """Yields (key, value) pairs from a json file holding one big object, without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def read_more():
+            nonlocal buffer, pos, eof
+            data = f.read(read_size)
+            if not data:
+                eof = True
+            buffer = buffer[pos:] + data # Drop everything we've already parsed
+            pos = 0
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                read_more()
+
+        def decode_value():
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A number near the end of the buffer might keep going in the next read: "1" of "1.5" or "2" of "2e3"
+                    # decode fine, so read more while only number characters are left after it
+                    tail = end
+                    while tail < len(buffer) and buffer[tail] in _NUMBER_CHARS:
+                        tail += 1
+                    if tail < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                read_more()
+
+        def expect(char: str):
+            nonlocal pos
+            skip_whitespace()
+            if pos >= len(buffer) or buffer[pos] != char:
+                found = buffer[pos] if pos < len(buffer) else "end of file"
+                raise ValueError(f"Expected '{char}' in {path} but found {found!r}")
+            pos += 1
+
+        expect("{")
+        first = True
+        while True:
+            skip_whitespace()
+            if pos < len(buffer) and buffer[pos] == "}":
+                return
+            if not first:
+                expect(",")
+                skip_whitespace()
+            first = False
+            key = decode_value()
+            expect(":")
+            skip_whitespace()
+            yield key, decode_value()
+
+
+def check_json_reader(read_sizes=(1, 2, 3, 5, 8, 13, READ_SIZE)) -> bool:
+    """Reads a small tricky json file with different read sizes (so reads split numbers, strings and literals at every
+    spot) and compares with json.load."""
+    import os
+    import tempfile
+    sample = {"a": 1.5, "b": 2e3, "c": -0.25e-2, "d": 10, "e": "text with \"quotes\" and , : { }", "f": True, "g": None,
+              "h": [1, 2.5, {"x": 3E+2}], "i": "ünïcode", "j": 12345678901234567890}
+    fd, path = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(sample, f, indent=1, ensure_ascii=False)
+        ok = True
+        for read_size in read_sizes:
+            try:
+                items = dict(iter_json_object_items(path, read_size))
+            except ValueError as e:
+                items = e
+            if items != sample:
+                print(f"❌ JSON reader: read_size={read_size} gave {items!r}")
+                ok = False
+        if ok:
+            print(f"✅ JSON reader: same result as json.load for read sizes {list(read_sizes)}.")
+        return ok
+    finally:
+        os.remove(path)
+
+
+def streaming_sync_to_chroma(input_json_path: str = INPUT_JSON_PATH, batch_size: int = CHROMA_ADD_BATCH_SIZE, queue_depth: int = QUEUE_DEPTH):
+    embedder = get_embed_function()
+    db = Chroma(persist_directory=CHROMADATAPATH, embedding_function=embedder)
+    old_sources = load_or_rebuild_manifest(db)["sources"]
+
+    chunk_queue = queue.Queue(maxsize=queue_depth)
+    write_queue = queue.Queue(maxsize=queue_depth)
+    new_manifest_sources = {}
+    failed_ids = []
+    errors = []
+    stats = {"entries": 0, "chunks": 0, "unchanged": 0, "embedded": 0, "chunker_seconds": 0.0, "embedder_seconds": 0.0, "writer_seconds": 0.0}
+
+    def put(target: queue.Queue, item):
+        # Keep trying so a stage blocked on a full queue still notices when another stage has died
+        while not errors:
+            try:
+                target.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def chunker():
+        splitter = get_text_splitter()
+        section_splitter = get_section_splitter()
+        batch = []
+        try:
+            for link, text_content in iter_json_object_items(input_json_path):
+                start_time = time.time()
+                stats["entries"] += 1
+                if not isinstance(text_content, str):
+                    print(f"Warning: Skipping entry '{link}' because its value is not a string ({type(text_content)}).")
+                    continue
+                # One document at a time, so ids are positional within this source just like calculate_chunk_ids does it
+                chunks = calculate_chunk_ids(chunk_document(Document(page_content=text_content, metadata={"source": link}), splitter, section_splitter))
+                hashes = [hash_chunk(chunk) for chunk in chunks]
+                old_hashes = old_sources.get(link, [])
+                new_manifest_sources[link] = hashes
+                stats["chunks"] += len(chunks)
+                for index, (chunk, chunk_hash) in enumerate(zip(chunks, hashes)):
+                    if index < len(old_hashes) and old_hashes[index] == chunk_hash:
+                        stats["unchanged"] += 1
+                        continue
+                    batch.append(chunk)
+                stats["chunker_seconds"] += time.time() - start_time
+                while len(batch) >= batch_size:
+                    if not put(chunk_queue, batch[:batch_size]):
+                        return
+                    batch = batch[batch_size:]
+            if batch:
+                put(chunk_queue, batch)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if not errors:
+                put(chunk_queue, _END)
+
+    def embedding_worker():
+        tokenizer = get_tokenizer(embedder)
+        try:
+            while not errors:
+                try:
+                    batch = chunk_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if batch is _END:
+                    break
+                start_time = time.time()
+                vectors = embed_with_token_batches(embedder, [chunk.page_content for chunk in batch], tokenizer)
+                # Leave out chunks whose sub-batch failed (they get blanked in the manifest so the next run retries them)
+                failed_ids.extend(chunk.metadata["id"] for chunk, vector in zip(batch, vectors) if vector is None)
+                embedded = [(chunk, vector) for chunk, vector in zip(batch, vectors) if vector is not None]
+                batch, vectors = [chunk for chunk, _ in embedded], [vector for _, vector in embedded]
+                stats["embedder_seconds"] += time.time() - start_time
+                if not put(write_queue, (batch, vectors)):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if not errors:
+                put(write_queue, _END)
+
+    print(f"STREAMING_INGEST: Streaming entries from {input_json_path} (batch size {batch_size}, queue depth {queue_depth})...")
+    start_time_total = time.time()
+    threads = [threading.Thread(target=chunker, name="chunker", daemon=True),
+               threading.Thread(target=embedding_worker, name="embedder", daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    # The main thread is the single writer
+    while not errors:
+        try:
+            item = write_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if item is _END:
+            break
+        batch, vectors = item
+        start_time = time.time()
+        try:
+            upsert_embedded_chunks(db, batch, vectors)
+            stats["embedded"] += len(batch)
+        except Exception as e:
+            print(f"\nError writing batch starting at {batch[0].metadata.get('id')} to ChromaDB: {e}")
+            failed_ids.extend(chunk.metadata["id"] for chunk in batch)
+        stats["writer_seconds"] += time.time() - start_time
+        print(f"\rSTREAMING_INGEST: {stats['entries']} entries read, {stats['embedded']} chunks embedded, {stats['unchanged']} unchanged", end="", flush=True)
+    print()
+
+    for thread in threads:
+        thread.join(timeout=5)
+    if errors:
+        # Don't touch the manifest or delete anything, the next run will pick up where this one stopped
+        print(f"❌ STREAMING_INGEST: Pipeline stopped with an error: {errors[0]}")
+        raise errors[0]
+
+    # Stale ids: sources that got shorter or disappeared
+    stale_ids = []
+    for source, old_hashes in old_sources.items():
+        new_length = len(new_manifest_sources.get(source, []))
+        stale_ids.extend(f"{source}:{i}" for i in range(new_length, len(old_hashes)))
+    for i in range(0, len(stale_ids), batch_size):
+        db.delete(ids=stale_ids[i:i + batch_size])
+
+    # Blank out anything that failed so its hash never matches and the next run embeds it again
+    for chunk_id in failed_ids:
+        source, _, index = chunk_id.rpartition(":")
+        new_manifest_sources[source][int(index)] = ""
+    if failed_ids:
+        print(f"⚠️ STREAMING_INGEST: {len(failed_ids)} chunks failed and will be retried on the next run.")
+
+    save_manifest({"sources": new_manifest_sources}, changed=bool(stats["embedded"] or stale_ids), embedder=embedder)
+    elapsed = time.time() - start_time_total
+    peak_rss_mb = get_peak_rss_mb()
+    print(f"✅ STREAMING_INGEST: {stats['entries']} entries, {stats['chunks']} chunks ({stats['embedded']} embedded, "
+          f"{stats['unchanged']} unchanged, {len(stale_ids)} stale removed) in {elapsed:.1f} seconds.")
+    print(f"STREAMING_INGEST: Busy time - chunker {stats['chunker_seconds']:.1f}s, embedder {stats['embedder_seconds']:.1f}s, "
+          f"writer {stats['writer_seconds']:.1f}s. Peak RSS: {f'{peak_rss_mb:.0f} MB' if peak_rss_mb is not None else 'n/a'}")
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the formatted documentation json into Chroma with bounded memory.")
+    parser.add_argument("--input", type=str, default=INPUT_JSON_PATH, help="Path to the formatted data json.")
+    parser.add_argument("--batch-size", type=int, default=CHROMA_ADD_BATCH_SIZE, help="Chunks per embedding batch.")
+    parser.add_argument("--queue-depth", type=int, default=QUEUE_DEPTH, help="Max batches buffered between stages.")
+    parser.add_argument("--check-reader", action="store_true", help="Only check the streaming json reader against json.load and exit.")
+    args = parser.parse_args()
+    if args.check_reader:
+        raise SystemExit(0 if check_json_reader() else 1)
+    db = streaming_sync_to_chroma(args.input, args.batch_size, args.queue_depth)
+    build_lexical_index(db, index_version=get_index_version())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# tokenCounting.py
+
+# Token counts with the real tokenizer of the Ollama model that will read the text, so prompt budgets mean what
+# they say. Tokenizers are loaded once per model and shared. If transformers or the tokenizer files aren't
+# available, it falls back to the usual ~4 characters per token estimate.
+
+import threading
+
+# Ollama model name -> Hugging Face repo with the same tokenizer
+OLLAMA_TOKENIZERS = {
+    "qwen2.5:14b": "Qwen/Qwen2.5-14B-Instruct",
+    "qwen2.5:14b-instruct-q4_K_M": "Qwen/Qwen2.5-14B-Instruct",
+    "qwen2.5:14b-instruct-q4_K_S": "Qwen/Qwen2.5-14B-Instruct",
+    "phi3:mini": "microsoft/Phi-3-mini-4k-instruct",
+}
+CHARS_PER_TOKEN = 4 # Fallback estimate
+
+_TOKENIZERS = {} # model name -> tokenizer, or None if it couldn't be loaded
+_TOKENIZERS_LOCK = threading.Lock()
+
+
+def get_llm_tokenizer(model: str):
+    with _TOKENIZERS_LOCK:
+        if model not in _TOKENIZERS:
+            repo = OLLAMA_TOKENIZERS.get(model, model)
+            try:
+                from transformers import AutoTokenizer
+                _TOKENIZERS[model] = AutoTokenizer.from_pretrained(repo)
+            except Exception as e:
+                print(f"Warning: Could not load the tokenizer for {model} ({repo}), estimating tokens from characters: {e}")
+                _TOKENIZERS[model] = None
+        return _TOKENIZERS[model]
+
+
+def count_tokens(text: str, model: str | None = None, tokenizer=None) -> int:
+    if tokenizer is None and model is not None:
+        tokenizer = get_llm_tokenizer(model)
+    if tokenizer is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def count_tokens_batch(texts: list[str], model: str | None = None, tokenizer=None) -> list[int]:
+    if tokenizer is None and model is not None:
+        tokenizer = get_llm_tokenizer(model)
+    if tokenizer is None:
+        return [(len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN for text in texts]
+    if not texts:
+        return []
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str | None = None, tokenizer=None) -> str:
+    # Keeps the start of text, at most max_tokens of it
+    if max_tokens <= 0:
+        return ""
+    if tokenizer is None and model is not None:
+        tokenizer = get_llm_tokenizer(model)
+    if tokenizer is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    if len(ids) <= max_tokens:
+        return text
+    return tokenizer.decode(ids[:max_tokens])
@@ -0,0 +1,351 @@
+# vectorEngine.py
+
+# In-process alternative to Chroma for retrieval. Our corpus is only a few thousand chunks, so one contiguous
+# matrix and a vectorized dot product beats going through HNSW + sqlite for every query.
+# The index is exported from the Chroma db once (python vectorEngine.py build) and then loaded memory-mapped.
+# With --quantization int8/binary only the small codes are kept in RAM for the first pass, and the full precision
+# vectors stay on disk (memory-mapped) and are only read to re-score the shortlist.
+# NumpyVectorStore has the same methods get_contextual_chunks uses on Chroma, so it can be swapped in directly.
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+from langchain.schema.document import Document
+
+# --- Constants ---
+VECTOR_INDEX_PATH = 'vectorIndex'
+SCAN_BLOCK_ROWS = 4096 # float16/int8 rows get converted to float32 this many at a time while scanning
+RERANK_FACTOR = {"int8": 10, "binary": 40} # Shortlist size is k * this, then re-scored with the full vectors
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8) # Bits set in each byte value
+
+DEFAULT_BENCH_QUERIES = [
+    "How do I create a token?",
+    "How do I delete a blueprint?",
+    "How do I onboard a compute server?",
+    "How do I update the firmware on a server?",
+    "What parameters does the GET tenants operation take?",
+    "How do I apply a hardware profile?",
+    "What does a 404 response mean for the blueprints API?",
+    "How do I make an API call?",
+]
+
+
+def split_chunk_id(chunk_id: str) -> tuple[str, int]:
+    # Same as contextModel.parse_chunk_id but without the regex, ids are always "source:index"
+    source, _, index = chunk_id.rpartition(":")
+    return (source, int(index)) if index.isdigit() else (chunk_id, -1)
+
+
+def build_vector_index(db, index_dir: str = VECTOR_INDEX_PATH, dtype: str = "float32", index_version: int | None = None, quantization: str | None = None):
+    if quantization:
+        dtype = "float32" # The on-disk vectors are what the shortlist gets re-scored with, keep them exact
+    print(f"VECTOR_ENGINE: Exporting vectors from Chroma into {index_dir} ({dtype}{', ' + quantization + ' codes' if quantization else ''})...")
+    start_time = time.time()
+    data = db.get(include=["embeddings", "documents", "metadatas"])
+    ids = list(data["ids"])
+    if not ids:
+        print("❌ VECTOR_ENGINE: The Chroma DB is empty, nothing to export.")
+        return None
+
+    # Rows are stored in document order (source, then chunk index) so neighbors are next to each other
+    order = sorted(range(len(ids)), key=lambda i: split_chunk_id(ids[i]))
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)[order]
+    documents = [data["documents"][i] or "" for i in order]
+    metadatas = [data["metadatas"][i] or {} for i in order]
+    ids = [ids[i] for i in order]
+
+    os.makedirs(index_dir, exist_ok=True)
+    stored = vectors.astype(dtype)
+    np.save(os.path.join(index_dir, "vectors.npy"), stored)
+    # Norms of the stored (possibly float16) vectors, so distances are consistent with what gets scanned
+    stored_f32 = stored.astype(np.float32)
+    np.save(os.path.join(index_dir, "norms_sq.npy"), np.einsum("ij,ij->i", stored_f32, stored_f32))
+
+    # All chunk texts in one utf-8 blob plus offsets, so they can be memory-mapped too
+    encoded = [text.encode("utf-8") for text in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(blob) for blob in encoded])
+    with open(os.path.join(index_dir, "texts.bin"), "wb") as f:
+        for blob in encoded:
+            f.write(blob)
+    np.save(os.path.join(index_dir, "text_offsets.npy"), offsets)
+
+    if quantization == "int8":
+        # Per-dimension scalar quantization: x ~= offset + scale * (code + 128)
+        low = vectors.min(axis=0)
+        scale = np.maximum(vectors.max(axis=0) - low, 1e-12) / 255
+        codes = (np.round((vectors - low) / scale) - 128).astype(np.int8)
+        np.save(os.path.join(index_dir, "codes_int8.npy"), codes)
+        np.save(os.path.join(index_dir, "int8_offset.npy"), low.astype(np.float32))
+        np.save(os.path.join(index_dir, "int8_scale.npy"), scale.astype(np.float32))
+    elif quantization == "binary":
+        # One bit per dimension: which side of the corpus mean each value is on
+        mean = vectors.mean(axis=0)
+        np.save(os.path.join(index_dir, "codes_binary.npy"), np.packbits(vectors > mean, axis=1))
+        np.save(os.path.join(index_dir, "binary_mean.npy"), mean.astype(np.float32))
+    elif quantization:
+        raise ValueError(f"Unknown quantization '{quantization}', expected 'int8' or 'binary'.")
+
+    meta = {"ids": ids, "metadatas": metadatas, "dim": int(vectors.shape[1]), "dtype": dtype, "metric": "l2", "index_version": index_version, "quantization": quantization}
+    with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    print(f"✅ VECTOR_ENGINE: Exported {len(ids)} vectors (dim {vectors.shape[1]}) in {time.time() - start_time:.2f} seconds.")
+    return index_dir
+
+
+class NumpyVectorStore:
+
+    def __init__(self, index_dir: str = VECTOR_INDEX_PATH, embedding_function=None):
+        self.index_dir = index_dir
+        self.embedding_function = embedding_function
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self.metadatas = meta["metadatas"]
+        self.index_version = meta.get("index_version")
+        self.row_by_id = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        self.norms_sq = np.load(os.path.join(index_dir, "norms_sq.npy"))
+
+        # The codes are the only part of the vectors that's actually loaded into memory
+        self.quantization = meta.get("quantization")
+        self.codes = None
+        if self.quantization == "int8":
+            self.codes = np.load(os.path.join(index_dir, "codes_int8.npy"))
+            self._int8_offset = np.load(os.path.join(index_dir, "int8_offset.npy"))
+            self._int8_scale = np.load(os.path.join(index_dir, "int8_scale.npy"))
+        elif self.quantization == "binary":
+            self.codes = np.load(os.path.join(index_dir, "codes_binary.npy"))
+            self._binary_mean = np.load(os.path.join(index_dir, "binary_mean.npy"))
+        self._text_offsets = np.load(os.path.join(index_dir, "text_offsets.npy"))
+        texts_path = os.path.join(index_dir, "texts.bin")
+        # np.memmap can't map an empty file
+        self._text_bytes = np.memmap(texts_path, dtype=np.uint8, mode="r") if os.path.getsize(texts_path) else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def text(self, row: int) -> str:
+        return bytes(self._text_bytes[self._text_offsets[row]:self._text_offsets[row + 1]]).decode("utf-8")
+
+    def document(self, row: int) -> Document:
+        return Document(page_content=self.text(row), metadata=dict(self.metadatas[row]))
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        # q . x for every row, done in blocks for float16 since numpy has no fast float16 matmul
+        if self.vectors.dtype == np.float32:
+            return queries @ self.vectors.T
+        scores = np.empty((queries.shape[0], len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), SCAN_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+    def resident_bytes(self) -> int:
+        # What the first-pass scan keeps in RAM (the mmapped full vectors only get paged in as they're read)
+        if self.codes is not None:
+            return self.codes.nbytes + self.norms_sq.nbytes
+        return self.vectors.nbytes + self.norms_sq.nbytes
+
+    def _approx_distances(self, queries: np.ndarray) -> np.ndarray:
+        # Lower is better for both, but only the ranking matters since the shortlist gets re-scored exactly
+        if self.quantization == "int8":
+            scaled_queries = queries * self._int8_scale
+            constant = queries @ (self._int8_offset + 128 * self._int8_scale)
+            dots = np.empty((queries.shape[0], len(self.ids)), dtype=np.float32)
+            for start in range(0, len(self.ids), SCAN_BLOCK_ROWS):
+                block = self.codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+                dots[:, start:start + len(block)] = scaled_queries @ block.T
+            return self.norms_sq[None, :] - 2 * (dots + constant[:, None])
+        # binary: hamming distance between the packed bit codes
+        query_codes = np.packbits(queries > self._binary_mean, axis=1)
+        distances = np.empty((queries.shape[0], len(self.ids)), dtype=np.int32)
+        for i, query_code in enumerate(query_codes):
+            distances[i] = POPCOUNT[np.bitwise_xor(self.codes, query_code)].sum(axis=1, dtype=np.int32)
+        return distances
+
+    @staticmethod
+    def _top_k(distances: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_distances, order, axis=1)
+
+    def search_vectors_exact(self, queries, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Exact top-k over the full precision vectors. Returns (rows, distances), both shaped (num_queries, k)."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        # Squared L2, same distance Chroma reports: |q|^2 + |x|^2 - 2 q.x
+        distances = self.norms_sq[None, :] - 2 * self._scores(queries)
+        distances += np.einsum("ij,ij->i", queries, queries)[:, None]
+        return self._top_k(distances, k)
+
+    def search_vectors(self, queries, k: int, rerank: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k for a batch of query vectors. Uses the quantized codes for a first pass when the index has them."""
+        if self.codes is None:
+            return self.search_vectors_exact(queries, k)
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        approx = self._approx_distances(queries)
+        if not rerank:
+            return self._top_k(approx, k)
+
+        shortlist_size = min(len(self.ids), k * RERANK_FACTOR[self.quantization])
+        shortlist, _ = self._top_k(approx, shortlist_size)
+        rows = np.empty((len(queries), k), dtype=np.int64)
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        for i, (query, candidates) in enumerate(zip(queries, shortlist)):
+            # Only the shortlisted rows get read from the memory-mapped full precision vectors
+            candidate_vectors = np.asarray(self.vectors[np.sort(candidates)], dtype=np.float32)
+            exact = np.einsum("ij,ij->i", candidate_vectors - query, candidate_vectors - query)
+            best = np.argsort(exact)[:k]
+            rows[i] = np.sort(candidates)[best]
+            distances[i] = exact[best]
+        return rows, distances
+
+    # --- Same interface as the Chroma methods contextModel uses ---
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k: int = 4) -> list[tuple[Document, float]]:
+        rows, distances = self.search_vectors(embedding, k)
+        return [(self.document(int(row)), float(distance)) for row, distance in zip(rows[0], distances[0])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        if self.embedding_function is None:
+            raise ValueError("NumpyVectorStore needs an embedding_function to search by text.")
+        return self.similarity_search_by_vector_with_relevance_scores(self.embedding_function.embed_query(query), k)
+
+    def get(self, ids: list[str] | None = None, include: list[str] | None = None) -> dict:
+        include = include if include is not None else ["documents", "metadatas"]
+        rows = range(len(self.ids)) if ids is None else [self.row_by_id[chunk_id] for chunk_id in ids if chunk_id in self.row_by_id]
+        result = {"ids": [self.ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self.text(row) for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [dict(self.metadatas[row]) for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self.vectors[list(rows)], dtype=np.float32)
+        return result
+
+
+# --- Benchmark against the Chroma path ---
+def neighbor_ids(hit_ids: list[str], window: int) -> list[str]:
+    wanted = set()
+    for chunk_id in hit_ids:
+        source, index = split_chunk_id(chunk_id)
+        for offset in range(-window, window + 1):
+            if index + offset >= 0:
+                wanted.add(f"{source}:{index + offset}")
+    return list(wanted)
+
+
+def benchmark(chroma_db, numpy_store: NumpyVectorStore, queries: list[str], k: int = 4, window: int = 4, repeats: int = 5):
+    embedder = chroma_db.embeddings
+    print(f"VECTOR_ENGINE: Embedding {len(queries)} benchmark queries...")
+    query_vectors = [embedder.embed_query(query) for query in queries]
+
+    timings = {"chroma_search": [], "chroma_get": [], "numpy_search": [], "numpy_get": []}
+    recall_total = 0.0
+    for query_vector in query_vectors:
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            chroma_hits = chroma_db.similarity_search_by_vector_with_relevance_scores(query_vector, k=k)
+            timings["chroma_search"].append(time.perf_counter() - start_time)
+            chroma_ids = [doc.metadata.get("id") for doc, _ in chroma_hits]
+            start_time = time.perf_counter()
+            chroma_db.get(ids=neighbor_ids(chroma_ids, window), include=["documents", "metadatas"])
+            timings["chroma_get"].append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            numpy_hits = numpy_store.similarity_search_by_vector_with_relevance_scores(query_vector, k=k)
+            timings["numpy_search"].append(time.perf_counter() - start_time)
+            numpy_ids = [doc.metadata.get("id") for doc, _ in numpy_hits]
+            start_time = time.perf_counter()
+            numpy_store.get(ids=neighbor_ids(numpy_ids, window), include=["documents", "metadatas"])
+            timings["numpy_get"].append(time.perf_counter() - start_time)
+        # The numpy scan is exact, so this is how much HNSW and the exact results agree
+        recall_total += len(set(chroma_ids) & set(numpy_ids)) / max(1, len(numpy_ids))
+
+    def ms(values, pct):
+        return float(np.percentile(values, pct)) * 1000
+
+    print("\n" + "-" * 60)
+    print(f"{'step':<16} {'p50 ms':>10} {'p95 ms':>10}")
+    for name, values in timings.items():
+        print(f"{name:<16} {ms(values, 50):>10.3f} {ms(values, 95):>10.3f}")
+    chroma_total = ms(timings["chroma_search"], 50) + ms(timings["chroma_get"], 50)
+    numpy_total = ms(timings["numpy_search"], 50) + ms(timings["numpy_get"], 50)
+    print("-" * 60)
+    print(f"p50 search + neighbor fetch: chroma {chroma_total:.3f} ms, numpy {numpy_total:.3f} ms")
+    print(f"recall@{k} of Chroma (HNSW) against the exact numpy results: {recall_total / len(query_vectors):.3f}")
+
+
+# How much of the exact full-precision top k the quantized search finds, with and without re-scoring
+def recall_report(numpy_store: NumpyVectorStore, query_vectors, k: int = 4, repeats: int = 5):
+    if numpy_store.codes is None:
+        print("❌ VECTOR_ENGINE: This index has no quantized codes, build it with --quantization int8 or binary.")
+        return
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    exact_rows, _ = numpy_store.search_vectors_exact(query_vectors, k)
+
+    print("\n" + "-" * 60)
+    print(f"{'mode':<24} {f'recall@{k}':>10} {'p50 ms':>10}")
+    for name, search in [("exact float32", lambda q: numpy_store.search_vectors_exact(q, k)),
+                         (f"{numpy_store.quantization} codes only", lambda q: numpy_store.search_vectors(q, k, rerank=False)),
+                         (f"{numpy_store.quantization} + re-score", lambda q: numpy_store.search_vectors(q, k))]:
+        timings = []
+        recall_total = 0.0
+        for query_vector, expected in zip(query_vectors, exact_rows):
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                rows, _ = search(query_vector)
+                timings.append(time.perf_counter() - start_time)
+            recall_total += len(set(rows[0].tolist()) & set(expected.tolist())) / max(1, len(expected))
+        print(f"{name:<24} {recall_total / len(query_vectors):>10.3f} {float(np.percentile(timings, 50)) * 1000:>10.3f}")
+    print("-" * 60)
+    full_bytes = numpy_store.vectors.shape[0] * numpy_store.vectors.shape[1] * 4
+    print(f"Resident index: {numpy_store.resident_bytes() / 1e6:.2f} MB vs {full_bytes / 1e6:.2f} MB for float32 "
+          f"({full_bytes / numpy_store.resident_bytes():.1f}x smaller)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or benchmark the in-process numpy vector index.")
+    parser.add_argument("command", choices=["build", "bench", "recall"], help="build: export from Chroma, bench: compare against Chroma, recall: quantized vs exact recall.")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32", help="Storage precision for the vectors.")
+    parser.add_argument("--quantization", choices=["int8", "binary"], default=None, help="Also store quantized codes for a first-pass search.")
+    parser.add_argument("--k", type=int, default=4, help="Top k for the benchmark.")
+    parser.add_argument("--window", type=int, default=4, help="Neighbor window for the benchmark's fetch step.")
+    parser.add_argument("--queries", type=str, default=None, help="Text file with one benchmark query per line.")
+    args = parser.parse_args()
+
+    # Imported here so loading the store doesn't drag in torch and the embedding model
+    from langchain_chroma import Chroma
+    from embeddingsMain import CHROMADATAPATH, get_embed_function, get_index_version
+
+    chroma_db = Chroma(persist_directory=CHROMADATAPATH, embedding_function=get_embed_function())
+    if args.command == "build":
+        build_vector_index(chroma_db, dtype=args.dtype, index_version=get_index_version(), quantization=args.quantization)
+        return
+
+    queries = DEFAULT_BENCH_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    numpy_store = NumpyVectorStore(embedding_function=chroma_db.embeddings)
+    if args.command == "recall":
+        recall_report(numpy_store, [chroma_db.embeddings.embed_query(query) for query in queries], k=args.k)
+        return
+    benchmark(chroma_db, numpy_store, queries, k=args.k, window=args.window)
+
+
+if __name__ == "__main__":
+    main()